@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+
+"""
+域名选择基准：在本地启动多个模拟镜像域名的 HTTP 服务（可注入延迟与失败），
+用真实的 jmcomic 网页端客户端依次请求，比较 jmcomic 默认的按顺序重试与插件的 DomainHealth 排序切换。
+
+    python benchmarks/domains.py
+    python benchmarks/domains.py --requests 50 --timeout 5 --domain-timeout 1 --json
+
+默认的模拟域名（按配置顺序）：
+- hang：不响应，直到客户端超时（模拟被墙或失联的镜像）
+- flaky：一半请求直接断开连接
+- slow：每次响应前等待 300ms
+- fast：每次响应前等待 20ms
+
+jmcomic 默认策略把第一个域名重试 retry_times + 1 次后才切换，每次都要等满超时（--timeout，代表实际的长超时）；
+DomainHealth 请求时按健康度排序，单次请求超时为 --domain-timeout，失败一次就换下一个域名：
+- cold：不预先探测，排序只来自请求过程中记录的延迟与失败
+- health：先探测一轮再请求
+"""
+
+import argparse
+import json
+import statistics
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from random import Random
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "benchmarks"))
+
+# name: (响应延迟秒数, 失败率)；延迟为 None 表示不响应
+STUBS = {
+    "hang": (None, 0.0),
+    "flaky": (0.02, 0.5),
+    "slow": (0.3, 0.0),
+    "fast": (0.02, 0.0),
+}
+
+
+class StubServer:
+    """模拟一个镜像域名：每次请求先等待 latency 秒，按 failure_rate 直接断开连接，否则返回 JSON"""
+
+    def __init__(self, name: str, latency, failure_rate: float, seed: int = 0):
+        self.name = name
+        self.hits = 0
+        self._stop = threading.Event()
+        rng = Random(f"{seed}:{name}")
+        lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _reply(self, body: bool):
+                with lock:
+                    stub.hits += 1
+                    failed = rng.random() < failure_rate
+                if latency is None:
+                    stub._stop.wait()
+                    return
+                time.sleep(latency)
+                if failed:
+                    # 不返回任何内容直接断开，客户端收到连接错误
+                    self.close_connection = True
+                    return
+                payload = b'{"code": 200, "data": ""}'
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                if body:
+                    self.wfile.write(payload)
+
+            def do_GET(self):
+                self._reply(True)
+
+            def do_HEAD(self):
+                self._reply(False)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.domain = f"127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self._stop.set()
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def run(stubs, strategy, timeout: float, requests: int, retry_times: int) -> dict:
+    from jmcomic import JmOption
+    option = JmOption.default()
+    option.client.retry_times = retry_times
+    client = option.new_jm_client(domain_list=[s.domain for s in stubs], impl="html",
+                                  domain_retry_strategy=strategy, timeout=timeout)
+    for stub in stubs:
+        stub.hits = 0
+    latencies, failures = [], 0
+    start = time.perf_counter()
+    for i in range(requests):
+        t0 = time.perf_counter()
+        try:
+            client.get(f"/album/{i}")
+        except Exception:
+            failures += 1
+        latencies.append(time.perf_counter() - t0)
+    total = time.perf_counter() - start
+    return {
+        "total_s": total,
+        "mean_ms": statistics.mean(latencies) * 1000,
+        "p95_ms": sorted(latencies)[int(len(latencies) * 0.95) - 1] * 1000,
+        "max_ms": max(latencies) * 1000,
+        "failures": failures,
+        "hits": {s.name: s.hits for s in stubs},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="JMComic 插件域名选择基准")
+    parser.add_argument("--requests", type=int, default=30, help="依次发出的请求数")
+    parser.add_argument("--timeout", type=float, default=3, help="jmcomic 默认策略的单次请求超时（秒）")
+    parser.add_argument("--domain-timeout", type=float, default=1, help="DomainHealth 的单次请求与探测超时（秒）")
+    parser.add_argument("--retry-times", type=int, default=2, help="客户端 retry_times")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="以 JSON 输出结果")
+    args = parser.parse_args()
+
+    import fakes
+    fakes.install_astrbot_stub()
+    import main as plugin_main
+    from jmcomic import JmModuleConfig
+    JmModuleConfig.disable_jm_log()
+    JmModuleConfig.PROT = "http://"
+    JmModuleConfig.FLAG_API_CLIENT_AUTO_UPDATE_DOMAIN = False
+
+    stubs = [StubServer(name, latency, rate, args.seed) for name, (latency, rate) in STUBS.items()]
+    try:
+        results = {"default": run(stubs, None, args.timeout, args.requests, args.retry_times)}
+
+        # cold：不探测，只靠请求过程中的失败与延迟学习排序
+        cold = plugin_main.DomainHealth(args.domain_timeout, scheme="http")
+        results["cold"] = run(stubs, cold.request, args.timeout, args.requests, args.retry_times)
+        results["cold"]["failovers"] = cold.failovers
+
+        health = plugin_main.DomainHealth(args.domain_timeout, scheme="http")
+        t0 = time.perf_counter()
+        threads = [threading.Thread(target=health.probe, args=(s.domain,)) for s in stubs]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        probe_s = time.perf_counter() - t0
+        results["health"] = run(stubs, health.request, args.timeout, args.requests, args.retry_times)
+        results["health"]["probe_s"] = probe_s
+        results["health"]["failovers"] = health.failovers
+        names = {s.domain: s.name for s in stubs}
+        results["health"]["ranking"] = [names[d] for d in health.rank(list(names))]
+    finally:
+        for stub in stubs:
+            stub.close()
+
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+        return
+    print(f"{'策略':<10}{'总耗时(s)':>10}{'平均(ms)':>10}{'p95(ms)':>10}{'最大(ms)':>10}{'失败':>6}  各域名请求数")
+    for name, r in results.items():
+        hits = ", ".join(f"{k} {v}" for k, v in r["hits"].items())
+        print(f"{name:<10}{r['total_s']:>10.2f}{r['mean_ms']:>10.0f}{r['p95_ms']:>10.0f}{r['max_ms']:>10.0f}"
+              f"{r['failures']:>6}  {hits}")
+    health = results["health"]
+    print(f"cold 切换域名 {results['cold']['failovers']} 次；health 探测一轮耗时 {health['probe_s']:.2f}s，"
+          f"切换域名 {health['failovers']} 次，最终排序: {' > '.join(health['ranking'])}")
+
+
+if __name__ == "__main__":
+    main()
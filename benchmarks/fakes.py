@@ -0,0 +1,282 @@
+# -*- coding: utf-8 -*-
+
+"""
+离线基准测试用的替身：
+- SyntheticAlbum：按 N 章 × M 图生成合成本子（jpg/png/webp 混合、多种分辨率）
+- FakeJmClient：代替 jmcomic 客户端，可配置延迟、带宽与失败率，失败时像真实客户端一样在内部重试
+- BenchEvent：代替 AstrBot 消息事件，记录发送内容，可模拟上传带宽
+- install_astrbot_stub：未安装 AstrBot 时注册最小化的 astrbot.api 模块，使 main.py 可以被导入
+
+下载流程本身仍由 jmcomic 的 JmDownloader（以及插件的 ManifestDownloader 子类）执行，
+只有网络请求被 FakeJmClient 替换。
+"""
+
+import io
+import random
+import sys
+import threading
+import time
+import types
+from typing import Dict, List, Optional, Tuple
+
+FAKE_DOMAIN = "fake.jm.local"
+FORMATS = ("jpg", "png", "webp")
+RESOLUTIONS = ((720, 1080), (900, 1350), (1080, 1620), (800, 4000))  # 最后一种是条漫长图
+
+
+class SyntheticAlbum:
+    """合成本子：章节与图片的元数据按参数确定，图片内容按 (格式, 分辨率, 变体) 生成一次后复用"""
+
+    VARIANTS = 4
+
+    def __init__(self, album_id: str, chapters: int, images: int, seed: int = 0,
+                 formats: Tuple[str, ...] = FORMATS, resolutions: Tuple[Tuple[int, int], ...] = RESOLUTIONS,
+                 scale: float = 1.0):
+        self.album_id = str(album_id)
+        self.chapters = chapters
+        self.images = images
+        self.formats = formats
+        self.resolutions = tuple((max(16, int(w * scale)), max(16, int(h * scale))) for w, h in resolutions)
+        self._rng = random.Random(f"{seed}:{album_id}")
+        # 每张图片的 (格式, 分辨率, 变体)
+        self.pages: List[List[Tuple[str, Tuple[int, int], int]]] = [
+            [(self._rng.choice(formats), self._rng.choice(self.resolutions), self._rng.randrange(self.VARIANTS))
+             for _ in range(images)]
+            for _ in range(chapters)
+        ]
+
+    def photo_id(self, chapter: int) -> str:
+        return f"{self.album_id}{chapter + 1:03d}"
+
+    def chapter_of(self, photo_id: str) -> int:
+        return int(str(photo_id)[len(self.album_id):]) - 1
+
+    def page_names(self, chapter: int) -> List[str]:
+        return [f"{i + 1:05d}.{fmt}" for i, (fmt, _, _) in enumerate(self.pages[chapter])]
+
+    @property
+    def total_images(self) -> int:
+        return self.chapters * self.images
+
+
+class ImageFactory:
+    """生成并缓存图片字节；图片带噪声，压缩率接近真实扫描图"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cache: Dict[tuple, bytes] = {}
+
+    def get(self, fmt: str, size: Tuple[int, int], variant: int) -> bytes:
+        key = (fmt, size, variant)
+        with self._lock:
+            data = self._cache.get(key)
+        if data is None:
+            data = self._render(fmt, size, variant)
+            with self._lock:
+                self._cache[key] = data
+        return data
+
+    @staticmethod
+    def _render(fmt: str, size: Tuple[int, int], variant: int) -> bytes:
+        from PIL import Image
+        w, h = size
+        noise = Image.effect_noise((w, h), 40 + variant * 10).convert("RGB")
+        gradient = Image.linear_gradient("L").resize((w, h)).convert("RGB")
+        img = Image.blend(noise, gradient, 0.5)
+        buf = io.BytesIO()
+        if fmt == "jpg":
+            img.save(buf, "JPEG", quality=90)
+        elif fmt == "png":
+            img.convert("RGBA").save(buf, "PNG", compress_level=1)
+        else:
+            img.save(buf, "WEBP", quality=85)
+        return buf.getvalue()
+
+
+class FakeJmClient:
+    """jmcomic 客户端替身。latency 为每次请求的固定延迟（秒），bandwidth 为下载带宽（字节/秒，0 不限），
+    failure_rate 为单次请求失败概率，失败后最多重试 retries 次"""
+
+    def __init__(self, albums: Dict[str, SyntheticAlbum], latency: float = 0.0, bandwidth: float = 0,
+                 failure_rate: float = 0.0, retries: int = 3, seed: int = 0):
+        self.albums = albums
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.failure_rate = failure_rate
+        self.retries = retries
+        self.images = ImageFactory()
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "failures": 0, "bytes": 0}
+
+    def prerender(self):
+        """预先生成全部图片，避免首次渲染的耗时计入下载"""
+        for album in self.albums.values():
+            for chapter in album.pages:
+                for fmt, size, variant in chapter:
+                    self.images.get(fmt, size, variant)
+
+    def _request(self, payload_size: int = 0):
+        """模拟一次请求：固定延迟 + 按带宽传输，按失败率重试"""
+        for attempt in range(self.retries + 1):
+            with self._lock:
+                self.stats["requests"] += 1
+                failed = self._rng.random() < self.failure_rate
+            time.sleep(self.latency + (payload_size / self.bandwidth if self.bandwidth else 0))
+            if not failed:
+                return
+            with self._lock:
+                self.stats["failures"] += 1
+        from jmcomic import RequestRetryAllFailException
+        raise RequestRetryAllFailException(f"模拟请求连续失败 {self.retries + 1} 次", {})
+
+    def _album(self, album_id) -> SyntheticAlbum:
+        album = self.albums.get(str(album_id))
+        if album is None:
+            from jmcomic import MissingAlbumPhotoException
+            raise MissingAlbumPhotoException(f"本子不存在: {album_id}", {})
+        return album
+
+    # 插件用到的客户端接口
+
+    def get_album_detail(self, album_id):
+        from jmcomic import JmAlbumDetail
+        self._request()
+        album = self._album(album_id)
+        episodes = [(album.photo_id(i), str(i + 1), f"第{i + 1}话") for i in range(album.chapters)]
+        return JmAlbumDetail(
+            album_id=album.album_id, scramble_id="220980", name=f"合成本子 {album.album_id}",
+            episode_list=episodes, page_count=album.total_images, pub_date="2024-01-01", update_date="2024-01-01",
+            likes="0", views="0", comment_count=0, works=[], actors=[], authors=["bench"], tags=["benchmark"],
+        )
+
+    def get_photo_detail(self, photo_id, fetch_album=True, fetch_scramble_id=True):
+        from jmcomic import JmPhotoDetail
+        self._request()
+        album_id = next(a for a in self.albums if str(photo_id).startswith(a))
+        photo = JmPhotoDetail(photo_id=str(photo_id), name=str(photo_id), series_id=album_id, sort="1")
+        self.check_photo(photo)
+        return photo
+
+    def check_photo(self, photo):
+        if photo.page_arr is not None:
+            return
+        self._request()
+        album = self._album(photo.from_album.album_id if photo.from_album is not None else photo.series_id)
+        photo.page_arr = album.page_names(album.chapter_of(photo.photo_id))
+        photo.data_original_domain = FAKE_DOMAIN
+
+    def download_by_image_detail(self, image, img_save_path, decode_image=True):
+        photo = image.from_photo
+        album = self._album(photo.from_album.album_id if photo.from_album is not None else photo.series_id)
+        chapter = album.chapter_of(photo.photo_id)
+        fmt, size, variant = album.pages[chapter][image.index - 1]
+        data = self.images.get(fmt, size, variant)
+        self._request(len(data))
+        with open(img_save_path, "wb") as f:
+            f.write(data)
+        with self._lock:
+            self.stats["bytes"] += len(data)
+
+    def download_album_cover(self, album_id, save_path, size=None):
+        self._album(album_id)
+        data = self.images.get("jpg", (400, 600), 0)
+        self._request(len(data))
+        with open(save_path, "wb") as f:
+            f.write(data)
+
+
+class BenchEvent:
+    """AstrBot 消息事件替身；upload_bandwidth 为发送文件的模拟上传带宽（字节/秒，0 不等待）"""
+
+    def __init__(self, sender: str = "10000", group: Optional[str] = "bench", message: str = "",
+                 upload_bandwidth: float = 0):
+        self.sender = sender
+        self.group = group
+        self.message_str = message
+        self.upload_bandwidth = upload_bandwidth
+        self.sent: List[Tuple[float, str, object]] = []
+        self.files: List[str] = []
+
+    def get_sender_id(self) -> str:
+        return self.sender
+
+    def get_group_id(self) -> Optional[str]:
+        return self.group
+
+    def plain_result(self, text: str):
+        return ("plain", text)
+
+    def chain_result(self, chain: list):
+        return ("chain", chain)
+
+    async def send(self, result):
+        import asyncio
+        import os
+        kind, payload = result
+        if kind == "chain":
+            for component in payload:
+                path = getattr(component, "file", None)
+                if path:
+                    self.files.append(path)
+                    if self.upload_bandwidth:
+                        await asyncio.sleep(os.path.getsize(path) / self.upload_bandwidth)
+        self.sent.append((time.perf_counter(), kind, payload))
+
+
+def install_astrbot_stub():
+    """未安装 AstrBot 时注册最小化的 astrbot.api 模块；已安装则直接使用真实模块"""
+    try:
+        import astrbot.api  # noqa: F401
+        return False
+    except ImportError:
+        pass
+
+    import logging
+
+    def passthrough(*args, **kwargs):
+        return lambda func: func
+
+    class Component:
+        def __init__(self, *args, **kwargs):
+            self.args = args
+            for key, value in kwargs.items():
+                setattr(self, key, value)
+
+    class Star:
+        def __init__(self, context=None):
+            self.context = context
+
+    class PermissionType:
+        ADMIN = "admin"
+        MEMBER = "member"
+
+    logger = logging.getLogger("jmcomic_bench")
+    filter_ns = types.SimpleNamespace(command=passthrough, permission_type=passthrough, PermissionType=PermissionType)
+
+    modules = {
+        "astrbot": types.ModuleType("astrbot"),
+        "astrbot.api": types.ModuleType("astrbot.api"),
+        "astrbot.api.event": types.ModuleType("astrbot.api.event"),
+        "astrbot.api.star": types.ModuleType("astrbot.api.star"),
+        "astrbot.api.message_components": types.ModuleType("astrbot.api.message_components"),
+    }
+    modules["astrbot.api"].logger = logger
+    modules["astrbot.api.event"].filter = filter_ns
+    modules["astrbot.api.event"].AstrMessageEvent = BenchEvent
+    modules["astrbot.api.star"].Context = object
+    modules["astrbot.api.star"].Star = Star
+    modules["astrbot.api.star"].register = passthrough
+    modules["astrbot.api.star"].StarTools = object
+    for name in ("Plain", "File", "Node", "Image"):
+        setattr(modules["astrbot.api.message_components"], name, type(name, (Component,), {}))
+    sys.modules.update(modules)
+    return True
+
+
+def install_fake_client(client: FakeJmClient):
+    """让 JmOption 创建的所有客户端都是 client，并跳过域名预热的网络请求"""
+    from jmcomic import JmModuleConfig, JmOption
+    JmOption.build_jm_client = lambda self, *args, **kwargs: client
+    JmOption.new_jm_client = lambda self, *args, **kwargs: client
+    JmModuleConfig.get_html_domain = staticmethod(lambda *args, **kwargs: FAKE_DOMAIN)
@@ -0,0 +1,452 @@
+# -*- coding: utf-8 -*-
+
+"""
+离线基准测试：用 FakeJmClient 与合成本子端到端驱动插件，不访问网络。
+
+    python benchmarks/run.py                       # 默认规模跑全部场景
+    python benchmarks/run.py --albums 8 --chapters 4 --images 30 --latency 0.02
+    python benchmarks/run.py --scenario pdf --json > result.json
+    python benchmarks/run.py --baseline result.json --max-regression 0.2   # CI：退步超过 20% 时退出码为 1
+
+场景：
+- pdf / zip：并发调用 _download_album_task（下载 → 转码/打包 → 发送），统计吞吐与请求延迟
+- pdf_build：对已下载的本子单独调用 _build_pdf_volumes（内部走 _generate_compressed_pdf）
+- zip_build：对已下载的本子单独调用 _build_zip
+- zip_deflate：参照组，用旧版 _zip_folder 的方式（全部文件 ZIP_DEFLATED）打包同样的本子，与 zip_build 比较用时与输出大小
+- cleanup：登记大量本子后调用 _cleanup_old_albums（count 模式）与 _apply_budgets（budget 模式）
+
+峰值内存取 getrusage 的 ru_maxrss（本进程与已回收的 PDF 子进程分别统计），
+磁盘 I/O 取 ru_inblock / ru_oublock（按 512 字节块换算）。单独运行各场景可得到互不干扰的峰值内存。
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import zipfile
+from pathlib import Path
+from typing import Any, Dict, List
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from fakes import BenchEvent, FakeJmClient, SyntheticAlbum, install_astrbot_stub, install_fake_client  # noqa: E402
+
+SCENARIOS = ("pdf", "zip", "pdf_build", "zip_build", "zip_deflate", "cleanup")
+# 与基线比较的指标：(路径, 越大越好)
+COMPARED = (
+    ("throughput.images_per_s", True),
+    ("throughput.mb_per_s", True),
+    ("throughput.albums_per_s", True),
+    ("latency.p95", False),
+    ("elapsed", False),
+)
+
+OPTION_TEMPLATE = """\
+dir_rule:
+  base_dir: {base_dir}
+  rule: Bd_Aid_Pindex
+download:
+  cache: true
+  image:
+    decode: false
+  threading:
+    image: {image_threads}
+    photo: 1
+"""
+
+
+def percentile(values: List[float], q: int) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, len(values) * q // 100)]
+
+
+def latency_summary(values: List[float]) -> Dict[str, float]:
+    return {
+        "count": len(values),
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": max(values) if values else 0.0,
+    }
+
+
+def deflate_folder(folder: Path, zip_path: Path):
+    """旧版 _zip_folder：所有文件都用 ZIP_DEFLATED 压缩，作为 ZipPackager 的参照"""
+    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
+        for root, _, files in os.walk(folder):
+            for file in files:
+                file_path = os.path.join(root, file)
+                zipf.write(file_path, os.path.relpath(file_path, start=folder.parent))
+
+
+def dir_size(path: Path) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+class ResourceProbe:
+    """记录一个场景前后的 rusage；ru_maxrss 在 Linux 上以 KB 为单位，macOS 上以字节为单位"""
+
+    RSS_UNIT = 1 if sys.platform == "darwin" else 1024
+
+    def __init__(self):
+        self.start = self._sample()
+
+    @staticmethod
+    def _sample():
+        return resource.getrusage(resource.RUSAGE_SELF), resource.getrusage(resource.RUSAGE_CHILDREN)
+
+    def report(self) -> Dict[str, float]:
+        (self_start, child_start), (self_end, child_end) = self.start, self._sample()
+        blocks_in = (self_end.ru_inblock - self_start.ru_inblock) + (child_end.ru_inblock - child_start.ru_inblock)
+        blocks_out = (self_end.ru_oublock - self_start.ru_oublock) + (child_end.ru_oublock - child_start.ru_oublock)
+        return {
+            "peak_rss_mb": self_end.ru_maxrss * self.RSS_UNIT / 1024 / 1024,
+            "peak_child_rss_mb": child_end.ru_maxrss * self.RSS_UNIT / 1024 / 1024,
+            "disk_read_mb": blocks_in * 512 / 1024 / 1024,
+            "disk_write_mb": blocks_out * 512 / 1024 / 1024,
+            "cpu_s": (self_end.ru_utime + self_end.ru_stime - self_start.ru_utime - self_start.ru_stime)
+                     + (child_end.ru_utime + child_end.ru_stime - child_start.ru_utime - child_start.ru_stime),
+        }
+
+
+class Bench:
+    def __init__(self, args, work_dir: Path):
+        self.args = args
+        self.work_dir = work_dir
+        self.albums = {
+            str(400000 + i): SyntheticAlbum(str(400000 + i), args.chapters, args.images, seed=args.seed, scale=args.scale)
+            for i in range(args.albums)
+        }
+        self.client = FakeJmClient(self.albums, latency=args.latency, bandwidth=args.bandwidth * 1024 * 1024,
+                                   failure_rate=args.failure_rate, seed=args.seed)
+        self.client.prerender()
+        install_fake_client(self.client)
+
+    def new_plugin(self, name: str, **config):
+        """每个场景使用独立的下载目录，避免命中上一个场景的产物缓存"""
+        import main
+        base_dir = self.work_dir / name
+        base_dir.mkdir(parents=True, exist_ok=True)
+        option_file = base_dir / "option.yml"
+        option_file.write_text(OPTION_TEMPLATE.format(
+            base_dir=json.dumps(str(base_dir)), image_threads=self.args.image_threads,
+        ), encoding="utf-8")
+        plugin_config = {
+            "download_dir": str(base_dir),
+            "option_file": str(option_file),
+            "max_concurrent_downloads": self.args.concurrency,
+            "max_downloads_per_user": self.args.concurrency,
+            "pdf_workers": self.args.pdf_workers,
+            "cleanup_mode": "count",
+            "max_albums": 0,
+            "artifact_cache_mb": 0,
+            "domain_probe_interval": 0,  # 客户端是模拟的，不探测真实域名
+        }
+        plugin_config.update(config)
+        return main.JmComicPlugin(None, plugin_config)
+
+    @staticmethod
+    async def close_plugin(plugin):
+        # 等 PDF 进程池完全退出，子进程的峰值内存才会计入 RUSAGE_CHILDREN
+        await asyncio.to_thread(plugin._cpu_lane.shutdown, True)
+        await plugin.terminate()
+
+    async def download(self, pack: bool) -> Dict[str, Any]:
+        name = "zip" if pack else "pdf"
+        plugin = self.new_plugin(name)
+        requests_before = dict(self.client.stats)
+        latencies, first_parts, output = [], [], 0
+
+        async def one(album_id: str, index: int):
+            nonlocal output
+            event = BenchEvent(sender=str(10000 + index), upload_bandwidth=self.args.upload_bandwidth * 1024 * 1024)
+            start = time.perf_counter()
+            await plugin._download_album_task(event, album_id, pack=pack, overrides={}, extra={})
+            latencies.append(time.perf_counter() - start)
+            sent = [t for t, kind, _ in event.sent if kind == "chain"]
+            if not sent:
+                raise RuntimeError(f"{album_id} 没有发送任何文件: {event.sent}")
+            first_parts.append(sent[0] - start)
+            output += sum(os.path.getsize(p) for p in event.files if os.path.exists(p))
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(album_id, i) for i, album_id in enumerate(self.albums)))
+        elapsed = time.perf_counter() - start
+        stages = plugin._metrics.summary()
+        await self.close_plugin(plugin)
+
+        images = sum(a.total_images for a in self.albums.values())
+        downloaded = self.client.stats["bytes"] - requests_before["bytes"]
+        return {
+            "elapsed": elapsed,
+            "throughput": {"images_per_s": images / elapsed, "mb_per_s": downloaded / 1024 / 1024 / elapsed},
+            "latency": latency_summary(latencies),
+            "first_part": latency_summary(first_parts),
+            "downloaded_mb": downloaded / 1024 / 1024,
+            "output_mb": output / 1024 / 1024,
+            "requests": self.client.stats["requests"] - requests_before["requests"],
+            "request_failures": self.client.stats["failures"] - requests_before["failures"],
+            "stages": stages,
+        }
+
+    async def prepare_albums(self, plugin) -> List[Path]:
+        """用插件自己的下载器把全部合成本子下载到 plugin 的目录，返回各本子目录"""
+        option = await plugin._get_option()
+        album_dirs = []
+        for album_id in self.albums:
+            manifest = plugin._get_manifest(album_id)
+            downloader = plugin._create_downloader(manifest)
+            album = await plugin._safe_call("download_album", plugin_module().jmcomic.download_album,
+                                            album_id, option, downloader=downloader)
+            album = album[0] if isinstance(album, tuple) else album
+            album_dirs.append(plugin._resolve_album_dir(option, album))
+        return album_dirs
+
+    async def pdf_build(self) -> Dict[str, Any]:
+        plugin = self.new_plugin("pdf_build")
+        album_dirs = await self.prepare_albums(plugin)
+        plugin._metrics = plugin_module().Metrics()
+        latencies, output = [], 0
+        probe_images = sum(a.total_images for a in self.albums.values())
+        input_bytes = sum(dir_size(d) for d in album_dirs)
+
+        start = time.perf_counter()
+        for album_id, album_dir in zip(self.albums, album_dirs):
+            parts = []
+            key = f"bench-pdf-{album_id}"
+            t = time.perf_counter()
+            await plugin._build_pdf_volumes(album_dir, [album_dir], key, album_id, self.args.quality,
+                                            self.args.max_size, None, None, parts.append)
+            latencies.append(time.perf_counter() - t)
+            output += sum(os.path.getsize(p['path']) for p in parts)
+        elapsed = time.perf_counter() - start
+        stages = plugin._metrics.summary()
+        await self.close_plugin(plugin)
+        return {
+            "elapsed": elapsed,
+            "throughput": {"images_per_s": probe_images / elapsed, "mb_per_s": input_bytes / 1024 / 1024 / elapsed},
+            "latency": latency_summary(latencies),
+            "input_mb": input_bytes / 1024 / 1024,
+            "output_mb": output / 1024 / 1024,
+            "stages": stages,
+        }
+
+    async def zip_build(self, deflate: bool = False) -> Dict[str, Any]:
+        """deflate=True 时改用参照打包方式，其余步骤相同"""
+        main = plugin_module()
+        plugin = self.new_plugin("zip_deflate" if deflate else "zip_build")
+        album_dirs = await self.prepare_albums(plugin)
+        plugin._metrics = main.Metrics()
+        latencies, output = [], 0
+        images = sum(a.total_images for a in self.albums.values())
+        input_bytes = sum(dir_size(d) for d in album_dirs)
+
+        start = time.perf_counter()
+        for album_dir in album_dirs:
+            zip_path = album_dir.with_suffix(".zip")
+            t = time.perf_counter()
+            if deflate:
+                await plugin._run_sync(deflate_folder, album_dir, zip_path)
+            elif not await plugin._build_zip(album_dir, [album_dir], main.ZipPackager(zip_path)):
+                raise RuntimeError(f"打包失败: {album_dir}")
+            latencies.append(time.perf_counter() - t)
+            output += zip_path.stat().st_size
+        elapsed = time.perf_counter() - start
+        stages = plugin._metrics.summary()
+        await self.close_plugin(plugin)
+        return {
+            "elapsed": elapsed,
+            "throughput": {"images_per_s": images / elapsed, "mb_per_s": input_bytes / 1024 / 1024 / elapsed},
+            "latency": latency_summary(latencies),
+            "input_mb": input_bytes / 1024 / 1024,
+            "output_mb": output / 1024 / 1024,
+            "stages": stages,
+        }
+
+    def seed_storage(self, plugin, count: int) -> int:
+        """登记 count 个小本子（每个 2 章、每章 4 个小文件），最早的访问时间排在最前"""
+        now = time.time()
+        payload = b"\0" * 4096
+        for i in range(count):
+            album_dir = plugin.global_base_dir / f"seed_{i:05d}"
+            for chapter in range(2):
+                chapter_dir = album_dir / str(chapter + 1)
+                chapter_dir.mkdir(parents=True, exist_ok=True)
+                for page in range(4):
+                    (chapter_dir / f"{page + 1:05d}.jpg").write_bytes(payload)
+                plugin._record_chapter(str(900000 + i), album_dir, chapter_dir, f"{900000 + i}{chapter}",
+                                       last_access=now - count + i)
+        return count * 2 * 4 * len(payload)
+
+    async def cleanup(self) -> Dict[str, Any]:
+        count, keep = self.args.cleanup_albums, self.args.cleanup_albums // 10
+        result = {}
+
+        plugin = self.new_plugin("cleanup_count", max_albums=keep)
+        await asyncio.to_thread(self.seed_storage, plugin, count)
+        start = time.perf_counter()
+        await plugin._cleanup_old_albums()
+        result["count_mode_s"] = time.perf_counter() - start
+        remaining = len([d for d in plugin.global_base_dir.glob("seed_*")])
+        if remaining != keep:
+            raise RuntimeError(f"count 模式清理后剩余 {remaining} 个本子，预期 {keep}")
+        await self.close_plugin(plugin)
+
+        plugin = self.new_plugin("cleanup_budget", cleanup_mode="budget", budget_images_mb=1)
+        stored = await asyncio.to_thread(self.seed_storage, plugin, count)
+        start = time.perf_counter()
+        await plugin._run_sync(plugin._apply_budgets)
+        result["budget_mode_s"] = time.perf_counter() - start
+        left = sum(dir_size(d) for d in plugin.global_base_dir.glob("seed_*"))
+        if left > plugin.budgets["images"]:
+            raise RuntimeError(f"budget 模式清理后仍有 {left} 字节原图，超出预算")
+        await self.close_plugin(plugin)
+
+        result["elapsed"] = result["count_mode_s"] + result["budget_mode_s"]
+        result["albums"] = count
+        result["seeded_mb"] = stored / 1024 / 1024
+        result["throughput"] = {"albums_per_s": count * 2 / result["elapsed"]}
+        result["latency"] = latency_summary([result["count_mode_s"], result["budget_mode_s"]])
+        return result
+
+
+def plugin_module():
+    import main
+    return main
+
+
+def lookup(data: Dict[str, Any], path: str):
+    for key in path.split("."):
+        if not isinstance(data, dict) or key not in data:
+            return None
+        data = data[key]
+    return data
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], max_regression: float) -> List[str]:
+    """返回超出允许退步幅度的指标说明"""
+    failures = []
+    for scenario, result in results["scenarios"].items():
+        base = baseline.get("scenarios", {}).get(scenario)
+        if not base:
+            continue
+        for path, higher_is_better in COMPARED:
+            new, old = lookup(result, path), lookup(base, path)
+            if not new or not old:
+                continue
+            change = (old - new) / old if higher_is_better else (new - old) / old
+            if change > max_regression:
+                failures.append(f"{scenario}.{path}: {old:.4g} -> {new:.4g}（退步 {change:.0%}）")
+    return failures
+
+
+def print_report(results: Dict[str, Any]):
+    print(f"合成本子: {results['config']['albums']} 个 × {results['config']['chapters']} 章 × "
+          f"{results['config']['images']} 张，模拟延迟 {results['config']['latency']}s")
+    for name, result in results["scenarios"].items():
+        res = result["resources"]
+        lat = result["latency"]
+        throughput = result["throughput"]
+        if "images_per_s" in throughput:
+            rate = f"{throughput['images_per_s']:.1f} 张/s、{throughput['mb_per_s']:.2f} MB/s"
+        else:
+            rate = f"{throughput['albums_per_s']:.0f} 本/s"
+        print(f"\n[{name}] 用时 {result['elapsed']:.2f}s  吞吐 {rate}")
+        print(f"  延迟 p50 {lat['p50']:.3f}s / p95 {lat['p95']:.3f}s / max {lat['max']:.3f}s")
+        if "input_mb" in result:
+            print(f"  输入 {result['input_mb']:.1f}MB  输出 {result['output_mb']:.1f}MB")
+        if "first_part" in result:
+            print(f"  首个文件 p50 {result['first_part']['p50']:.3f}s / p95 {result['first_part']['p95']:.3f}s")
+        print(f"  峰值内存 {res['peak_rss_mb']:.0f}MB（子进程 {res['peak_child_rss_mb']:.0f}MB）  "
+              f"磁盘读 {res['disk_read_mb']:.1f}MB / 写 {res['disk_write_mb']:.1f}MB  CPU {res['cpu_s']:.2f}s")
+        for stage, s in sorted(result.get("stages", {}).items()):
+            print(f"    {stage:<14} {s['count']:>5} 次  p50 {s['p50']:.3f}s  p95 {s['p95']:.3f}s  max {s['max']:.3f}s")
+
+
+async def run(args) -> Dict[str, Any]:
+    work_dir = Path(tempfile.mkdtemp(prefix="jmbench_", dir=args.work_dir))
+    try:
+        bench = Bench(args, work_dir)
+        runners = {
+            "pdf": lambda: bench.download(pack=False),
+            "zip": lambda: bench.download(pack=True),
+            "pdf_build": bench.pdf_build,
+            "zip_build": bench.zip_build,
+            "zip_deflate": lambda: bench.zip_build(deflate=True),
+            "cleanup": bench.cleanup,
+        }
+        results = {"config": vars(args).copy(), "scenarios": {}}
+        for name in args.scenario or SCENARIOS:
+            probe = ResourceProbe()
+            result = await runners[name]()
+            result["resources"] = probe.report()
+            results["scenarios"][name] = result
+        return results
+    finally:
+        if not args.keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="JMComic 插件离线基准测试")
+    parser.add_argument("--scenario", action="append", choices=SCENARIOS, help="只运行指定场景，可重复")
+    parser.add_argument("--albums", type=int, default=4, help="合成本子数量（同时发起的请求数）")
+    parser.add_argument("--chapters", type=int, default=3)
+    parser.add_argument("--images", type=int, default=20, help="每章图片数")
+    parser.add_argument("--scale", type=float, default=0.5, help="图片分辨率缩放比例")
+    parser.add_argument("--latency", type=float, default=0.01, help="每次模拟请求的延迟（秒）")
+    parser.add_argument("--bandwidth", type=float, default=0, help="模拟下载带宽（MB/s，0 不限）")
+    parser.add_argument("--upload-bandwidth", type=float, default=0, help="模拟发送文件的上传带宽（MB/s，0 不限）")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="单次请求失败概率，失败后由客户端重试")
+    parser.add_argument("--concurrency", type=int, default=2, help="max_concurrent_downloads")
+    parser.add_argument("--image-threads", type=int, default=8, help="每本子的图片下载线程数")
+    parser.add_argument("--pdf-workers", type=int, default=0, help="PDF 转码进程数，0 为 CPU 核数")
+    parser.add_argument("--quality", type=int, default=None, help="pdf_build 场景的 PDF 质量，默认直通")
+    parser.add_argument("--max-size", type=int, default=0, help="pdf_build 场景的最长边限制")
+    parser.add_argument("--cleanup-albums", type=int, default=500, help="cleanup 场景登记的本子数")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--work-dir", default=None, help="临时目录所在位置，默认系统临时目录")
+    parser.add_argument("--keep", action="store_true", help="保留临时目录便于检查")
+    parser.add_argument("--json", action="store_true", help="以 JSON 输出结果")
+    parser.add_argument("--baseline", help="与之前 --json 输出的结果比较")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="允许的最大退步比例")
+    parser.add_argument("--verbose", action="store_true", help="输出插件日志")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING, format="%(levelname)s %(message)s")
+    install_astrbot_stub()
+    results = asyncio.run(run(args))
+
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+    else:
+        print_report(results)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            failures = compare(results, json.load(f), args.max_regression)
+        for line in failures:
+            print(f"性能退步: {line}", file=sys.stderr)
+        if failures:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+
+"""
+插件启动耗时基准：每次在新的子进程中导入 main.py 并创建插件实例，比较不同加载方式。
+
+    python benchmarks/startup.py                 # lazy（当前）与 eager（启动时导入全部依赖并预热）
+    python benchmarks/startup.py --ref 0caa93a   # 额外比较某个 git 版本的 main.py
+    python benchmarks/startup.py --runs 10 --json
+
+- lazy：当前 main.py，fast_start 开启，jmcomic / Pillow 在首次使用时才导入
+- eager：当前 main.py，先导入 jmcomic / Pillow 再加载插件，fast_start 关闭，等同旧的加载方式
+- ref：从 git 取出指定版本的 main.py 原样加载
+
+子进程在创建实例后立即取消后台任务，预热不会真正访问网络。
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+HEAVY_MODULES = ("jmcomic", "img2pdf", "PIL", "curl_cffi", "Crypto")
+
+CHILD = r"""
+import asyncio, json, resource, sys, tempfile, time
+sys.path.insert(0, {bench_dir!r})
+sys.path.insert(0, {plugin_dir!r})
+import fakes
+fakes.install_astrbot_stub()
+
+start = time.perf_counter()
+if {eager!r}:
+    import jmcomic, PIL.Image
+import main
+imported = time.perf_counter()
+
+
+async def construct():
+    plugin = main.JmComicPlugin(None, {{"download_dir": tempfile.mkdtemp(), "fast_start": not {eager!r}}})
+    ready = time.perf_counter()
+    for task in asyncio.all_tasks():
+        if task is not asyncio.current_task():
+            task.cancel()
+    await plugin.terminate()
+    return ready
+
+
+ready = asyncio.run(construct())
+print(json.dumps({{
+    "import_ms": (imported - start) * 1000,
+    "init_ms": (ready - imported) * 1000,
+    "total_ms": (ready - start) * 1000,
+    "rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    "heavy_modules": sorted(m for m in {heavy!r} if m in sys.modules),
+}}))
+"""
+
+
+def run_child(plugin_dir: Path, eager: bool) -> dict:
+    code = CHILD.format(bench_dir=str(ROOT / "benchmarks"), plugin_dir=str(plugin_dir), eager=eager,
+                        heavy=HEAVY_MODULES)
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True, cwd=plugin_dir)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def measure(plugin_dir: Path, eager: bool, runs: int) -> dict:
+    samples = [run_child(plugin_dir, eager) for _ in range(runs)]
+    result = {"runs": runs, "heavy_modules": samples[-1]["heavy_modules"]}
+    for key in ("import_ms", "init_ms", "total_ms", "rss_mb"):
+        values = [s[key] for s in samples]
+        result[key] = statistics.median(values)
+        result[f"{key}_min"] = min(values)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="JMComic 插件启动耗时基准")
+    parser.add_argument("--runs", type=int, default=5, help="每种方式运行的次数，取中位数")
+    parser.add_argument("--ref", help="额外比较的 git 版本（如旧提交号），取出该版本的 main.py 加载")
+    parser.add_argument("--json", action="store_true", help="以 JSON 输出结果")
+    args = parser.parse_args()
+
+    results = {
+        "lazy": measure(ROOT, False, args.runs),
+        "eager": measure(ROOT, True, args.runs),
+    }
+    if args.ref:
+        with tempfile.TemporaryDirectory(prefix="jmstartup_") as tmp:
+            source = subprocess.run(["git", "show", f"{args.ref}:main.py"], cwd=ROOT, capture_output=True,
+                                    check=True).stdout
+            (Path(tmp) / "main.py").write_bytes(source)
+            results[f"ref:{args.ref}"] = measure(Path(tmp), False, args.runs)
+
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+        return
+    print(f"{'方式':<16}{'导入(ms)':>10}{'实例化(ms)':>12}{'合计(ms)':>10}{'内存(MB)':>10}  已导入的重量级依赖")
+    for name, r in results.items():
+        print(f"{name:<16}{r['import_ms']:>10.1f}{r['init_ms']:>12.1f}{r['total_ms']:>10.1f}{r['rss_mb']:>10.1f}  "
+              f"{', '.join(r['heavy_modules']) or '无'}")
+    base = results["lazy"]["total_ms"]
+    for name, r in results.items():
+        if name != "lazy" and base > 0:
+            print(f"lazy 比 {name} 快 {r['total_ms'] / base:.1f} 倍")
+
+
+if __name__ == "__main__":
+    main()
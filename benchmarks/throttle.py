@@ -0,0 +1,269 @@
+# -*- coding: utf-8 -*-
+
+"""
+图片并发与限速基准：在本地启动一个限流的图片服务器，用插件的 _download_album_task 下载合成本子，
+比较 option 中固定的图片线程数与 DownloadThrottle 自适应并发，以及全局限速是否生效。
+
+    python benchmarks/throttle.py
+    python benchmarks/throttle.py --images 60 --conn-kb 256 --server-kb 4096 --max-conn 8 --json
+
+服务器模拟常见的镜像限制：
+- 单个连接的带宽上限（--conn-kb），线程太少时跑不满总带宽
+- 全部连接共享的总带宽（--server-kb）
+- 同时处理的请求数超过 --max-conn 时返回 429
+
+本子详情与章节信息由 FakeJmClient 提供；图片通过真实的 jmcomic 网页端客户端从本地服务器下载，
+请求走插件的 DomainHealth，429 会被并发控制及时感知。
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "benchmarks"))
+
+from fakes import BenchEvent, FakeJmClient, SyntheticAlbum, install_astrbot_stub, install_fake_client  # noqa: E402
+
+CHUNK = 16 * 1024
+OPTION_TEMPLATE = """\
+dir_rule:
+  base_dir: {base_dir}
+  rule: Bd_Aid_Pindex
+download:
+  cache: true
+  image:
+    decode: false
+  threading:
+    image: {image_threads}
+    photo: 1
+"""
+
+
+class Pacer:
+    """按带宽节流写出：记录下一次允许发送的时间点，多个线程共享时即为总带宽"""
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def take(self, nbytes: int):
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + nbytes / self.rate
+        if start > now:
+            time.sleep(start - now)
+
+
+class ThrottledImageServer:
+    """GET /<album_id>/<photo_id>/<文件名> 返回合成本子中对应的图片"""
+
+    def __init__(self, client: FakeJmClient, conn_rate: float, server_rate: float, max_conn: int, latency: float):
+        self.requests = 0
+        self.rejected = 0
+        self.bytes = 0
+        active = [0]
+        lock = threading.Lock()
+        shared = Pacer(server_rate)
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                with lock:
+                    server.requests += 1
+                    active[0] += 1
+                    rejected = active[0] > max_conn
+                    if rejected:
+                        server.rejected += 1
+                try:
+                    if rejected:
+                        self.send_response(429)
+                        self.send_header("Content-Length", "0")
+                        self.end_headers()
+                        return
+                    _, album_id, photo_id, name = self.path.split("?")[0].split("/")
+                    album = client.albums[album_id]
+                    index = int(name.split(".")[0]) - 1
+                    fmt, size, variant = album.pages[album.chapter_of(photo_id)][index]
+                    data = client.images.get(fmt, size, variant)
+                    time.sleep(latency)
+                    self.send_response(200)
+                    self.send_header("Content-Type", "application/octet-stream")
+                    self.send_header("Content-Length", str(len(data)))
+                    self.end_headers()
+                    own = Pacer(conn_rate)
+                    for i in range(0, len(data), CHUNK):
+                        chunk = data[i:i + CHUNK]
+                        own.take(len(chunk))
+                        shared.take(len(chunk))
+                        self.wfile.write(chunk)
+                    with lock:
+                        server.bytes += len(data)
+                finally:
+                    with lock:
+                        active[0] -= 1
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.domain = f"127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class HttpImageClient(FakeJmClient):
+    """详情来自合成本子，图片用真实的 jmcomic 客户端（self.http）从本地服务器下载"""
+
+    http = None
+    domain = None
+
+    def download_by_image_detail(self, image, img_save_path, decode_image=True):
+        photo = image.from_photo
+        album_id = photo.from_album.album_id if photo.from_album is not None else photo.series_id
+        url = f"http://{self.domain}/{album_id}/{photo.photo_id}/{image.filename}"
+        self.http.download_image(url, img_save_path, None, decode_image=False)
+
+
+async def run_case(args, client: HttpImageClient, server: ThrottledImageServer, real_new_client, name: str,
+                   image_threads: int, adaptive: bool, speed_limit_kb: int) -> dict:
+    import main
+    work_dir = Path(tempfile.mkdtemp(prefix=f"jmthrottle_{name}_"))
+    option_file = work_dir / "option.yml"
+    option_file.write_text(OPTION_TEMPLATE.format(base_dir=json.dumps(str(work_dir)), image_threads=image_threads),
+                           encoding="utf-8")
+    plugin = main.JmComicPlugin(None, {
+        "download_dir": str(work_dir),
+        "option_file": str(option_file),
+        "max_concurrent_downloads": len(client.albums),
+        "max_downloads_per_user": len(client.albums),
+        "cleanup_mode": "count",
+        "max_albums": 0,
+        "artifact_cache_mb": 0,
+        "domain_probe_interval": 0,
+        "adaptive_concurrency": adaptive,
+        "max_image_concurrency": args.max_concurrency,
+        "download_speed_limit_kb": speed_limit_kb,
+    })
+    from jmcomic import JmOption
+    option = JmOption.default()
+    option.client.retry_times = args.retry_times
+    client.http = real_new_client(option, impl="html", domain_list=[server.domain],
+                                  domain_retry_strategy=plugin._domain_health.request)
+    server.requests = server.rejected = server.bytes = 0
+
+    limits = []
+    stop = asyncio.Event()
+
+    async def sample():
+        while not stop.is_set():
+            limits.append(plugin._throttle.limit)
+            await asyncio.sleep(0.25)
+
+    sampler = asyncio.create_task(sample())
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        plugin._download_album_task(BenchEvent(sender=str(i)), album_id, True, {}, {})
+        for i, album_id in enumerate(client.albums)
+    ))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await sampler
+    images = len(list(work_dir.rglob("*.jpg"))) + len(list(work_dir.rglob("*.png"))) + \
+        len(list(work_dir.rglob("*.webp")))
+    expected = sum(a.total_images for a in client.albums.values())
+    summary = plugin._throttle.summary()
+    for task in asyncio.all_tasks():
+        if task is not asyncio.current_task():
+            task.cancel()
+    await plugin.terminate()
+    return {
+        "elapsed": elapsed,
+        "mb_per_s": server.bytes / elapsed / 1024 / 1024,
+        "images": images,
+        "expected": expected,
+        "requests": server.requests,
+        "rejected_429": server.rejected,
+        "final_limit": summary["limit"] if adaptive else image_threads,
+        "max_limit": max(limits) if adaptive and limits else image_threads,
+    }
+
+
+async def run(args) -> dict:
+    install_astrbot_stub()
+    from jmcomic import JmModuleConfig, JmOption
+    JmModuleConfig.disable_jm_log()
+    real_new_client = JmOption.new_jm_client
+    albums = {
+        str(500000 + i): SyntheticAlbum(str(500000 + i), args.chapters, args.images, seed=args.seed, scale=args.scale)
+        for i in range(args.albums)
+    }
+    client = HttpImageClient(albums, seed=args.seed)
+    client.prerender()
+    install_fake_client(client)
+    server = ThrottledImageServer(client, args.conn_kb * 1024, args.server_kb * 1024, args.max_conn, args.latency)
+    client.domain = server.domain
+    cases = [(f"fixed-{n}", n, False, 0) for n in args.fixed]
+    cases.append(("adaptive", args.start_threads, True, 0))
+    if args.cap_kb:
+        cases.append(("adaptive-cap", args.start_threads, True, args.cap_kb))
+    results = {}
+    try:
+        for name, threads, adaptive, cap in cases:
+            results[name] = await run_case(args, client, server, real_new_client, name, threads, adaptive, cap)
+            if cap:
+                results[name]["cap_mb_per_s"] = cap / 1024
+    finally:
+        server.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="JMComic 插件图片并发与限速基准（本地限流服务器）")
+    parser.add_argument("--albums", type=int, default=2)
+    parser.add_argument("--chapters", type=int, default=2)
+    parser.add_argument("--images", type=int, default=30, help="每章图片数")
+    parser.add_argument("--scale", type=float, default=0.5, help="合成图片的分辨率缩放")
+    parser.add_argument("--conn-kb", type=int, default=256, help="服务器单连接带宽（KB/s）")
+    parser.add_argument("--server-kb", type=int, default=4096, help="服务器总带宽（KB/s）")
+    parser.add_argument("--max-conn", type=int, default=12, help="服务器同时处理的请求数，超出返回 429")
+    parser.add_argument("--latency", type=float, default=0.05, help="每个请求的首字节延迟（秒）")
+    parser.add_argument("--fixed", type=int, nargs="*", default=[2, 16], help="对比的固定图片线程数")
+    parser.add_argument("--start-threads", type=int, default=2, help="自适应并发的起点（option 中的图片线程数）")
+    parser.add_argument("--max-concurrency", type=int, default=32, help="max_image_concurrency")
+    parser.add_argument("--cap-kb", type=int, default=1024, help="额外运行一次限速为该值（KB/s）的自适应下载，0 跳过")
+    parser.add_argument("--retry-times", type=int, default=5, help="客户端 retry_times")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="以 JSON 输出结果")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.ERROR)
+
+    results = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+        return
+    print(f"{'方式':<14}{'耗时(s)':>9}{'MB/s':>8}{'图片':>10}{'请求':>7}{'429':>6}{'并发(终/峰)':>13}")
+    for name, r in results.items():
+        print(f"{name:<14}{r['elapsed']:>9.2f}{r['mb_per_s']:>8.2f}{r['images']:>5}/{r['expected']:<4}"
+              f"{r['requests']:>7}{r['rejected_429']:>6}{r['final_limit']:>8}/{r['max_limit']:<4}"
+              + (f"  限速 {r['cap_mb_per_s']:.2f} MB/s" if "cap_mb_per_s" in r else ""))
+
+
+if __name__ == "__main__":
+    main()
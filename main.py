@@ -7,84 +7,2114 @@ JMComic 下载插件 - 最终版 3.0.0
 - 通过第一个章节图片目录推断本子根目录，支持有/无章节子文件夹
 - 封面统一保存到 covers 目录
 - 支持配置 cover_keep_days 和 default_pdf_quality
-- 自动依赖安装（阿里源）
+- 依赖按需导入，加载插件时不联网安装、不导入 jmcomic / Pillow
 - 超时60秒处理
 """
 
-import subprocess
-import sys
-
-def _ensure_package(package_name, import_name=None):
-    if import_name is None:
-        import_name = package_name
-    try:
-        __import__(import_name)
-    except ImportError:
-        print(f"[JMPlugin] 缺少依赖 {package_name}，正在尝试自动安装...")
-        try:
-            subprocess.check_call([
-                sys.executable, "-m", "pip", "install",
-                "-i", "https://mirrors.aliyun.com/pypi/simple/",
-                package_name
-            ])
-            __import__(import_name)
-            print(f"[JMPlugin] {package_name} 安装成功")
-        except Exception as e:
-            print(f"[JMPlugin] 自动安装 {package_name} 失败: {e}")
-            print(f"[JMPlugin] 请手动执行: pip install {package_name}")
-            raise
-
-_ensure_package("jmcomic")
-_ensure_package("img2pdf")
-_ensure_package("Pillow", "PIL")
-
 import asyncio
+import bisect
+import concurrent.futures
+import contextlib
 import functools
+import hashlib
+import importlib
+import importlib.util
+import itertools
+import json
+import math
 import os
 import shutil
+import sqlite3
 import tempfile
 import traceback
 import zipfile
 import re
+import threading
 import time
+from collections import OrderedDict, deque
 from pathlib import Path
-from typing import Optional, List, Dict, Any, Tuple
-from datetime import datetime, timedelta
+from typing import TYPE_CHECKING, Optional, List, Dict, Any, Tuple
 
 from astrbot.api.event import filter, AstrMessageEvent
-from astrbot.api.star import Context, Star, register, StarTools
+from astrbot.api.star import Context, Star, register
 from astrbot.api import logger
 from astrbot.api.message_components import Plain, File, Node
 from astrbot.api.message_components import Image as MsgImage
 
-import jmcomic
-from jmcomic import (
-    JmOption,
-    JmAlbumDetail,
-    JmModuleConfig,
-    JmcomicException,
-    MissingAlbumPhotoException,
-    RequestRetryAllFailException,
-    create_option_by_file,
-    download_album,
-    DirRule,
-    ExceptionTool,
-    time_stamp,
-    current_thread,
-    fix_windir_name,
-)
-from jmcomic import JmMagicConstants
-from jmcomic.jm_downloader import JmDownloader
-
-try:
-    import img2pdf
-    from PIL import Image as PILImage
-    PDF_AVAILABLE = True
-except ImportError:
-    PDF_AVAILABLE = False
-    logger.error("PDF 库未安装，请手动安装: pip install img2pdf Pillow")
+if TYPE_CHECKING:
+    # 仅用于类型注解，运行时按需导入 jmcomic
+    from jmcomic import JmOption, JmAlbumDetail
+
+
+
+class _LazyModule:
+    """首次访问属性时才导入模块，加载插件时不导入 jmcomic / Pillow"""
+
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+        self._hooks = []
+        self._lock = threading.RLock()
+
+    def _load(self):
+        with self._lock:
+            if self._module is None:
+                module = importlib.import_module(self._name)
+                for hook in self._hooks:
+                    hook(module)
+                self._hooks.clear()
+                self._module = module
+        return self._module
+
+    def on_load(self, hook):
+        """模块导入后调用 hook(module)；已导入时立即调用"""
+        with self._lock:
+            if self._module is None:
+                self._hooks.append(hook)
+                return
+        hook(self._module)
+
+    def __getattr__(self, attr):
+        return getattr(self._module or self._load(), attr)
+
+
+jmcomic = _LazyModule("jmcomic")
+PILImage = _LazyModule("PIL.Image")
+PILImageOps = _LazyModule("PIL.ImageOps")
+
+# 只检查是否已安装，不导入；依赖由 AstrBot 按 requirements.txt 安装
+if importlib.util.find_spec("jmcomic") is None:
+    logger.error("jmcomic 未安装，请手动安装: pip install \"jmcomic>=2.7.9\"")
+PDF_AVAILABLE = importlib.util.find_spec("PIL") is not None
+if not PDF_AVAILABLE:
+    logger.error("Pillow 未安装，无法生成 PDF，请手动安装: pip install Pillow")
+
+
+def _check_jmcomic_version(module):
+    # 下载流程依赖 2.7.9 新增的 JmRuntime / DownloadControl / JmTaskContext 与 domain_retry_strategy
+    if not all(hasattr(module, name) for name in ("JmRuntime", "DownloadControl", "JmTaskContext", "JTC")):
+        logger.error(f"jmcomic {getattr(module, '__version__', '?')} 版本过低，请升级: pip install -U \"jmcomic>=2.7.9\"")
+
+
+jmcomic.on_load(_check_jmcomic_version)
 
 DEFAULT_OPTION_FILE = Path(__file__).parent / "assets" / "option" / "option_workflow_download.yml"
+RESPONSE_CACHE_TTL = {"search": 600, "ranking": 3600, "detail": 6 * 3600}  # 各接口缓存有效期（秒）
+RESPONSE_CACHE_STALE = 24 * 3600  # 过期后仍可先返回旧数据、同时后台刷新的时长
+SMALL_JOB_CHAPTERS = 5  # 不超过该章节数的范围下载在调度时优先
+IMAGE_SUFFIXES = ('.jpg', '.jpeg', '.png', '.gif', '.webp')
+STORED_SUFFIXES = IMAGE_SUFFIXES + ('.pdf', '.zip')  # 已压缩的文件写入 ZIP 时不再 deflate
+BATCH_DETAIL_CONCURRENCY = 5  # 批量下载时同时获取详情的本子数
+PART_MARKER = ".part"  # 下载中的临时图片：00001.part.jpg
+METRIC_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)  # 耗时直方图的桶上界（秒）
+STORAGE_DIRS = {"pdfs", "zips", "covers", "logs", "manifests"}  # 下载目录中不是本子的子目录
+VOLUME_QUALITY_STEP = 15  # 分卷超出大小上限时每次降低的 JPEG 质量
+VOLUME_MIN_QUALITY = 40  # 降质重试的最低质量
+VOLUME_FALLBACK_MAX_SIZE = 1280  # 最低质量仍超限时额外缩小到的最长边
+STRIP_MIN_ASPECT = 3  # 高宽比超过该值的图片视为条漫长图，转码时切成多页
+STRIP_TILE_ASPECT = 1.5  # 长图切出的每页的高宽比
+DECODE_BYTES_PER_PIXEL = 8  # 估算解码内存：RGBA 位图加一份转换/裁切副本
+DOMAIN_HEALTH_WINDOW = 20  # 每个域名保留的最近请求/探测结果数
+DOMAIN_UNHEALTHY_RATE = 0.5  # 最近失败率达到该值的域名排到未探测过的域名之后
+WARMUP_RETRY_INTERVAL = 30  # 预热失败后至少间隔该秒数才再次尝试
+THROTTLE_WINDOW = 2.0  # 图片并发自适应的采样窗口（秒）
+THROTTLE_GAIN = 0.05  # 吞吐变化超过该比例才视为提升/下降
+THROTTLE_COOLDOWN = 2.0  # 被限流（429）后暂停发起新图片请求的秒数
+PROGRESS_WINDOW = 10  # 下载速度与剩余时间按最近该秒数内完成的图片估算
+PREFETCH_CHECK_INTERVAL = 60  # 预取循环检查空闲时段与负载的间隔（秒）
+PREFETCH_IDLE_SECONDS = 300  # 最近一次下载请求之后至少空闲该秒数才开始预取
+PREFETCH_BUDGET_SHARE = 0.8  # 预取只使用容量上限的该比例，不会因预取淘汰用户下载的内容
+PREFETCH_USER = "prefetch"
+SHUTDOWN_TIMEOUT = 10  # 卸载时等待后台任务退出的最长秒数
+EXIF_ORIENTATION = 0x0112  # EXIF 方向标签，1 为正常方向
+
+
+def _exif_orientation(img) -> int:
+    try:
+        return int(img.getexif().get(EXIF_ORIENTATION, 1))
+    except Exception:
+        return 1
+
+
+def _oriented_size(img) -> Tuple[int, int]:
+    """按 EXIF 方向旋转后的 (宽, 高)"""
+    width, height = img.size
+    return (height, width) if _exif_orientation(img) in (5, 6, 7, 8) else (width, height)
+
+
+def _can_passthrough(img, max_size: int) -> bool:
+    """可无损直接嵌入 PDF 的页面：RGB/灰度 JPEG、无需按 EXIF 旋转，且尺寸不超过 max_size。
+    PDF 中嵌入的 JPEG 不会按 EXIF 方向显示，带方向标签的图片需转码"""
+    if img.format != 'JPEG' or img.mode not in ('RGB', 'L') or _exif_orientation(img) != 1:
+        return False
+    return max_size <= 0 or max(img.size) <= max_size
+
+
+def _tile_bounds(width: int, height: int) -> List[int]:
+    """条漫长图按 STRIP_TILE_ASPECT 的页面比例均分，返回各页的分界纵坐标；普通图片返回 [0, height]"""
+    if height <= width * STRIP_MIN_ASPECT:
+        return [0, height]
+    count = math.ceil(height / max(1, width * STRIP_TILE_ASPECT))
+    return [height * i // count for i in range(count + 1)]
+
+
+def _draft_reduce(fmt: Optional[str], width: int, height: int, max_size: int, max_pixels: int = 0) -> int:
+    """JPEG 需要缩小时可直接按 1/2、1/4、1/8 解码，返回可用的最大缩小倍数；
+    整张解码超出 max_pixels 时继续加大倍数，直到放得下或已到 1/8"""
+    if fmt != 'JPEG':
+        return 1
+    reduce = 1
+    if max_size > 0:
+        bounds = _tile_bounds(width, height)
+        page_side = max(width, max(b - a for a, b in zip(bounds, bounds[1:])))
+        while reduce < 8 and page_side // (reduce * 2) >= max_size:
+            reduce *= 2
+    while max_pixels and reduce < 8 and (width // reduce) * (height // reduce) > max_pixels:
+        reduce *= 2
+    return reduce
+
+
+def _decode_cost(src: str, max_size: int, passthrough: bool, max_pixels: int = 0) -> int:
+    """只读取文件头，估算转码 src 时解码出的像素数；可直通的页面不解码，返回 0"""
+    try:
+        with PILImage.open(src) as img:
+            if passthrough and _can_passthrough(img, max_size):
+                return 0
+            width, height = _oriented_size(img)
+            reduce = _draft_reduce(img.format, width, height, max_size, max_pixels)
+    except Exception:
+        # 打不开的图片由转码任务报告错误
+        return 0
+    return (width // reduce) * (height // reduce)
+
+
+def _transcode_page(src: str, dst: str, quality: int, max_size: int, passthrough: bool = False,
+                    max_pixels: int = 0) -> List[str]:
+    """在进程池中执行：将单张图片转为 RGB JPEG，返回输出的页面路径；可直通的页面直接返回原路径。
+    条漫长图切成多页逐页处理，JPEG 需要缩小时以 draft 模式按比例解码，不生成原尺寸位图；
+    裁切前整张图片都会解码，因此整张超出 max_pixels 的 JPEG 会以更小的比例解码；带 EXIF 方向的图片先旋转到正常方向"""
+    with PILImage.open(src) as img:
+        if passthrough and _can_passthrough(img, max_size):
+            return [src]
+        width, height = _oriented_size(img)
+        bounds = _tile_bounds(width, height)
+        reduce = _draft_reduce(img.format, width, height, max_size, max_pixels)
+        if reduce > 1:
+            img.draft('RGB', (img.size[0] // reduce, img.size[1] // reduce))
+        oriented = PILImageOps.exif_transpose(img) if _exif_orientation(img) != 1 else img
+        ratio = oriented.size[1] / height
+        root, ext = os.path.splitext(dst)
+        outputs = []
+        for i, (top, bottom) in enumerate(zip(bounds, bounds[1:])):
+            page = oriented
+            if len(bounds) > 2:
+                page = oriented.crop((0, round(top * ratio), oriented.size[0], round(bottom * ratio)))
+            if page.mode != 'RGB':
+                page = page.convert('RGB')
+            if max_size > 0:
+                page.thumbnail((max_size, max_size), PILImage.Resampling.LANCZOS)
+            out = dst if len(bounds) == 2 else f"{root}_{i + 1}{ext}"
+            page.save(out, "JPEG", quality=quality, optimize=True)
+            outputs.append(out)
+    return outputs
+
+
+def _parse_split(value) -> Optional[Any]:
+    """--split 参数：chapter（或不带值）按章节分卷，数字（可带 MB 后缀）按该大小分卷"""
+    if value is None:
+        return None
+    if value is True:
+        return "chapter"
+    text = str(value).strip().lower()
+    if text in ("chapter", "ch"):
+        return "chapter"
+    if text.endswith("mb"):
+        text = text[:-2]
+    elif text.endswith("m"):
+        text = text[:-1]
+    try:
+        mb = float(text)
+    except ValueError:
+        raise JmTaskError(f"无效的分卷参数: {value}，可用 --split=chapter 或 --split=50MB")
+    if mb <= 0:
+        raise JmTaskError("分卷大小必须大于 0")
+    return int(mb * 1024 * 1024)
+
+
+def _format_bytes(size: float) -> str:
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024 or unit == "GB":
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+
+
+def _format_duration(seconds: float) -> str:
+    if seconds < 60:
+        return f"{max(1, round(seconds))} 秒"
+    if seconds < 3600:
+        return f"{round(seconds / 60)} 分钟"
+    return f"{seconds / 3600:.1f} 小时"
+
+
+def _parse_windows(value: str) -> List[Tuple[int, int]]:
+    """解析 "02:00-08:00,13:00-14:00" 形式的时段，返回以分钟计的 (开始, 结束)；结束早于开始表示跨越零点"""
+    windows = []
+    for item in (v.strip() for v in value.split(",") if v.strip()):
+        match = re.fullmatch(r"(\d{1,2}):(\d{2})\s*-\s*(\d{1,2}):(\d{2})", item)
+        if not match:
+            raise ValueError(f"无效的时段: {item}，应为 HH:MM-HH:MM")
+        h1, m1, h2, m2 = map(int, match.groups())
+        if h1 > 24 or h2 > 24 or m1 > 59 or m2 > 59:
+            raise ValueError(f"无效的时段: {item}")
+        windows.append((h1 * 60 + m1, h2 * 60 + m2))
+    return windows
+
+
+def _in_windows(windows: List[Tuple[int, int]], minute: int) -> bool:
+    for start, end in windows:
+        if start <= end and start <= minute < end:
+            return True
+        if start > end and (minute >= start or minute < end):
+            return True
+    return False
+
+
+def _hit_rate(hits: int, misses: int) -> str:
+    total = hits + misses
+    return f"{hits * 100 / total:.0f}%（{hits}/{total}）" if total else "暂无数据"
+
+
+def _part_path(path: str) -> str:
+    # 保留原后缀，jmcomic 解码图片时按后缀决定保存格式
+    root, ext = os.path.splitext(path)
+    return f"{root}{PART_MARKER}{ext}"
+
+
+def _is_throttled(exc: BaseException) -> bool:
+    """请求是否因频率限制失败：jmcomic 的错误信息中带有 http 状态码"""
+    text = str(exc)
+    return "429" in text or "too many requests" in text.lower()
+
+
+def _image_intact(path: str) -> bool:
+    try:
+        with PILImage.open(path) as img:
+            img.verify()
+        return True
+    except Exception:
+        return False
+
+
+class JmTaskError(Exception):
+    """可直接展示给用户的任务错误"""
+
+
+class ScheduledJob:
+    __slots__ = ("key", "label", "group", "user", "small", "factory", "future", "task", "enqueued_at", "started_at")
+
+    def __init__(self, key: str, label: str, group: str, user: str, small: bool, factory, future: asyncio.Future):
+        self.key = key
+        self.label = label
+        self.group = group
+        self.user = user
+        self.small = small
+        self.factory = factory
+        self.future = future
+        self.task: Optional[asyncio.Future] = None
+        self.enqueued_at = time.monotonic()
+        self.started_at = 0.0
+
+
+class DownloadScheduler:
+    """下载任务调度：全局并发上限 + 单用户并发上限，按群、再按用户轮转出队，小范围下载优先"""
+
+    def __init__(self, max_workers: int, per_user: int):
+        self.max_workers = max(1, max_workers)
+        self.per_user = max(1, per_user)
+        # group -> user -> 排队任务，OrderedDict 的顺序即轮转顺序
+        self._groups: "OrderedDict[str, OrderedDict[str, deque]]" = OrderedDict()
+        self._user_running: Dict[str, int] = {}
+        self._running: List[ScheduledJob] = []
+        self._avg_duration = 60.0
+
+    def submit(self, key: str, label: str, group: str, user: str, small: bool, factory) -> asyncio.Future:
+        """factory 为无参协程函数；返回的 Future 在任务完成时得到相同的结果或异常。
+        取消返回的 Future 会取消对应任务：运行中的任务被中断，排队中的任务移出队列"""
+        job = ScheduledJob(key, label, group, user, small, factory, asyncio.get_running_loop().create_future())
+        self._groups.setdefault(group, OrderedDict()).setdefault(user, deque()).append(job)
+        job.future.add_done_callback(functools.partial(self._on_future_done, job))
+        self._dispatch()
+        return job.future
+
+    def _on_future_done(self, job: ScheduledJob, future: asyncio.Future):
+        if not future.cancelled():
+            return
+        if job.task is not None:
+            job.task.cancel()
+            return
+        users = self._groups.get(job.group)
+        queue = users.get(job.user) if users is not None else None
+        if queue is None or job not in queue:
+            return
+        queue.remove(job)
+        if not queue:
+            del users[job.user]
+        if not users:
+            del self._groups[job.group]
+
+    def _dispatch(self):
+        while len(self._running) < self.max_workers:
+            job = self._pick(self._groups, self._user_running)
+            if job is None:
+                return
+            self._start(job)
+
+    def _pick(self, groups, user_running: Optional[Dict[str, int]]) -> Optional[ScheduledJob]:
+        """先在所有用户的小任务中轮转挑选，没有再挑普通任务；user_running 为 None 时忽略单用户上限"""
+        for small_only in (True, False):
+            for group in list(groups):
+                users = groups[group]
+                for user in list(users):
+                    if user_running is not None and user_running.get(user, 0) >= self.per_user:
+                        continue
+                    queue = users[user]
+                    job = next((j for j in queue if j.small), None) if small_only else queue[0]
+                    if job is None:
+                        continue
+                    queue.remove(job)
+                    if queue:
+                        users.move_to_end(user)
+                    else:
+                        del users[user]
+                    if users:
+                        groups.move_to_end(group)
+                    else:
+                        del groups[group]
+                    return job
+        return None
+
+    def _start(self, job: ScheduledJob):
+        job.started_at = time.monotonic()
+        self._running.append(job)
+        self._user_running[job.user] = self._user_running.get(job.user, 0) + 1
+        job.task = asyncio.ensure_future(job.factory())
+        job.task.add_done_callback(functools.partial(self._finish, job))
+
+    def _finish(self, job: ScheduledJob, task: asyncio.Future):
+        self._running.remove(job)
+        self._user_running[job.user] -= 1
+        if self._user_running[job.user] <= 0:
+            del self._user_running[job.user]
+        self._avg_duration = self._avg_duration * 0.8 + (time.monotonic() - job.started_at) * 0.2
+        if not job.future.done():
+            if task.cancelled():
+                job.future.cancel()
+            elif task.exception() is not None:
+                job.future.set_exception(task.exception())
+            else:
+                job.future.set_result(task.result())
+        self._dispatch()
+
+    def queued(self) -> List[ScheduledJob]:
+        """按预计出队顺序返回排队中的任务（忽略单用户上限的近似顺序）"""
+        groups = OrderedDict((g, OrderedDict((u, deque(q)) for u, q in users.items())) for g, users in self._groups.items())
+        order = []
+        while True:
+            job = self._pick(groups, None)
+            if job is None:
+                return order
+            order.append(job)
+
+    def running(self) -> List[ScheduledJob]:
+        return list(self._running)
+
+    def position(self, key: str) -> int:
+        """返回任务在队列中的位置（从1开始），0 表示已在运行或不存在"""
+        for i, job in enumerate(self.queued(), 1):
+            if job.key == key:
+                return i
+        return 0
+
+    def estimate_wait(self, position: int) -> float:
+        if position <= 0:
+            return 0.0
+        return ((position - 1) // self.max_workers + 1) * self._avg_duration
+
+    def cancel_all(self):
+        for users in self._groups.values():
+            for queue in users.values():
+                for job in queue:
+                    job.future.cancel()
+        self._groups.clear()
+
+
+class AlbumManifest:
+    """本子下载清单：记录每个章节已完成图片的大小与哈希，已完整的章节在后续下载中直接跳过
+
+    进度以追加写的方式记入 <album_id>.journal，重启或中断后通过快照 + 日志重放恢复；
+    日志过长或任务完成时合并进 <album_id>.json 快照。
+    """
+
+    COMPACT_THRESHOLD = 2000
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.journal_path = path.with_suffix(".journal")
+        self.album_id = path.stem
+        self._lock = threading.Lock()
+        self._photos: Dict[str, Dict[str, Any]] = {}
+        self._request: Optional[Dict[str, Any]] = None
+        self._journal_lines = 0
+        self._torn_tail = False
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self._photos = data.get("photos", {})
+            self._request = data.get("request")
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning(f"读取下载清单失败，将重新记录 {path}: {e}")
+        self._replay()
+
+    def _replay(self):
+        try:
+            with open(self.journal_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    self._torn_tail = not line.endswith("\n")
+                    try:
+                        self._apply(json.loads(line))
+                    except ValueError:
+                        # 崩溃时最后一行可能只写了一半，忽略即可
+                        continue
+                    self._journal_lines += 1
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning(f"重放下载日志失败 {self.journal_path}: {e}")
+
+    def _photo(self, photo_id: str) -> Dict[str, Any]:
+        return self._photos.setdefault(str(photo_id), {"dir": "", "images": {}, "complete": False})
+
+    def _apply(self, rec: Dict[str, Any]):
+        op = rec.get("op")
+        if op == "image":
+            photo = self._photo(rec["photo"])
+            photo["dir"] = rec["dir"]
+            photo["images"][rec["name"]] = [rec["size"], rec["sha1"]]
+        elif op == "photo":
+            photo = self._photo(rec["photo"])
+            photo["total"] = rec["total"]
+            photo["complete"] = rec["complete"]
+        elif op == "request":
+            self._request = rec["request"]
+        elif op == "finish":
+            self._request = None
+
+    def _append(self, rec: Dict[str, Any], durable: bool = False):
+        """调用方需持有锁；durable 为 True 时 fsync，保证断电后记录仍在"""
+        self._apply(rec)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.journal_path, "a", encoding="utf-8") as f:
+            if self._torn_tail:
+                # 上次崩溃留下的半行需要先换行，否则新记录会和它粘在一起
+                f.write("\n")
+                self._torn_tail = False
+            f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+            if durable:
+                f.flush()
+                os.fsync(f.fileno())
+        self._journal_lines += 1
+        if self._journal_lines >= self.COMPACT_THRESHOLD:
+            self._compact()
+
+    def _compact(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"photos": self._photos, "request": self._request}, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        # 快照落盘后再清空日志；两步之间崩溃只会导致重复重放，结果不变
+        open(self.journal_path, "w").close()
+        self._journal_lines = 0
+
+    def photo_complete(self, photo_id: str) -> bool:
+        """章节已完整且本地文件大小与记录一致（只做本地校验，不访问网络）"""
+        with self._lock:
+            photo = self._photos.get(str(photo_id))
+            if not photo or not photo.get("complete"):
+                return False
+            save_dir = photo["dir"]
+            images = list(photo["images"].items())
+        for name, (size, _) in images:
+            try:
+                if os.path.getsize(os.path.join(save_dir, name)) != size:
+                    return False
+            except OSError:
+                return False
+        return True
+
+    def photo_dir(self, photo_id: str) -> Optional[str]:
+        """章节图片实际保存的目录；尚未记录任何图片时返回 None"""
+        with self._lock:
+            photo = self._photos.get(str(photo_id))
+            return (photo["dir"] or None) if photo else None
+
+    def photo_images(self, photo_id: str) -> int:
+        with self._lock:
+            photo = self._photos.get(str(photo_id))
+            return len(photo["images"]) if photo else 0
+
+    def image_recorded(self, photo_id: str, img_path: str) -> bool:
+        """图片已记录且本地文件大小与记录一致"""
+        with self._lock:
+            photo = self._photos.get(str(photo_id))
+            record = photo["images"].get(os.path.basename(img_path)) if photo else None
+        if record is None:
+            return False
+        try:
+            return os.path.getsize(img_path) == record[0]
+        except OSError:
+            return False
+
+    def record_image(self, photo_id: str, img_path: str):
+        if self.image_recorded(photo_id, img_path):
+            return
+        h = hashlib.sha1()
+        with open(img_path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+        rec = {
+            "op": "image",
+            "photo": str(photo_id),
+            "dir": os.path.dirname(img_path),
+            "name": os.path.basename(img_path),
+            "size": os.path.getsize(img_path),
+            "sha1": h.hexdigest(),
+        }
+        with self._lock:
+            self._append(rec)
+
+    def finish_photo(self, photo_id: str, total: int):
+        with self._lock:
+            done = len(self._photo(photo_id)["images"])
+            self._append({"op": "photo", "photo": str(photo_id), "total": total, "complete": total > 0 and done >= total}, durable=True)
+
+    def begin_request(self, request: Dict[str, Any]):
+        """记录正在进行的下载请求，中断后可通过 /jm resume 按原参数继续"""
+        with self._lock:
+            self._append({"op": "request", "request": request}, durable=True)
+
+    def finish_request(self):
+        with self._lock:
+            self._append({"op": "finish"})
+            self._compact()
+
+    @property
+    def pending_request(self) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return dict(self._request) if self._request else None
+
+    def progress(self) -> Tuple[int, int]:
+        """返回 (已完整章节数, 已记录图片数)"""
+        with self._lock:
+            return (sum(1 for p in self._photos.values() if p.get("complete")),
+                    sum(len(p["images"]) for p in self._photos.values()))
+
+
+class AtomicImageClient:
+    """包装 JmcomicClient：图片先写入临时文件，完整写完后再原子改名，中断不会留下半张图片；
+    给定 throttle 时每张图片的下载都受其并发与带宽控制。失败由 DomainHealth 在每次请求失败时上报给 throttle，
+    这里不再重复上报，否则一次失败会让并发窗口减半两次"""
+
+    def __init__(self, client, throttle: Optional['DownloadThrottle'] = None):
+        self._client = client
+        self._throttle = throttle
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+    def download_by_image_detail(self, image, img_save_path, **kwargs):
+        part_path = _part_path(img_save_path)
+        try:
+            if self._throttle is None:
+                self._client.download_by_image_detail(image, part_path, **kwargs)
+            else:
+                with self._throttle.slot():
+                    self._client.download_by_image_detail(image, part_path, **kwargs)
+                    self._throttle.on_success(os.path.getsize(part_path))
+            os.replace(part_path, img_save_path)
+        finally:
+            if os.path.exists(part_path):
+                os.remove(part_path)
+
+
+class DownloadThrottle:
+    """所有下载共享的图片并发与带宽控制。
+
+    并发上限按 AIMD 调整：每个采样窗口结束时，若期间没有失败、并发已用满且吞吐比上一窗口提升，上限加一
+    （起步阶段翻倍，直到第一次失败或吞吐不再提升）；加一后吞吐反而下降则退回。请求失败时上限减半
+    （每个窗口最多一次），被限流（429）时另外暂停 THROTTLE_COOLDOWN 秒不发起新请求。带宽上限为令牌桶：图片下载完后按字节数扣减令牌，
+    不足时该线程占着并发名额等待，平均速度不超过 max_bytes_per_s。
+    """
+
+    def __init__(self, max_limit: int, max_bytes_per_s: float = 0, adaptive: bool = True,
+                 window: float = THROTTLE_WINDOW):
+        self.max_limit = max(1, max_limit)
+        self.rate = max_bytes_per_s
+        self.adaptive = adaptive
+        self.window = window
+        self.limit = 0  # 0 表示尚未开始，首个下载以 option 中的图片线程数为起点
+        self.throughput = 0.0
+        self.errors = 0
+        self.throttled = 0
+        self._cond = threading.Condition()
+        self._active = 0
+        self._paused_until = 0.0
+        self._window_start = time.monotonic()
+        self._window_bytes = 0
+        self._window_errors = 0
+        self._window_peak = 0
+        self._last_step = 0
+        self._slow_start = True
+        self._bucket_lock = threading.Lock()
+        self._tokens = max_bytes_per_s
+        self._stamp = time.monotonic()
+
+    def start_at(self, threads: int):
+        with self._cond:
+            if self.limit == 0:
+                self.limit = max(1, min(self.max_limit, threads))
+
+    @property
+    def active(self) -> int:
+        return self._active
+
+    @contextlib.contextmanager
+    def slot(self):
+        with self._cond:
+            while self.adaptive:
+                wait = self._paused_until - time.monotonic()
+                if wait <= 0 and self._active < (self.limit or self.max_limit):
+                    break
+                self._cond.wait(wait if wait > 0 else None)
+            self._active += 1
+            self._window_peak = max(self._window_peak, self._active)
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._active -= 1
+                self._cond.notify()
+
+    def on_success(self, nbytes: int):
+        self._consume(nbytes)
+        with self._cond:
+            self._window_bytes += nbytes
+            self._adapt()
+
+    def on_error(self, exc: BaseException):
+        throttled = _is_throttled(exc)
+        with self._cond:
+            now = time.monotonic()
+            if now - self._window_start >= self.window:
+                self._reset_window(now)
+            self.errors += 1
+            if throttled:
+                self.throttled += 1
+                self._paused_until = now + THROTTLE_COOLDOWN
+            if self.adaptive and not self._window_errors and self.limit:
+                self.limit = max(1, self.limit // 2)
+                self._last_step = 0
+                self._slow_start = False
+            self._window_errors += 1
+
+    def _adapt(self):
+        """调用方需持有锁"""
+        now = time.monotonic()
+        elapsed = now - self._window_start
+        if elapsed < self.window:
+            return
+        if elapsed < self.window * 3 and self.adaptive and not self._window_errors and self.limit:
+            throughput = self._window_bytes / elapsed
+            if self._last_step > 0 and throughput < self.throughput * (1 - THROTTLE_GAIN):
+                self.limit = max(1, self.limit - self._last_step)
+                self._last_step = -1
+                self._slow_start = False
+            elif throughput > self.throughput * (1 + THROTTLE_GAIN) and self._window_peak >= self.limit:
+                if self.limit < self.max_limit:
+                    step = self.limit if self._slow_start else 1
+                    step = min(step, self.max_limit - self.limit)
+                    self.limit += step
+                    self._last_step = step
+                    self._cond.notify_all()
+            else:
+                self._last_step = 0
+                if self._window_peak >= self.limit:
+                    self._slow_start = False
+            self.throughput = throughput
+        elif elapsed < self.window * 3:
+            self.throughput = self._window_bytes / elapsed
+        # 空闲太久的窗口只重新开始计时，不据此调整
+        self._reset_window(now)
+
+    def _reset_window(self, now: float):
+        self._window_start = now
+        self._window_bytes = 0
+        self._window_errors = 0
+        self._window_peak = self._active
+
+    def _consume(self, nbytes: int):
+        """令牌桶：桶容量为一秒的额度，可以透支，透支部分由本线程等待补足"""
+        if self.rate <= 0:
+            return
+        with self._bucket_lock:
+            now = time.monotonic()
+            self._tokens = min(self.rate, self._tokens + (now - self._stamp) * self.rate) - nbytes
+            self._stamp = now
+            wait = -self._tokens / self.rate
+        if wait > 0:
+            time.sleep(wait)
+
+    def summary(self) -> Dict[str, float]:
+        with self._cond:
+            return {"limit": self.limit, "active": self._active, "throughput": self.throughput,
+                    "errors": self.errors, "throttled": self.throttled}
+
+
+class DownloadProgress:
+    """一次下载的进度，由下载器回调更新：章节与图片计数、按秒分桶的最近吞吐。
+
+    每张图片只做常数次计数更新，桶数固定为 PROGRESS_WINDOW 个，上千页的本子也没有额外开销。
+    章节的图片数在获取章节详情后才知道，尚未获取的章节按已知章节的平均图片数估算总数。
+    """
+
+    def __init__(self, album_id: str, fmt: str):
+        self.album_id = album_id
+        self.fmt = fmt
+        self.started_at = time.monotonic()
+        self.finished = False
+        self.chapters = 0  # 本次下载的章节数（已按范围过滤）
+        self.chapters_known = 0  # 已知图片数的章节
+        self.total = 0  # 已知章节的图片总数
+        self.done = 0
+        self.cached = 0
+        self.bytes = 0
+        self._buckets: deque = deque(maxlen=PROGRESS_WINDOW)  # [秒, 新下载图片数, 字节数]
+        self._lock = threading.Lock()
+
+    def expect_chapters(self, count: int):
+        with self._lock:
+            self.chapters = count
+
+    def add_chapter(self, images: int, done: int = 0):
+        """章节详情就绪；done 为无需下载、直接计入完成的图片数（清单中已完整的章节）"""
+        with self._lock:
+            self.chapters_known += 1
+            self.total += images
+            self.done += done
+            self.cached += done
+
+    def image_done(self, nbytes: int = 0, cached: bool = False):
+        second = int(time.monotonic())
+        with self._lock:
+            self.done += 1
+            if cached:
+                self.cached += 1
+                return
+            self.bytes += nbytes
+            if self._buckets and self._buckets[-1][0] == second:
+                bucket = self._buckets[-1]
+                bucket[1] += 1
+                bucket[2] += nbytes
+            else:
+                self._buckets.append([second, 1, nbytes])
+
+    def finish(self):
+        self.finished = True
+
+    def snapshot(self) -> Dict[str, Any]:
+        """返回 done、total（未知章节按平均值估算）、exact、speed（字节/秒）、eta（秒，无法估算时为 None）"""
+        now = time.monotonic()
+        with self._lock:
+            total = self.total
+            exact = self.chapters_known >= self.chapters
+            if not exact and self.chapters_known:
+                total = round(self.total / self.chapters_known * self.chapters)
+            recent = [b for b in self._buckets if b[0] > now - PROGRESS_WINDOW]
+            done = self.done
+        speed = eta = None
+        if recent:
+            span = max(1.0, now - max(recent[0][0], self.started_at))
+            speed = sum(b[2] for b in recent) / span
+            rate = sum(b[1] for b in recent) / span
+            if total > done and (exact or self.chapters_known):
+                eta = (total - done) / rate
+        return {"done": done, "total": max(total, done), "exact": exact, "speed": speed, "eta": eta,
+                "elapsed": now - self.started_at}
+
+    def describe(self) -> str:
+        if self.finished:
+            return f"{self.album_id}：下载完成，正在生成 {self.fmt.upper()}"
+        snap = self.snapshot()
+        if not snap["total"]:
+            return f"{self.album_id}：正在获取章节信息"
+        total = snap["total"] if snap["exact"] else f"约 {snap['total']}"
+        text = f"{self.album_id}：已下载 {snap['done']}/{total} 张（{snap['done'] * 100 // snap['total']}%）"
+        if snap["speed"] is not None:
+            text += f"，{_format_bytes(snap['speed'])}/s"
+        if snap["eta"] is not None:
+            text += f"，预计还需 {_format_duration(snap['eta'])}"
+        return text
+
+
+class OptionRegistry:
+    """JmOption / JmClient 复用：按 (option 文件, 命令覆盖项) 缓存，option 文件修改后自动重新加载"""
+
+    OVERRIDE_KEYS = ('dir_rule', 'client_impl', 'suffix')
+
+    def __init__(self, option_file: Optional[str], base_dir: Path, apply_overrides, domain_retry_strategy=None):
+        self.option_file = option_file
+        self.base_dir = base_dir
+        self._apply_overrides = apply_overrides
+        self._domain_retry_strategy = domain_retry_strategy
+        self._lock = threading.Lock()
+        self._mtime: Optional[float] = None
+        self._base: Optional['JmOption'] = None
+        self._options: Dict[tuple, 'JmOption'] = {}
+        self._clients: Dict[tuple, Any] = {}
+
+    @classmethod
+    def make_key(cls, overrides: Optional[dict]) -> tuple:
+        overrides = overrides or {}
+        return tuple(overrides.get(k) for k in cls.OVERRIDE_KEYS)
+
+    def _option_mtime(self) -> Optional[float]:
+        if self.option_file and Path(self.option_file).exists():
+            return os.path.getmtime(self.option_file)
+        return None
+
+    def _ensure_fresh(self):
+        """调用方需持有锁"""
+        mtime = self._option_mtime()
+        if self._base is not None and mtime == self._mtime:
+            return
+        if mtime is not None:
+            option = jmcomic.create_option_by_file(self.option_file)
+        else:
+            option = jmcomic.JmOption.default()
+        option.dir_rule.base_dir = str(self.base_dir)
+        if self._base is not None:
+            logger.info("option 配置文件已变更，重新加载")
+        self._base = option
+        self._mtime = mtime
+        self._options.clear()
+        self._clients.clear()
+
+    @staticmethod
+    def _copy(option: 'JmOption') -> 'JmOption':
+        if hasattr(option, 'copy_option'):
+            return option.copy_option()
+        return jmcomic.JmOption.construct(option.deconstruct())
+
+    def get_option(self, overrides: Optional[dict] = None) -> 'JmOption':
+        """返回共享的 JmOption，调用方不得修改；需要修改时使用 clone_option"""
+        key = self.make_key(overrides)
+        with self._lock:
+            self._ensure_fresh()
+            option = self._options.get(key)
+            if option is None:
+                if any(key):
+                    option = self._copy(self._base)
+                    self._apply_overrides(option, overrides)
+                else:
+                    option = self._base
+                self._options[key] = option
+            return option
+
+    def clone_option(self, overrides: Optional[dict] = None) -> 'JmOption':
+        """返回独立副本，可随意修改而不影响其他请求"""
+        return self._copy(self.get_option(overrides))
+
+    def get_client(self, overrides: Optional[dict] = None):
+        """返回共享的 JmClient，连接池、cookies 与域名选择在请求之间复用"""
+        option = self.get_option(overrides)
+        key = self.make_key(overrides)
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None:
+                client = self.new_client(option)
+                self._clients[key] = client
+            return client
+
+    def new_client(self, option: 'JmOption'):
+        """创建新的 JmClient；设置了 domain_retry_strategy 时由它负责域名排序与切换"""
+        if self._domain_retry_strategy is None:
+            return option.build_jm_client()
+        return option.new_jm_client(domain_retry_strategy=self._domain_retry_strategy)
+
+
+class DomainHealth:
+    """镜像域名健康度：滚动记录各域名最近的延迟与成败，为每次请求按健康度排序域名。
+
+    request 作为 jmcomic 客户端的 domain_retry_strategy 使用：每个域名失败一次就切换到下一个，
+    一轮都失败后再开始下一轮，总轮数为 retry_times + 1，与 jmcomic 默认的总尝试次数相同；
+    timeout 限制单次 API/网页请求，不必等满默认超时才切换。图片 URL 自带域名，不参与排序与统计。
+    """
+
+    def __init__(self, timeout: float = 10, window: int = DOMAIN_HEALTH_WINDOW, scheme: str = "https",
+                 on_image_error=None):
+        self.timeout = timeout
+        self.window = window
+        self.scheme = scheme
+        # 图片请求每次失败（包括随后会重试的）都回调 on_image_error(exc)，供并发控制及时退让
+        self.on_image_error = on_image_error
+        self.failovers = 0
+        self._lock = threading.Lock()
+        self._samples: Dict[str, deque] = {}
+
+    def record(self, domain: str, latency: Optional[float]):
+        """latency 为 None 表示失败"""
+        with self._lock:
+            samples = self._samples.get(domain)
+            if samples is None:
+                samples = self._samples[domain] = deque(maxlen=self.window)
+            samples.append(latency)
+
+    def stats(self, domain: str) -> Optional[Tuple[float, float, int]]:
+        """(成功请求的平均延迟, 失败率, 样本数)；没有样本时返回 None"""
+        with self._lock:
+            samples = list(self._samples.get(domain, ()))
+        if not samples:
+            return None
+        ok = [latency for latency in samples if latency is not None]
+        avg = sum(ok) / len(ok) if ok else (self.timeout or 60)
+        return avg, 1 - len(ok) / len(samples), len(samples)
+
+    def rank(self, domains: List[str]) -> List[str]:
+        """健康的域名按延迟（失败率折算为超时惩罚）排序，其次是未探测过的域名（保持配置顺序），最后是不健康的域名"""
+        def key(item):
+            index, domain = item
+            stats = self.stats(domain)
+            if stats is None:
+                return 1, 0, index
+            avg, error_rate, _ = stats
+            score = avg + error_rate * (self.timeout or 60)
+            return (2 if error_rate >= DOMAIN_UNHEALTHY_RATE else 0), score, index
+        return [domain for _, domain in sorted(enumerate(domains), key=key)]
+
+    def probe(self, domain: str) -> Optional[float]:
+        """HEAD 请求域名首页并记录结果；收到 5xx 以外的任何响应都算可达（被 CDN 拒绝的 403 也说明线路通）"""
+        import urllib.error
+        import urllib.request
+        request = urllib.request.Request(f"{self.scheme}://{domain}/", method="HEAD",
+                                         headers={"User-Agent": "Mozilla/5.0"})
+        start = time.monotonic()
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout or 60):
+                pass
+            latency = time.monotonic() - start
+        except urllib.error.HTTPError as e:
+            latency = time.monotonic() - start if e.code < 500 else None
+        except Exception:
+            latency = None
+        self.record(domain, latency)
+        return latency
+
+    def request(self, client, request=None, url: Optional[str] = None, is_image: bool = False, **kwargs):
+        if request is None:
+            # jmcomic 在创建客户端时会以 strategy(client) 调用一次：按当前健康度排好初始顺序
+            client.domain_list = self.rank(list(client.domain_list))
+            return None
+        if not url.startswith('/'):
+            return self._request_fixed(client, request, url, is_image, **kwargs)
+        if self.timeout:
+            kwargs.setdefault('timeout', self.timeout)
+        errors = []
+        for retry in range(client.retry_times + 1):
+            for domain in self.rank(client.domain_list):
+                jmcomic.JTC.raise_if_cancelled()
+                target = client.of_api_url(url, domain)
+                client.update_request_with_specify_domain(kwargs, domain, is_image)
+                start = time.monotonic()
+                try:
+                    resp = client.raise_if_resp_should_retry(request(target, **kwargs), is_image)
+                except Exception as e:
+                    self.record(domain, None)
+                    client.before_retry(e, kwargs, retry, target)
+                    errors.append({'domain': domain, 'url': target, 'retry': retry, 'error': e})
+                    continue
+                self.record(domain, time.monotonic() - start)
+                if errors:
+                    with self._lock:
+                        self.failovers += 1
+                return resp
+        return client.fallback(request, url, len(client.domain_list), 0, is_image, retry_errors=errors, **kwargs)
+
+    def _request_fixed(self, client, request, url: str, is_image: bool, **kwargs):
+        """URL 已包含域名（图片）：与 jmcomic 默认行为相同，原地重试 retry_times 次"""
+        errors = []
+        for retry in range(client.retry_times + 1):
+            jmcomic.JTC.raise_if_cancelled()
+            if is_image:
+                client.update_request_with_specify_domain(kwargs, None, is_image)
+            try:
+                return client.raise_if_resp_should_retry(request(url, **kwargs), is_image)
+            except Exception as e:
+                if is_image and self.on_image_error is not None:
+                    self.on_image_error(e)
+                if client.retry_times == 0:
+                    raise
+                client.before_retry(e, kwargs, retry, url)
+                errors.append({'domain': None, 'url': url, 'retry': retry, 'error': e})
+                if retry < client.retry_times and _is_throttled(e):
+                    # 被限流时立即重试只会继续被拒，按指数退避
+                    time.sleep(min(THROTTLE_COOLDOWN * 2 ** retry, 30))
+        return client.fallback(request, url, 0, 0, is_image, retry_errors=errors, **kwargs)
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            domains = list(self._samples)
+        result = {}
+        for domain in domains:
+            stats = self.stats(domain)
+            if stats is not None:
+                avg, error_rate, count = stats
+                result[domain] = {"latency": avg, "error_rate": error_rate, "samples": count}
+        return result
+
+
+class ResponseCache:
+    """搜索/排行榜/详情的响应缓存：内存 LRU，可选持久化到磁盘；过期不久的数据先返回再后台刷新"""
+
+    def __init__(self, max_entries: int, persist_path: Optional[Path] = None):
+        self.max_entries = max(1, max_entries)
+        self.persist_path = persist_path
+        self._lock = threading.Lock()
+        # key -> (过期时间戳, 数据)，顺序即最近使用顺序
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self.stats: Dict[str, Dict[str, int]] = {ep: {"hit": 0, "stale": 0, "miss": 0} for ep in RESPONSE_CACHE_TTL}
+        self._last_saved = 0.0
+        if persist_path is not None:
+            self._load()
+
+    @staticmethod
+    def make_key(endpoint: str, *params) -> str:
+        return f"{endpoint}:{json.dumps(params, ensure_ascii=False)}"
+
+    def get(self, key: str) -> Tuple[Optional[Any], bool]:
+        """返回 (数据, 是否新鲜)；不存在或过期太久返回 (None, False)"""
+        now = time.time()
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None, False
+            expires_at, value = item
+            if now > expires_at + RESPONSE_CACHE_STALE:
+                del self._entries[key]
+                return None, False
+            self._entries.move_to_end(key)
+            return value, now <= expires_at
+
+    def set(self, key: str, value: Any, ttl: float):
+        with self._lock:
+            self._entries[key] = (time.time() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def count(self, endpoint: str, kind: str):
+        with self._lock:
+            self.stats[endpoint][kind] += 1
+
+    def stats_snapshot(self) -> Dict[str, Dict[str, int]]:
+        with self._lock:
+            return {endpoint: dict(stats) for endpoint, stats in self.stats.items()}
+
+    def should_save(self, interval: float = 60) -> bool:
+        return self.persist_path is not None and time.time() - self._last_saved >= interval
+
+    def save(self):
+        if self.persist_path is None:
+            return
+        self._last_saved = time.time()
+        with self._lock:
+            data = [[k, exp, v] for k, (exp, v) in self._entries.items()]
+        tmp = self.persist_path.with_name(self.persist_path.name + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp, self.persist_path)
+
+    def _load(self):
+        try:
+            with open(self.persist_path, "r", encoding="utf-8") as f:
+                for key, expires_at, value in json.load(f):
+                    self._entries[key] = (expires_at, value)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning(f"读取响应缓存失败: {e}")
+
+
+class Metrics:
+    """轻量性能统计：各阶段耗时（固定桶直方图 + 最近样本用于分位数）与计数器，可导出为 Prometheus 文本格式。
+    记录只是一次加锁的累加，对下载热路径的开销可以忽略"""
+
+    def __init__(self, samples: int = 512):
+        self._lock = threading.Lock()
+        self._samples = samples
+        # stage -> [各桶计数..., 总次数, 总耗时]
+        self._histograms: Dict[str, List[float]] = {}
+        self._recent: Dict[str, deque] = {}
+        self.counters: Dict[str, float] = {}
+
+    @contextlib.contextmanager
+    def span(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        except (asyncio.CancelledError, concurrent.futures.CancelledError):
+            # 预取被打断、用户取消与卸载都会取消任务，单独计数，不算作错误
+            self.inc(f"{stage}_cancelled")
+            raise
+        except BaseException:
+            self.inc(f"{stage}_errors")
+            raise
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def observe(self, stage: str, seconds: float):
+        index = bisect.bisect_left(METRIC_BUCKETS, seconds)
+        with self._lock:
+            hist = self._histograms.get(stage)
+            if hist is None:
+                hist = self._histograms[stage] = [0] * (len(METRIC_BUCKETS) + 2)
+                self._recent[stage] = deque(maxlen=self._samples)
+            if index < len(METRIC_BUCKETS):
+                hist[index] += 1
+            hist[-2] += 1
+            hist[-1] += seconds
+            self._recent[stage].append(seconds)
+
+    def inc(self, name: str, value: float = 1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """每个阶段的次数、平均值与最近样本的 p50/p95/p99/最大值（秒）"""
+        with self._lock:
+            items = [(stage, hist[-2], hist[-1], sorted(self._recent[stage])) for stage, hist in self._histograms.items()]
+        result = {}
+        for stage, count, total, recent in items:
+            result[stage] = {"count": count, "avg": total / count, "max": recent[-1]}
+            for q in (50, 95, 99):
+                result[stage][f"p{q}"] = recent[min(len(recent) - 1, len(recent) * q // 100)]
+        return result
+
+    def prometheus(self, extra_counters: Optional[Dict[str, float]] = None,
+                   gauges: Optional[Dict[str, float]] = None) -> str:
+        with self._lock:
+            histograms = {stage: list(hist) for stage, hist in self._histograms.items()}
+            counters = dict(self.counters)
+        counters.update(extra_counters or {})
+        lines = [
+            "# HELP jmcomic_stage_seconds Time spent in each stage of the plugin.",
+            "# TYPE jmcomic_stage_seconds histogram",
+        ]
+        for stage, hist in sorted(histograms.items()):
+            cumulative = 0
+            for bound, count in zip(METRIC_BUCKETS, hist):
+                cumulative += count
+                lines.append(f'jmcomic_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+            lines.append(f'jmcomic_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {hist[-2]}')
+            lines.append(f'jmcomic_stage_seconds_sum{{stage="{stage}"}} {hist[-1]:.6f}')
+            lines.append(f'jmcomic_stage_seconds_count{{stage="{stage}"}} {hist[-2]}')
+        for name, value in sorted(counters.items()):
+            lines.append(f"# TYPE jmcomic_{name}_total counter")
+            lines.append(f"jmcomic_{name}_total {value:.15g}")
+        for name, value in sorted((gauges or {}).items()):
+            lines.append(f"# TYPE jmcomic_{name} gauge")
+            lines.append(f"jmcomic_{name} {value:.15g}")
+        return "\n".join(lines) + "\n"
+
+
+def _timed(stage: str):
+    """记录异步方法整体耗时"""
+    def decorator(method):
+        @functools.wraps(method)
+        async def wrapper(self, *args, **kwargs):
+            with self._metrics.span(stage):
+                return await method(self, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class StorageCatalog:
+    """下载目录的持久化索引（SQLite）：本子、章节、产物、封面的大小与访问时间，以及正在使用中的租约；
+    清理时直接查询索引，不再遍历目录、逐个 stat"""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS albums (
+            album_dir TEXT PRIMARY KEY, album_id TEXT, last_access REAL NOT NULL, hits INTEGER NOT NULL DEFAULT 0);
+        CREATE INDEX IF NOT EXISTS albums_id ON albums(album_id);
+        CREATE INDEX IF NOT EXISTS albums_access ON albums(last_access);
+        CREATE TABLE IF NOT EXISTS chapters (
+            chapter_dir TEXT PRIMARY KEY, album_dir TEXT NOT NULL, photo_id TEXT,
+            images INTEGER NOT NULL, size INTEGER NOT NULL);
+        CREATE INDEX IF NOT EXISTS chapters_album ON chapters(album_dir);
+        CREATE TABLE IF NOT EXISTS artifacts (
+            key TEXT PRIMARY KEY, album_id TEXT NOT NULL, album_dir TEXT NOT NULL, fingerprint TEXT NOT NULL,
+            parts TEXT NOT NULL, size INTEGER NOT NULL, last_access REAL NOT NULL, hits INTEGER NOT NULL DEFAULT 0,
+            fmt TEXT, sources TEXT);
+        CREATE INDEX IF NOT EXISTS artifacts_album ON artifacts(album_dir);
+        CREATE INDEX IF NOT EXISTS artifacts_access ON artifacts(last_access);
+        CREATE TABLE IF NOT EXISTS covers (
+            album_id TEXT PRIMARY KEY, size INTEGER NOT NULL, last_access REAL NOT NULL);
+        CREATE INDEX IF NOT EXISTS covers_access ON covers(last_access);
+        CREATE TABLE IF NOT EXISTS leases (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, album_id TEXT NOT NULL, acquired REAL NOT NULL);
+        CREATE INDEX IF NOT EXISTS leases_album ON leases(album_id);
+    """
+    # 旧版索引缺少的列：(表, 列, 定义)
+    COLUMNS = [
+        ("albums", "hits", "INTEGER NOT NULL DEFAULT 0"),
+        ("artifacts", "fmt", "TEXT"),
+        ("artifacts", "sources", "TEXT"),
+    ]
+    ORDER = {"lru": "last_access ASC", "lfu": "hits ASC, last_access ASC"}
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.created = not path.exists()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(path), check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(self.SCHEMA)
+            self._upgrade()
+            # 租约只在本进程内有效，上次运行遗留的一律作废
+            self._conn.execute("DELETE FROM leases")
+
+    def _upgrade(self):
+        for table, column, definition in self.COLUMNS:
+            columns = {row["name"] for row in self._conn.execute(f"PRAGMA table_info({table})")}
+            if column not in columns:
+                self._conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+        for row in self._conn.execute("SELECT key, parts FROM artifacts WHERE fmt IS NULL").fetchall():
+            self._conn.execute("UPDATE artifacts SET fmt = ? WHERE key = ?", (self._fmt_of(json.loads(row["parts"])), row["key"]))
+
+    @staticmethod
+    def _fmt_of(parts: List[Dict[str, Any]]) -> str:
+        return Path(parts[0]["path"]).suffix.lstrip(".").lower() if parts else ""
+
+    def _query(self, sql: str, params: tuple = ()) -> List[sqlite3.Row]:
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def _write(self, sql: str, params: tuple = ()) -> sqlite3.Cursor:
+        with self._lock, self._conn:
+            return self._conn.execute(sql, params)
+
+    # 本子与章节
+
+    def record_chapter(self, album_id: str, album_dir: Path, chapter_dir: Path, photo_id: Optional[str],
+                       images: int, size: int, last_access: Optional[float] = None):
+        album_dir, chapter_dir = str(album_dir), str(chapter_dir)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO albums (album_dir, album_id, last_access) VALUES (?, ?, ?) "
+                "ON CONFLICT(album_dir) DO UPDATE SET album_id = COALESCE(excluded.album_id, album_id), "
+                "last_access = MAX(last_access, excluded.last_access)",
+                (album_dir, album_id, last_access or time.time()),
+            )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO chapters (chapter_dir, album_dir, photo_id, images, size) VALUES (?, ?, ?, ?, ?)",
+                (chapter_dir, album_dir, photo_id, images, size),
+            )
+
+    def touch_album(self, album_dir: Path):
+        self._write("UPDATE albums SET last_access = ?, hits = hits + 1 WHERE album_dir = ?", (time.time(), str(album_dir)))
+
+    def album_id_of(self, album_dir: Path) -> Optional[str]:
+        rows = self._query("SELECT album_id FROM albums WHERE album_dir = ?", (str(album_dir),))
+        return rows[0]["album_id"] if rows else None
+
+    def remove_album(self, album_dir: Path):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM chapters WHERE album_dir = ?", (str(album_dir),))
+            self._conn.execute("DELETE FROM albums WHERE album_dir = ?", (str(album_dir),))
+
+    def remove_chapters(self, album_dir: Path):
+        """只删除原图记录，保留本子的访问统计和产物"""
+        self._write("DELETE FROM chapters WHERE album_dir = ?", (str(album_dir),))
+
+    def image_victims(self, max_bytes: int, policy: str = "lru") -> List[str]:
+        """原图总大小超出 max_bytes 时按淘汰策略选出待删除原图的本子目录，跳过持有租约的本子"""
+        rows = self._query(
+            "SELECT a.album_dir, a.album_id IN (SELECT album_id FROM leases) AS leased, "
+            "(SELECT SUM(size) FROM chapters c WHERE c.album_dir = a.album_dir) AS size "
+            f"FROM albums a WHERE size > 0 ORDER BY {self.ORDER[policy]}"
+        )
+        return self._pick_victims(rows, "album_dir", max_bytes)
+
+    @staticmethod
+    def _pick_victims(rows: List[sqlite3.Row], column: str, max_bytes: int) -> List[str]:
+        total = sum(row["size"] for row in rows)
+        victims = []
+        for row in rows:
+            if total <= max_bytes:
+                break
+            if not row["leased"]:
+                victims.append(row[column])
+                total -= row["size"]
+        return victims
+
+    def eviction_candidates(self, keep: int, max_bytes: int) -> List[str]:
+        """按最近访问时间从旧到新选出待删除的本子目录，直到数量不超过 keep、总字节数（含产物）不超过 max_bytes；
+        持有租约的本子不会被选中"""
+        rows = self._query(
+            "SELECT a.album_dir, a.album_id IN (SELECT album_id FROM leases) AS leased, "
+            "COALESCE((SELECT SUM(size) FROM chapters c WHERE c.album_dir = a.album_dir), 0) "
+            "+ COALESCE((SELECT SUM(size) FROM artifacts r WHERE r.album_dir = a.album_dir), 0) AS size "
+            "FROM albums a ORDER BY a.last_access ASC"
+        )
+        count = len(rows)
+        total = sum(row["size"] for row in rows)
+        victims = []
+        for row in rows:
+            over_count = keep > 0 and count > keep
+            over_bytes = max_bytes > 0 and total > max_bytes
+            if not over_count and not over_bytes:
+                break
+            if row["leased"]:
+                continue
+            victims.append(row["album_dir"])
+            count -= 1
+            total -= row["size"]
+        return victims
+
+    # 租约：下载、打包、发送期间持有，清理时跳过
+
+    def acquire(self, album_id: str) -> int:
+        return self._write("INSERT INTO leases (album_id, acquired) VALUES (?, ?)", (str(album_id), time.time())).lastrowid
+
+    def release(self, lease_id: int):
+        self._write("DELETE FROM leases WHERE id = ?", (lease_id,))
+
+    def leased(self, album_id: str) -> bool:
+        return bool(self._query("SELECT 1 FROM leases WHERE album_id = ? LIMIT 1", (str(album_id),)))
+
+    # 产物
+
+    @staticmethod
+    def _artifact(row: sqlite3.Row) -> Dict[str, Any]:
+        entry = dict(row)
+        entry["parts"] = json.loads(entry["parts"])
+        entry["sources"] = json.loads(entry["sources"]) if entry.get("sources") else None
+        return entry
+
+    def get_artifact(self, key: str) -> Optional[Dict[str, Any]]:
+        rows = self._query("SELECT * FROM artifacts WHERE key = ?", (key,))
+        return self._artifact(rows[0]) if rows else None
+
+    def put_artifact(self, key: str, entry: Dict[str, Any]):
+        self._write(
+            "INSERT OR REPLACE INTO artifacts (key, album_id, album_dir, fingerprint, parts, size, last_access, hits, fmt, sources) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (key, entry["album_id"], entry["album_dir"], entry["fingerprint"], json.dumps(entry["parts"], ensure_ascii=False),
+             entry["size"], entry["last_access"], entry.get("hits", 0), self._fmt_of(entry["parts"]),
+             json.dumps(entry["sources"], ensure_ascii=False) if entry.get("sources") else None),
+        )
+
+    def hit_artifact(self, key: str):
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE artifacts SET last_access = ?, hits = hits + 1 WHERE key = ?", (now, key))
+            self._conn.execute(
+                "UPDATE albums SET last_access = ?, hits = hits + 1 "
+                "WHERE album_dir = (SELECT album_dir FROM artifacts WHERE key = ?)",
+                (now, key),
+            )
+
+    def pop_artifact(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT * FROM artifacts WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self._conn.execute("DELETE FROM artifacts WHERE key = ?", (key,))
+        return self._artifact(row)
+
+    def artifact_keys(self, album_dir: Path) -> List[str]:
+        return [row["key"] for row in self._query("SELECT key FROM artifacts WHERE album_dir = ?", (str(album_dir),))]
+
+    def artifact_victims(self, max_bytes: int, fmt: Optional[str] = None, policy: str = "lru") -> List[str]:
+        """产物（可只看某一格式）总大小超出 max_bytes 时按淘汰策略选出待删除的键，跳过持有租约的本子"""
+        where, params = ("WHERE fmt = ?", (fmt,)) if fmt else ("", ())
+        rows = self._query(
+            "SELECT key, size, album_id IN (SELECT album_id FROM leases) AS leased "
+            f"FROM artifacts {where} ORDER BY {self.ORDER[policy]}",
+            params,
+        )
+        return self._pick_victims(rows, "key", max_bytes)
+
+    def usage(self) -> Dict[str, Dict[str, int]]:
+        """各类文件的占用：{类别: {"count", "bytes", "hits"}}"""
+        usage = {}
+        row = self._query("SELECT COUNT(DISTINCT album_dir) AS count, COALESCE(SUM(size), 0) AS bytes FROM chapters")[0]
+        usage["images"] = {"count": row["count"], "bytes": row["bytes"], "hits": 0}
+        for fmt in ("pdf", "zip"):
+            row = self._query(
+                "SELECT COUNT(*) AS count, COALESCE(SUM(size), 0) AS bytes, COALESCE(SUM(hits), 0) AS hits "
+                "FROM artifacts WHERE fmt = ?", (fmt,)
+            )[0]
+            usage[fmt] = dict(row)
+        row = self._query("SELECT COUNT(*) AS count, COALESCE(SUM(size), 0) AS bytes FROM covers")[0]
+        usage["covers"] = {"count": row["count"], "bytes": row["bytes"], "hits": 0}
+        return usage
+
+    # 封面
+
+    def put_cover(self, album_id: str, size: int, last_access: Optional[float] = None):
+        self._write("INSERT OR REPLACE INTO covers (album_id, size, last_access) VALUES (?, ?, ?)",
+                    (str(album_id), size, last_access or time.time()))
+
+    def touch_cover(self, album_id: str) -> int:
+        return self._write("UPDATE covers SET last_access = ? WHERE album_id = ?", (time.time(), str(album_id))).rowcount
+
+    def remove_cover(self, album_id: str):
+        self._write("DELETE FROM covers WHERE album_id = ?", (str(album_id),))
+
+    def cover_victims(self, cutoff: Optional[float], max_bytes: int) -> List[str]:
+        rows = self._query("SELECT album_id, size, last_access FROM covers ORDER BY last_access ASC")
+        total = sum(row["size"] for row in rows)
+        victims = []
+        for row in rows:
+            expired = cutoff is not None and row["last_access"] < cutoff
+            if not expired and (max_bytes <= 0 or total <= max_bytes):
+                break
+            victims.append(row["album_id"])
+            total -= row["size"]
+        return victims
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class CoverStore:
+    """封面存储：每个本子只保留一个文件，已存在则不再下载；可选生成缩略图用于发送；按容量 LRU 淘汰"""
+
+    def __init__(self, cover_dir: Path, catalog: StorageCatalog, max_bytes: int = 0, thumb_size: int = 0,
+                 keep_days: int = 0):
+        self.cover_dir = cover_dir
+        self.catalog = catalog
+        self.max_bytes = max_bytes
+        self.thumb_size = thumb_size
+        self.keep_days = keep_days
+        self.hits = 0
+        self.misses = 0
+
+    def path(self, album_id: str) -> Path:
+        return self.cover_dir / f"{album_id}.jpg"
+
+    def thumb_path(self, album_id: str) -> Path:
+        return self.cover_dir / f"{album_id}_thumb.jpg"
+
+    def get(self, album_id: str) -> Optional[Path]:
+        """返回用于发送的封面（有缩略图时优先），并刷新访问时间；不存在返回 None"""
+        for path in (self.thumb_path(album_id), self.path(album_id)):
+            if self.thumb_size <= 0 and path.name.endswith("_thumb.jpg"):
+                continue
+            if path.exists():
+                if self.catalog.touch_cover(album_id) == 0:
+                    self.add(album_id)
+                return path
+        return None
+
+    def add(self, album_id: str):
+        """登记封面（含缩略图）占用的空间"""
+        size = sum(p.stat().st_size for p in (self.path(album_id), self.thumb_path(album_id)) if p.exists())
+        self.catalog.put_cover(album_id, size)
+
+    def make_thumbnail(self, album_id: str) -> Path:
+        thumb = self.thumb_path(album_id)
+        with PILImage.open(self.path(album_id)) as img:
+            # JPEG 封面按缩略图尺寸直接缩小解码
+            img.draft("RGB", (self.thumb_size, self.thumb_size))
+            img = img.convert("RGB")
+            img.thumbnail((self.thumb_size, self.thumb_size), PILImage.Resampling.LANCZOS)
+            img.save(thumb, "JPEG", quality=85, optimize=True)
+        thumb.chmod(0o644)
+        return thumb
+
+    def import_existing(self):
+        """首次建立索引时登记已有的封面"""
+        covers: Dict[str, Tuple[int, float]] = {}
+        for f in self.cover_dir.glob("*.jpg"):
+            album_id = f.stem[:-len("_thumb")] if f.stem.endswith("_thumb") else f.stem
+            st = f.stat()
+            size, mtime = covers.get(album_id, (0, 0))
+            covers[album_id] = (size + st.st_size, max(mtime, st.st_mtime))
+        for album_id, (size, mtime) in covers.items():
+            self.catalog.put_cover(album_id, size, mtime)
+
+    def evict(self):
+        """删除超过保留天数的封面，再按最近访问时间淘汰到容量以内"""
+        cutoff = time.time() - self.keep_days * 86400 if self.keep_days > 0 else None
+        for album_id in self.catalog.cover_victims(cutoff, self.max_bytes):
+            for path in (self.path(album_id), self.thumb_path(album_id)):
+                try:
+                    path.unlink()
+                    logger.debug(f"已删除封面: {path}")
+                except FileNotFoundError:
+                    pass
+            self.catalog.remove_cover(album_id)
+
+
+class JpegPdfWriter:
+    """逐页写入 PDF：每页只读入一张 JPEG，写出后即释放，内存占用与页数无关；
+    JPEG 数据以 DCTDecode 原样嵌入，不重新编码。页面尺寸按图片 DPI 换算，未记录 DPI 时按 96"""
+
+    COLOR_SPACES = {'RGB': b"/DeviceRGB", 'L': b"/DeviceGray"}
+    DEFAULT_DPI = 96
+
+    def __init__(self, f):
+        self._f = f
+        self._offsets: List[int] = []
+        self._kids: List[int] = []
+        self._f.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+        # 页面树与目录在所有页面写完后才写出，先占用编号供页面引用
+        self._pages_id = self._reserve()
+        self._catalog_id = self._reserve()
+
+    def _reserve(self) -> int:
+        self._offsets.append(0)
+        return len(self._offsets)
+
+    def _write_object(self, obj_id: int, body: bytes, stream: Optional[bytes] = None):
+        self._offsets[obj_id - 1] = self._f.tell()
+        self._f.write(b"%d 0 obj\n" % obj_id)
+        if stream is None:
+            self._f.write(body + b"\nendobj\n")
+            return
+        self._f.write(body[:-2] + b" /Length %d >>\nstream\n" % len(stream))
+        self._f.write(stream)
+        self._f.write(b"\nendstream\nendobj\n")
+
+    def add_page(self, path: str):
+        with PILImage.open(path) as img:
+            if img.format != 'JPEG' or img.mode not in self.COLOR_SPACES:
+                raise ValueError(f"只能写入 RGB/灰度 JPEG 页面: {path} ({img.format} {img.mode})")
+            width, height = img.size
+            color_space = self.COLOR_SPACES[img.mode]
+            dpi_x, dpi_y = img.info.get('dpi') or (0, 0)
+        page_w = width * 72 / (dpi_x or self.DEFAULT_DPI)
+        page_h = height * 72 / (dpi_y or self.DEFAULT_DPI)
+        with open(path, "rb") as src:
+            data = src.read()
+
+        image_id = self._reserve()
+        self._write_object(image_id, b"<< /Type /XObject /Subtype /Image /Width %d /Height %d /ColorSpace %s "
+                                     b"/BitsPerComponent 8 /Filter /DCTDecode >>" % (width, height, color_space), data)
+        del data
+        content_id = self._reserve()
+        self._write_object(content_id, b"<< >>", b"q %.4f 0 0 %.4f 0 0 cm /Im0 Do Q" % (page_w, page_h))
+        page_id = self._reserve()
+        self._write_object(page_id, b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 %.4f %.4f] "
+                                    b"/Resources << /XObject << /Im0 %d 0 R >> >> /Contents %d 0 R >>"
+                                    % (self._pages_id, page_w, page_h, image_id, content_id))
+        self._kids.append(page_id)
+
+    def close(self):
+        if not self._kids:
+            raise ValueError("PDF 没有页面")
+        kids = b" ".join(b"%d 0 R" % kid for kid in self._kids)
+        self._write_object(self._pages_id, b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(self._kids)))
+        self._write_object(self._catalog_id, b"<< /Type /Catalog /Pages %d 0 R >>" % self._pages_id)
+        xref = self._f.tell()
+        self._f.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(self._offsets) + 1))
+        for offset in self._offsets:
+            self._f.write(b"%010d 00000 n \n" % offset)
+        self._f.write(b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n"
+                      % (len(self._offsets) + 1, self._catalog_id, xref))
+
+
+class ZipPackager:
+    """流式 ZIP 打包：JPEG/PNG/WebP 图片及 PDF/ZIP 等已压缩的文件直接存储，只有其余文件才 deflate；
+    可在下载过程中按章节多次追加，已写入的文件不会重复写入"""
+
+    def __init__(self, zip_path: Path):
+        self.zip_path = zip_path
+        self.part_path = zip_path.with_name(zip_path.name + ".part")
+        self._lock = threading.Lock()
+        self._added: set = set()
+        self._zip: Optional[zipfile.ZipFile] = None
+
+    @staticmethod
+    def list_tree(folder: Path) -> List[str]:
+        files = []
+        for root, dirs, names in os.walk(folder):
+            dirs.sort()
+            for name in sorted(names):
+                if not os.path.splitext(name)[0].endswith(PART_MARKER):
+                    files.append(os.path.join(root, name))
+        return files
+
+    def add_tree(self, folder: Path, arc_root: Path):
+        self.add_files(self.list_tree(folder), arc_root)
+
+    def add_files(self, files: List[str], arc_root: Path):
+        with self._lock:
+            for file_path in files:
+                self._write(file_path, os.path.relpath(file_path, start=arc_root))
+
+    def add_file(self, file_path: str, arcname: str):
+        with self._lock:
+            self._write(file_path, arcname)
+
+    def _write(self, file_path: str, arcname: str):
+        """调用方需持有锁"""
+        if file_path in self._added:
+            return
+        if self._zip is None:
+            self._zip = zipfile.ZipFile(self.part_path, 'w', zipfile.ZIP_DEFLATED)
+        suffix = os.path.splitext(file_path)[1]
+        compress_type = zipfile.ZIP_STORED if suffix.lower() in STORED_SUFFIXES else zipfile.ZIP_DEFLATED
+        self._zip.write(file_path, arcname, compress_type=compress_type)
+        self._added.add(file_path)
+
+    def close(self) -> Path:
+        with self._lock:
+            if self._zip is None:
+                self._zip = zipfile.ZipFile(self.part_path, 'w', zipfile.ZIP_DEFLATED)
+            self._zip.close()
+            os.replace(self.part_path, self.zip_path)
+        return self.zip_path
+
+    def abort(self):
+        with self._lock:
+            if self._zip is not None:
+                self._zip.close()
+            if self.part_path.exists():
+                self.part_path.unlink()
+
+
+class BatchArchive:
+    """批量下载的合并 ZIP：各本子的 PDF/ZIP 一生成就写入；再写入会超出 max_bytes 时先封存当前卷，另起一卷"""
+
+    def __init__(self, path_for, max_bytes: int):
+        self._path_for = path_for
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._packager: Optional[ZipPackager] = None
+        self._size = 0
+        self.volumes = 0
+        self.finished: List[Path] = []
+
+    def add(self, file_path: str, arcname: str) -> Optional[Path]:
+        """写入一个文件，返回因此封存的上一卷（没有则为 None）"""
+        size = os.path.getsize(file_path)
+        sealed = None
+        with self._lock:
+            if self._packager is not None and 0 < self.max_bytes < self._size + size:
+                sealed = self._seal()
+            if self._packager is None:
+                self.volumes += 1
+                self._packager = ZipPackager(self._path_for(self.volumes))
+                self._size = 0
+            self._packager.add_file(file_path, arcname)
+            self._size += size
+        return sealed
+
+    def _seal(self) -> Path:
+        path = self._packager.close()
+        self._packager = None
+        self.finished.append(path)
+        return path
+
+    def close(self) -> Optional[Path]:
+        with self._lock:
+            return self._seal() if self._packager is not None else None
+
+    def abort(self):
+        with self._lock:
+            if self._packager is not None:
+                self._packager.abort()
+                self._packager = None
+
+
+class DecodeBudget:
+    """所有转码任务共享的解码像素预算：在途任务预计解码的像素之和不超过上限，其余任务按提交顺序排队；
+    单张就超出上限的图片（无法按比例解码的大图）直接拒绝，不会解码"""
+
+    def __init__(self, max_pixels: int):
+        self.max_pixels = max_pixels
+        self._lock = threading.Lock()
+        self._used = 0
+        self._waiting: deque = deque()
+
+    def submit(self, pool: concurrent.futures.Executor, pixels: int, fn, *args) -> concurrent.futures.Future:
+        future = concurrent.futures.Future()
+        if pixels > self.max_pixels:
+            future.set_exception(ValueError(
+                f"图片解码约需 {_format_bytes(pixels * DECODE_BYTES_PER_PIXEL)}，超出转码内存上限 "
+                f"{_format_bytes(self.max_pixels * DECODE_BYTES_PER_PIXEL)}，可调大 transcode_memory_mb"
+            ))
+            return future
+        item = (pool, pixels, fn, args, future)
+        with self._lock:
+            admitted = not self._waiting and self._admit(pixels)
+            if not admitted:
+                self._waiting.append(item)
+        if admitted and not self._start(item):
+            self._release(pixels)
+        return future
+
+    def _admit(self, pixels: int) -> bool:
+        """调用方需持有锁"""
+        if self._used and self._used + pixels > self.max_pixels:
+            return False
+        self._used += pixels
+        return True
+
+    def _start(self, item) -> bool:
+        """返回任务是否真正开始；已取消或进程池已关闭时返回 False，由调用方归还预算"""
+        pool, pixels, fn, args, future = item
+        if not future.set_running_or_notify_cancel():
+            return False
+        try:
+            inner = pool.submit(fn, *args)
+        except Exception as e:
+            future.set_exception(e)
+            return False
+        inner.add_done_callback(functools.partial(self._finish, pixels, future))
+        return True
+
+    def _finish(self, pixels: int, future: concurrent.futures.Future, inner: concurrent.futures.Future):
+        if inner.cancelled():
+            future.set_exception(concurrent.futures.CancelledError())
+        elif inner.exception() is not None:
+            future.set_exception(inner.exception())
+        else:
+            future.set_result(inner.result())
+        self._release(pixels)
+
+    def _release(self, pixels: int):
+        # 循环而非递归启动后续任务，大量已取消的任务不会造成深递归
+        while pixels:
+            with self._lock:
+                self._used -= pixels
+                ready = []
+                while self._waiting and self._admit(self._waiting[0][1]):
+                    ready.append(self._waiting.popleft())
+            pixels = sum(item[1] for item in ready if not self._start(item))
+
+
+class PdfPipeline:
+    """PDF 页面转码流水线：图片一下载完成就提交到进程池转码，下载结束时大部分页面已经处理完毕"""
+
+    def __init__(self, pool: concurrent.futures.Executor, quality: int, max_size: int, passthrough: bool,
+                 budget: Optional[DecodeBudget] = None):
+        self.pool = pool
+        self.quality = quality
+        self.max_size = max_size
+        self.passthrough = passthrough
+        self.budget = budget
+        self._tmpdir = tempfile.TemporaryDirectory(prefix="jm_pdf_")
+        self.tmpdir = self._tmpdir.name
+        self._lock = threading.Lock()
+        self._futures: Dict[str, concurrent.futures.Future] = {}
+
+    def submit(self, img_path: str) -> concurrent.futures.Future:
+        """可在任意线程调用，但会读取文件头，不要在事件循环中调用；同一图片只会转码一次。结果为该图片输出的页面路径列表"""
+        key = os.path.realpath(img_path)
+        with self._lock:
+            future = self._futures.get(key)
+        if future is not None:
+            return future
+        # 读取文件头估算解码像素，放在锁外
+        max_pixels = self.budget.max_pixels if self.budget is not None else 0
+        pixels = _decode_cost(key, self.max_size, self.passthrough, max_pixels) if self.budget is not None else 0
+        with self._lock:
+            future = self._futures.get(key)
+            if future is None:
+                dst = os.path.join(self.tmpdir, f"{len(self._futures)}_{Path(key).stem}.jpg")
+                args = (key, dst, self.quality, self.max_size, self.passthrough, max_pixels)
+                if pixels:
+                    future = self.budget.submit(self.pool, pixels, _transcode_page, *args)
+                else:
+                    future = self.pool.submit(_transcode_page, *args)
+                self._futures[key] = future
+            return future
+
+    def submit_all(self, img_paths: List[str]) -> List[concurrent.futures.Future]:
+        """依次提交多张图片；submit 会读取文件头，需在磁盘线程中调用，不要在事件循环中调用"""
+        return [self.submit(path) for path in img_paths]
+
+    def is_transcoded(self, pages: List[str]) -> bool:
+        return pages[0].startswith(self.tmpdir)
+
+    def close(self):
+        with self._lock:
+            for future in self._futures.values():
+                future.cancel()
+            self._futures.clear()
+        self._tmpdir.cleanup()
+
+
+class WorkerLane:
+    """命名的执行器：网络请求、整本下载、磁盘操作、图片转码各用一个，互不抢占；统计排队深度与满载次数。
+
+    run 超时或所在协程被取消时，尚未开始的任务直接丢弃；已在执行的任务通过 jmcomic 的 DownloadControl
+    协作取消（cancellable=True 时），jmcomic 下载流程与 DomainHealth 的每次请求前都会检查。
+    processes=True 时使用进程池（创建失败退回线程池），提交的函数须可 pickle。
+    """
+
+    def __init__(self, name: str, max_workers: int, metrics: Optional['Metrics'] = None,
+                 processes: bool = False, cancellable: bool = False):
+        self.name = name
+        self.max_workers = max(1, max_workers)
+        self.processes = processes
+        self.cancellable = cancellable
+        self.submitted = 0
+        self.saturated = 0
+        self.cancelled = 0
+        self._pending = 0
+        self._metrics = metrics
+        self._lock = threading.Lock()
+        self._executor: Optional[concurrent.futures.Executor] = None
+
+    def _get_executor(self) -> concurrent.futures.Executor:
+        with self._lock:
+            if self._executor is None:
+                if self.processes:
+                    try:
+                        self._executor = concurrent.futures.ProcessPoolExecutor(max_workers=self.max_workers)
+                    except Exception as e:
+                        logger.warning(f"创建 {self.name} 进程池失败，改用线程池: {e}")
+                if self._executor is None:
+                    self._executor = concurrent.futures.ThreadPoolExecutor(
+                        max_workers=self.max_workers, thread_name_prefix=f"jm-{self.name}")
+            return self._executor
+
+    def submit(self, fn, *args, **kwargs) -> concurrent.futures.Future:
+        """Executor 接口，PdfPipeline / DecodeBudget 可直接使用"""
+        executor = self._get_executor()
+        with self._lock:
+            self.submitted += 1
+            if self._pending >= self.max_workers:
+                self.saturated += 1
+            self._pending += 1
+        try:
+            future = executor.submit(fn, *args, **kwargs)
+        except BaseException:
+            with self._lock:
+                self._pending -= 1
+            raise
+        future.add_done_callback(self._done)
+        return future
+
+    def _done(self, future: concurrent.futures.Future):
+        with self._lock:
+            self._pending -= 1
+            if future.cancelled():
+                self.cancelled += 1
+
+    async def run(self, call, timeout: Optional[float] = None):
+        """在本执行器中执行无参可调用对象 call（通常是 functools.partial），timeout 为空时不限时"""
+        control = jmcomic.DownloadControl() if self.cancellable else None
+        enqueued = time.monotonic()
+
+        def job():
+            if self._metrics is not None:
+                self._metrics.observe(f"wait_{self.name}", time.monotonic() - enqueued)
+            if control is None:
+                return call()
+            with jmcomic.JmTaskContext(control=control):
+                jmcomic.JTC.raise_if_cancelled()
+                return call()
+
+        future = asyncio.wrap_future(self.submit(call if self.processes else job))
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            if control is not None:
+                control.cancel(f"{self.name} 任务超时或已取消")
+            raise
+
+    def summary(self) -> Dict[str, int]:
+        with self._lock:
+            pending = self._pending
+            return {
+                "workers": self.max_workers,
+                "running": min(pending, self.max_workers),
+                "queued": max(0, pending - self.max_workers),
+                "submitted": self.submitted,
+                "saturated": self.saturated,
+                "cancelled": self.cancelled,
+            }
+
+    def shutdown(self, wait: bool = False):
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait, cancel_futures=True)
+
+
+class ArtifactJob:
+    """一次产物构建的共享结果：分卷在构建过程中逐个发布，每个等待者按自己的进度依次读取并发送"""
+
+    def __init__(self):
+        self.parts: List[Dict[str, Any]] = []
+        self.task: Optional[asyncio.Future] = None
+        # 空闲预取发起的任务；有用户请求合并进来后转为普通任务，不再因新请求被打断
+        self.prefetch = False
+        self._changed = asyncio.Event()
+
+    def start(self, coro) -> asyncio.Future:
+        self.task = asyncio.ensure_future(coro)
+        self.task.add_done_callback(lambda _: self._notify())
+        return self.task
+
+    def publish(self, part: Dict[str, Any]):
+        self.parts.append(part)
+        self._notify()
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def stream(self):
+        """依次产出已发布的分卷；任务失败时在产出已有分卷后抛出同一异常"""
+        index = 0
+        while True:
+            while index < len(self.parts):
+                yield self.parts[index]
+                index += 1
+            if self.task.done():
+                self.task.result()
+                return
+            await self._changed.wait()
+
+
+class ArtifactCache:
+    """PDF/ZIP 产物缓存：以 (本子, 章节范围, 质量, 尺寸, 格式) 为键，源图未变化时直接复用已生成的文件；索引保存在存储目录索引中"""
+
+    def __init__(self, base_dir: Path, catalog: StorageCatalog, max_bytes: int = 0, policy: str = "lru"):
+        self.base_dir = base_dir
+        self.catalog = catalog
+        self.max_bytes = max_bytes
+        self.policy = policy
+        self.hits = 0
+        self.misses = 0
+        self._migrate(base_dir / "artifacts.json")
+
+    def _migrate(self, index_file: Path):
+        """导入旧版 JSON 索引"""
+        if not index_file.exists():
+            return
+        try:
+            with open(index_file, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+            for key, entry in entries.items():
+                # 更早的索引每个产物只有一个文件
+                if "parts" not in entry:
+                    entry["parts"] = [{"path": entry.pop("path"), "name": entry.pop("name"), "volume": 1, "volumes": 1}]
+                self.catalog.put_artifact(key, entry)
+            index_file.unlink()
+            logger.info(f"已导入旧版产物缓存索引 {len(entries)} 条")
+        except Exception as e:
+            logger.warning(f"导入旧版产物缓存索引失败: {e}")
+
+    @staticmethod
+    def make_key(album_id: str, chapter_range: Optional[Tuple[int, int]], quality: Optional[int], max_size: int, fmt: str,
+                 split: Optional[Any] = None) -> str:
+        params = [str(album_id), list(chapter_range) if chapter_range else None, quality, max_size, fmt]
+        if split is not None:
+            params.append(split)
+        raw = json.dumps(params)
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def path_for(self, key: str, album_id: str, fmt: str, volume: int = 0) -> Path:
+        out_dir = self.base_dir / ("pdfs" if fmt == "pdf" else "zips")
+        out_dir.mkdir(parents=True, exist_ok=True)
+        suffix = f"_vol{volume}" if volume else ""
+        return out_dir / f"{album_id}_{key[:12]}{suffix}.{fmt}"
+
+    @staticmethod
+    def fingerprint(album_dir: Path, sources: Optional[List[Path]] = None) -> str:
+        """源图指纹：相对路径 + 大小 + 修改时间，任一图片变化都会使指纹改变。
+        sources 为产物实际使用的章节目录，只有这些目录参与计算，下载其他章节不会使范围产物失效；为空时取整个本子目录"""
+        h = hashlib.sha1()
+        for source in sources or [album_dir]:
+            for f in sorted(Path(source).rglob("*")):
+                if f.is_file():
+                    st = f.stat()
+                    h.update(f"{f.relative_to(album_dir)}|{st.st_size}|{st.st_mtime_ns}\n".encode("utf-8"))
+        return h.hexdigest()
+
+    def lookup(self, key: str) -> Optional[Dict[str, Any]]:
+        entry = self.catalog.get_artifact(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        album_dir = Path(entry["album_dir"])
+        missing = any(not Path(part["path"]).exists() for part in entry["parts"])
+        if missing or (album_dir.exists() and self.fingerprint(album_dir, entry["sources"]) != entry["fingerprint"]):
+            self.discard(key)
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.catalog.hit_artifact(key)
+        entry["hits"] += 1
+        return entry
+
+    def put(self, key: str, parts: List[Dict[str, Any]], album_id: str, album_dir: Path,
+            sources: Optional[List[Path]] = None):
+        album_dir = album_dir.resolve()
+        entry = {
+            "parts": [{k: part[k] for k in ("path", "name", "volume", "volumes")} for part in parts],
+            "album_id": str(album_id),
+            "album_dir": str(album_dir),
+            "sources": [str(d) for d in sources] if sources else None,
+            "fingerprint": self.fingerprint(album_dir, sources),
+            "size": sum(Path(part["path"]).stat().st_size for part in parts),
+            "last_access": time.time(),
+            "hits": 0,
+        }
+        self.catalog.put_artifact(key, entry)
+        self.catalog.touch_album(album_dir)
+        self.evict()
+
+    def discard(self, key: str):
+        entry = self.catalog.pop_artifact(key)
+        if entry is None:
+            return
+        for part in entry["parts"]:
+            self._unlink(Path(part["path"]))
+
+    def discard_album(self, album_dir: Path):
+        """删除由该本子目录生成的全部产物"""
+        for key in self.catalog.artifact_keys(album_dir.resolve()):
+            self.discard(key)
+
+    def evict(self):
+        """超出容量时按淘汰策略（最近最少使用或最不常用）淘汰产物"""
+        if self.max_bytes <= 0:
+            return
+        for key in self.catalog.artifact_victims(self.max_bytes, policy=self.policy):
+            self.discard(key)
+
+    @staticmethod
+    def _unlink(path: Path):
+        try:
+            if path.exists():
+                path.unlink()
+                logger.info(f"已删除缓存产物: {path}")
+        except Exception as e:
+            logger.error(f"删除缓存产物失败 {path}: {e}")
 
 
 @register("jmcomic_downloader", "JMComic 下载", "禁漫下载插件（支持范围下载、图文详情、智能清理）", "3.0.0")
@@ -109,58 +2139,326 @@ class JmComicPlugin(Star):
             self.option_file = None
             logger.warning("未找到默认 option 配置文件，使用 jmcomic 内置默认配置")
 
+        self._throttle = DownloadThrottle(
+            self.config.get("max_image_concurrency", 32),
+            self.config.get("download_speed_limit_kb", 0) * 1024,
+            self.config.get("adaptive_concurrency", True),
+        )
+        self.domain_probe_interval = self.config.get("domain_probe_interval", 300)
+        self._domain_health = DomainHealth(self.config.get("domain_timeout", 10), on_image_error=self._throttle.on_error)
+        self._options = OptionRegistry(self.option_file, self.global_base_dir, self._apply_overrides,
+                                       self._domain_health.request)
+
         self.cleanup_mode = self.config.get("cleanup_mode", "count")
         self.max_albums = self.config.get("max_albums", 10) if self.cleanup_mode == "count" else 0
+        self.max_storage_bytes = self.config.get("max_storage_mb", 0) * 1024 * 1024 if self.cleanup_mode == "count" else 0
+        # budget 模式下原图、PDF、ZIP 各自的容量上限；封面沿用 cover_cache_mb
+        self.budgets = {
+            "images": self.config.get("budget_images_mb", 4096) * 1024 * 1024,
+            "pdf": self.config.get("budget_pdf_mb", 1024) * 1024 * 1024,
+            "zip": self.config.get("budget_zip_mb", 1024) * 1024 * 1024,
+        }
+        self.eviction_policy = self.config.get("eviction_policy", "lru")
+        if self.eviction_policy not in StorageCatalog.ORDER:
+            logger.warning(f"未知的淘汰策略 {self.eviction_policy}，改用 lru")
+            self.eviction_policy = "lru"
+        self._budget_task: Optional[asyncio.Task] = None
+        self._metrics = Metrics()
+        metrics_file = self.config.get("metrics_file", "")
+        self.metrics_file = None
+        if metrics_file:
+            self.metrics_file = Path(metrics_file)
+            if not self.metrics_file.is_absolute():
+                self.metrics_file = self.global_base_dir / self.metrics_file
         self.cover_keep_days = self.config.get("cover_keep_days", 7)
+        self._catalog = StorageCatalog(self.global_base_dir / "catalog.sqlite3")
+        self._covers = CoverStore(
+            self.cover_dir,
+            self._catalog,
+            self.config.get("cover_cache_mb", 200) * 1024 * 1024,
+            self.config.get("cover_thumbnail_size", 0),
+            self.cover_keep_days,
+        )
+        self._cover_locks: Dict[str, asyncio.Lock] = {}
         self.default_pdf_quality = self.config.get("default_pdf_quality", 85)
         self.default_pdf_quality = max(1, min(100, self.default_pdf_quality))
+        self.pdf_workers = self.config.get("pdf_workers", 0) or (os.cpu_count() or 1)
+        self.pipeline_mode = self.config.get("pipeline_mode", True)
+        self.max_file_bytes = self.config.get("max_file_mb", 0) * 1024 * 1024
+        self.batch_max_albums = max(1, self.config.get("batch_max_albums", 20))
+        max_downloads = self.config.get("max_concurrent_downloads", 2)
+        # 网络请求、整本下载、磁盘操作、图片转码（进程池）各自独立，互不抢占线程
+        self._net_lane = WorkerLane("net", self.config.get("net_workers", 8), self._metrics, cancellable=True)
+        self._download_lane = WorkerLane("download", max_downloads, self._metrics, cancellable=True)
+        self._disk_lane = WorkerLane("disk", self.config.get("disk_workers", 4), self._metrics)
+        self._cpu_lane = WorkerLane("cpu", self.pdf_workers, self._metrics, processes=True)
+        self._lanes = (self._net_lane, self._download_lane, self._disk_lane, self._cpu_lane)
+        transcode_memory = self.config.get("transcode_memory_mb", 512) * 1024 * 1024
+        self._decode_budget = DecodeBudget(transcode_memory // DECODE_BYTES_PER_PIXEL) if transcode_memory > 0 else None
+        self._scheduler = DownloadScheduler(max_downloads, self.config.get("max_downloads_per_user", 1))
+        self._response_cache = ResponseCache(
+            self.config.get("response_cache_size", 512),
+            self.global_base_dir / "response_cache.json" if self.config.get("response_cache_persist", False) else None,
+        )
+        self._revalidating: set = set()
+        self._manifests: Dict[str, AlbumManifest] = {}
+        self._manifest_lock = threading.Lock()
+        self._inflight: Dict[str, ArtifactJob] = {}
+        self._artifact_waiters: Dict[str, int] = {}
+        self._progress: Dict[str, DownloadProgress] = {}
+        # 同一会话的进度消息共用发送间隔，避免多个任务同时刷屏触发平台频率限制
+        self.progress_interval = self.config.get("progress_interval", 30)
+        self._progress_sent: Dict[str, float] = {}
+        self.prefetch_enabled = self.config.get("prefetch_enabled", False)
+        self.prefetch_top = max(1, self.config.get("prefetch_top", 5))
+        self.prefetch_interval = self.config.get("prefetch_interval", 3600)
+        self.prefetch_format = "zip" if self.config.get("prefetch_format", "pdf") == "zip" else "pdf"
+        try:
+            self.prefetch_windows = _parse_windows(self.config.get("prefetch_windows", "02:00-08:00"))
+        except ValueError as e:
+            logger.warning(f"{e}，已关闭空闲预取")
+            self.prefetch_enabled = False
+            self.prefetch_windows = []
+        self._prefetch_job: Optional[ArtifactJob] = None
+        self._prefetch_album: Optional[str] = None
+        self._prefetch_queue: List[str] = []
+        self._prefetch_pulled_at: Optional[float] = None
+        self._last_interactive = time.monotonic()
+        self._artifact_cache = ArtifactCache(
+            self.global_base_dir, self._catalog, self.config.get("artifact_cache_mb", 2048) * 1024 * 1024,
+            self.eviction_policy,
+        )
 
         if not self.config.get("enable_jm_log", False):
-            JmModuleConfig.disable_jm_log()
+            jmcomic.on_load(lambda module: module.JmModuleConfig.disable_jm_log())
 
+        # fast_start：启动时不预热，jmcomic 的导入与域名预热推迟到首次请求
+        self.fast_start = self.config.get("fast_start", True)
         self._need_warmup = True
+        self._warmup_task: Optional[asyncio.Task] = None
+        self._warmup_failed_at = 0.0
+        self._background_tasks: List[asyncio.Task] = []
+        # 命令触发的下载、清理、缓存刷新等一次性任务，卸载时取消并等待其退出后再关闭执行器与索引
+        self._tasks: set = set()
+        self._closing = False
+        self._background_started = False
+        self._start_background()
+
+    async def initialize(self):
+        # AstrBot 在事件循环中调用；加载插件时若尚无运行中的循环，后台任务在这里启动
+        self._start_background()
+
+    def _start_background(self):
+        """在运行中的事件循环上启动一次后台任务；尚无循环时推迟到 initialize 或首次请求"""
+        if self._background_started:
+            return
         try:
-            asyncio.create_task(self._warmup())
-            self._need_warmup = False
+            loop = asyncio.get_running_loop()
         except RuntimeError:
-            logger.warning("无事件循环，预热推迟到首次请求")
-
-        asyncio.create_task(self._cleanup_expired_covers())
+            return
+        self._background_started = True
+        if not self.fast_start:
+            self._ensure_warmup()
+        if self.domain_probe_interval > 0:
+            self._background_tasks.append(loop.create_task(self._probe_domains_loop()))
+        if self.prefetch_enabled:
+            if self.cleanup_mode == "after_send":
+                logger.warning("after_send 模式下发送后即删除文件，不进行空闲预取")
+            elif self.prefetch_format == "pdf" and not PDF_AVAILABLE:
+                logger.warning("PDF 库未安装，不进行空闲预取")
+            else:
+                self._background_tasks.append(loop.create_task(self._prefetch_loop()))
+        if self._catalog.created:
+            self._background_tasks.append(loop.create_task(self._run_sync(self._import_storage)))
+        self._background_tasks.append(loop.create_task(self._cleanup_expired_covers()))
+        if self.metrics_file is not None:
+            self._background_tasks.append(loop.create_task(self._export_metrics()))
+
+    def _ensure_warmup(self):
+        """同一时间只有一个预热任务；失败后间隔 WARMUP_RETRY_INTERVAL 秒才再次尝试"""
+        if not self._need_warmup or (self._warmup_task is not None and not self._warmup_task.done()):
+            return
+        if time.monotonic() - self._warmup_failed_at < WARMUP_RETRY_INTERVAL:
+            return
+        self._warmup_task = asyncio.get_running_loop().create_task(self._warmup())
+        self._background_tasks.append(self._warmup_task)
 
+    @_timed("warmup")
     async def _warmup(self):
         try:
-            await asyncio.to_thread(JmModuleConfig.get_html_domain)
+            await self._run_net(jmcomic.JmModuleConfig.get_html_domain)
             self._need_warmup = False
         except Exception as e:
+            self._warmup_failed_at = time.monotonic()
             logger.warning(f"预热域名失败: {e}")
+            return
+        if self.domain_probe_interval > 0:
+            await self._probe_domains()
 
-    def _safe_user_dir(self, user_id: str) -> str:
-        safe = re.sub(r'[^a-zA-Z0-9_-]', '_', user_id)
-        return safe or "unknown_user"
+    async def _probe_domains_loop(self):
+        while True:
+            await asyncio.sleep(self.domain_probe_interval)
+            await self._probe_domains()
+
+    def _prefetch_idle(self) -> bool:
+        """处于配置的空闲时段，且最近没有下载请求、下载队列为空"""
+        if self.prefetch_windows:
+            now = time.localtime()
+            if not _in_windows(self.prefetch_windows, now.tm_hour * 60 + now.tm_min):
+                return False
+        if time.monotonic() - self._last_interactive < PREFETCH_IDLE_SECONDS:
+            return False
+        return not self._scheduler.running() and not self._scheduler.queued()
+
+    def _prefetch_has_room(self, usage: Dict[str, Dict[str, int]]) -> bool:
+        if self.cleanup_mode == "budget":
+            return all(not self.budgets[kind] or usage[kind]["bytes"] < self.budgets[kind] * PREFETCH_BUDGET_SHARE
+                       for kind in ("images", self.prefetch_format))
+        total = sum(usage[kind]["bytes"] for kind in ("images", "pdf", "zip"))
+        if self.max_storage_bytes and total >= self.max_storage_bytes * PREFETCH_BUDGET_SHARE:
+            return False
+        return not self.max_albums or usage["images"]["count"] < self.max_albums * PREFETCH_BUDGET_SHARE
+
+    def _interrupt_prefetch(self, cache_key: Optional[str] = None):
+        """有下载请求到达：记录时间，并立即取消正在进行的预取（已下载的图片记录在清单中，下次继续）。
+        请求的正是预取中的产物时不取消，由 _get_artifact_job 合并进预取任务"""
+        self._last_interactive = time.monotonic()
+        job = self._prefetch_job
+        if job is None or not job.prefetch or job.task.done():
+            return
+        if cache_key is not None and self._inflight.get(cache_key) is job:
+            return
+        logger.info(f"收到下载请求，暂停预取 {self._prefetch_album}")
+        job.task.cancel()
+        self._metrics.inc("prefetch_interrupted")
 
-    async def _get_option(self, user_id: str = None, cmd_overrides: dict = None) -> Optional['JmOption']:
-        if self._need_warmup:
-            asyncio.create_task(self._warmup())
-        try:
-            if self.option_file and Path(self.option_file).exists():
-                option = await asyncio.to_thread(create_option_by_file, self.option_file)
+    async def _prefetch_loop(self):
+        while True:
+            await asyncio.sleep(PREFETCH_CHECK_INTERVAL)
+            if not self._prefetch_idle():
+                continue
+            try:
+                await self._prefetch_round()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"空闲预取失败: {e}")
+
+    async def _pull_rankings(self) -> List[str]:
+        """日榜、周榜、月榜第一页各取前 prefetch_top 本，交替排列并去重"""
+        rankings = []
+        for rank_type in ("day", "week", "month"):
+            data = await self._cached_fetch(
+                "ranking", (rank_type, 1), functools.partial(self._fetch_ranking, rank_type, 1)
+            )
+            rankings.append([aid for aid, _ in data['items'][:self.prefetch_top]])
+        ordered = [aid for row in itertools.zip_longest(*rankings) for aid in row if aid is not None]
+        return list(dict.fromkeys(ordered))
+
+    async def _prefetch_round(self):
+        """按排行榜顺序逐本下载并生成产物，一次只预取一本；离开空闲状态或空间不足时停止，下一轮继续"""
+        if self._prefetch_pulled_at is None or time.monotonic() - self._prefetch_pulled_at >= self.prefetch_interval:
+            self._prefetch_queue = await self._pull_rankings()
+            self._prefetch_pulled_at = time.monotonic()
+            logger.info(f"空闲预取：排行榜共 {len(self._prefetch_queue)} 本待检查")
+        pack = self.prefetch_format == "zip"
+        split = self._resolve_split(None)
+        while self._prefetch_queue and self._prefetch_idle():
+            usage = await self._run_sync(self._catalog.usage)
+            if not self._prefetch_has_room(usage):
+                logger.info("空闲预取：已接近容量上限，本轮停止")
+                return
+            album_id = self._prefetch_queue[0]
+            cache_key = ArtifactCache.make_key(album_id, None, None, 0, self.prefetch_format, split)
+            # 只查索引，不计入缓存命中，也不更新最近访问时间
+            if cache_key in self._inflight or await self._run_sync(self._catalog.get_artifact, cache_key):
+                self._prefetch_queue.pop(0)
+                continue
+            logger.info(f"空闲预取：{album_id}")
+            self._prefetch_album = album_id
+            # 与普通下载走同一条共享任务与调度流程，图片并发与总速度受同一个 DownloadThrottle 控制；
+            # 同一产物的用户请求直接合并进来，不会再发起第二次下载
+            job = self._get_artifact_job(None, cache_key, album_id, pack, {}, None, 0, split, quiet=True, prefetch=True)
+            self._prefetch_job = job
+            try:
+                await asyncio.wait({job.task})
+            except asyncio.CancelledError:
+                if job.prefetch:
+                    job.task.cancel()
+                raise
+            finally:
+                self._prefetch_album = None
+                self._prefetch_job = None
+            if job.task.cancelled():
+                return
+            self._prefetch_queue.pop(0)
+            if job.task.exception() is not None:
+                logger.warning(f"预取 {album_id} 失败: {job.task.exception()}")
             else:
-                option = await asyncio.to_thread(JmOption.default)
+                self._metrics.inc("prefetched")
+            self._schedule_cleanup(None, [])
+
+    @_timed("probe_domains")
+    async def _probe_domains(self):
+        try:
+            option = await self._run_sync(self._options.get_option)
+            domains = await self._run_net(self._domain_candidates, option)
+        except Exception as e:
+            logger.warning(f"获取待探测域名失败: {e}")
+            return
+        await asyncio.gather(*(self._run_net(self._domain_health.probe, d) for d in domains))
+        ranked = self._domain_health.rank(domains)
+        if ranked:
+            logger.debug(f"域名探测完成，当前排序: {ranked}")
 
-            option.dir_rule.base_dir = str(self.global_base_dir)
+    @staticmethod
+    def _domain_candidates(option: 'JmOption') -> List[str]:
+        """option 中为 api / html 两种客户端配置的域名；未配置时取 jmcomic 的默认域名"""
+        domains = []
+        for impl in ("api", "html"):
+            configured = option.client.domain
+            if isinstance(configured, dict):
+                configured = configured.get(impl, [])
+            if isinstance(configured, str):
+                configured = configured.split()
+            try:
+                candidates = list(configured) or option.decide_client_domain(impl)
+            except Exception as e:
+                logger.warning(f"获取 {impl} 域名失败: {e}")
+                continue
+            domains.extend(d for d in candidates if d not in domains)
+        return domains
 
-            if cmd_overrides:
-                self._apply_overrides(option, cmd_overrides)
+    def _safe_user_dir(self, user_id: str) -> str:
+        safe = re.sub(r'[^a-zA-Z0-9_-]', '_', user_id)
+        return safe or "unknown_user"
 
-            return option
+    @_timed("get_option")
+    async def _get_option(self, user_id: str = None, cmd_overrides: dict = None, clone: bool = False) -> Optional['JmOption']:
+        """返回共享的 JmOption；clone=True 时返回可修改的独立副本"""
+        self._start_background()
+        self._ensure_warmup()
+        try:
+            if clone:
+                return await self._run_sync(self._options.clone_option, cmd_overrides)
+            return await self._run_sync(self._options.get_option, cmd_overrides)
         except Exception as e:
             logger.error(f"创建 JmOption 失败: {e}")
             return None
 
+    async def _get_client(self, cmd_overrides: dict = None):
+        self._start_background()
+        self._ensure_warmup()
+        try:
+            return await self._run_net(self._options.get_client, cmd_overrides)
+        except Exception as e:
+            logger.error(f"创建 JmClient 失败: {e}")
+            return None
+
     def _apply_overrides(self, option: 'JmOption', overrides: dict):
         dir_rule = overrides.get('dir_rule')
         if dir_rule:
-            option.dir_rule = DirRule(dir_rule, base_dir=option.dir_rule.base_dir)
+            option.dir_rule = jmcomic.DirRule(dir_rule, base_dir=option.dir_rule.base_dir)
 
         impl = overrides.get('client_impl')
         if impl:
@@ -171,29 +2469,33 @@ class JmComicPlugin(Star):
             option.download.image.suffix = suffix if suffix.startswith('.') else f'.{suffix}'
 
     async def _run_sync(self, func, *args, **kwargs):
-        loop = asyncio.get_event_loop()
-        return await loop.run_in_executor(None, functools.partial(func, *args, **kwargs))
+        """磁盘与本地文件操作"""
+        return await self._disk_lane.run(functools.partial(func, *args, **kwargs))
+
+    async def _run_net(self, func, *args, **kwargs):
+        return await self._net_lane.run(functools.partial(func, *args, **kwargs))
+
+    async def _safe_call(self, span: str, func, *args, **kwargs):
+        return await self._safe_run(self._net_lane, span, func, *args, **kwargs)
 
-    async def _safe_call(self, func, *args, **kwargs):
+    async def _safe_run(self, lane: WorkerLane, span: str, func, *args, **kwargs):
+        """span 为耗时统计的阶段名；由调用方给出，jmcomic 带缓存的方法的 __name__ 都是 cache_wrapper"""
         try:
-            return await self._run_sync(func, *args, **kwargs)
-        except MissingAlbumPhotoException as e:
+            with self._metrics.span(span):
+                return await lane.run(functools.partial(func, *args, **kwargs))
+        except jmcomic.MissingAlbumPhotoException as e:
             raise Exception(f"本子/章节不存在: {e}") from e
-        except RequestRetryAllFailException as e:
+        except jmcomic.RequestRetryAllFailException as e:
             raise Exception(f"请求重试失败，请稍后重试: {e}") from e
-        except JmcomicException as e:
+        except jmcomic.JmcomicException as e:
             raise Exception(f"jmcomic 错误: {e}") from e
         except Exception as e:
             logger.error(traceback.format_exc())
             raise Exception(f"未知错误: {e}") from e
 
     async def _safe_call_with_timeout(self, func, timeout=60, *args, **kwargs):
-        loop = asyncio.get_event_loop()
         try:
-            return await asyncio.wait_for(
-                loop.run_in_executor(None, functools.partial(func, *args, **kwargs)),
-                timeout=timeout
-            )
+            return await self._net_lane.run(functools.partial(func, *args, **kwargs), timeout=timeout)
         except asyncio.TimeoutError:
             raise TimeoutError(f"操作超时（{timeout}秒）") from None
         except TimeoutError:
@@ -202,18 +2504,170 @@ class JmComicPlugin(Star):
             logger.error(traceback.format_exc())
             raise
 
-    def _create_range_downloader(self, start: int, end: int):
-        class RangeDownloader(JmDownloader):
+    def _new_pdf_pipeline(self, quality: Optional[int], max_size: int) -> PdfPipeline:
+        # 未指定质量时，可直接嵌入的 JPEG 原样写入，只转码确有需要的页面
+        passthrough = quality is None
+        if quality is None:
+            quality = self.default_pdf_quality
+        quality = max(1, min(100, quality))
+        return PdfPipeline(self._cpu_lane, quality, max_size, passthrough, self._decode_budget)
+
+    def _get_manifest(self, album_id: str) -> AlbumManifest:
+        # 同一本子的并发任务共用一个清单实例，避免互相覆盖
+        with self._manifest_lock:
+            manifest = self._manifests.get(album_id)
+            if manifest is None:
+                manifest = AlbumManifest(self.global_base_dir / "manifests" / f"{album_id}.json")
+                self._manifests[album_id] = manifest
+            return manifest
+
+    def _album_dir_for(self, photo_dir: Path) -> Path:
+        # 判断是否有章节子文件夹
+        if photo_dir.parent == self.global_base_dir:
+            # 图片直接保存在本子目录下（无章节子文件夹）
+            return photo_dir
+        # 有章节子文件夹，本子目录为父目录
+        return photo_dir.parent
+
+    def _record_chapter(self, album_id: Optional[str], album_dir: Path, chapter_dir: Path, photo_id: Optional[str],
+                        last_access: Optional[float] = None):
+        images = size = 0
+        with os.scandir(chapter_dir) as it:
+            for entry in it:
+                if entry.is_file() and not os.path.splitext(entry.name)[0].endswith(PART_MARKER):
+                    images += 1
+                    size += entry.stat().st_size
+        self._catalog.record_chapter(album_id, album_dir, chapter_dir, photo_id, images, size, last_access)
+
+    def _import_storage(self):
+        """首次建立存储索引时登记已有的本子目录与封面，之后清理只查询索引"""
+        try:
+            albums = 0
+            for album_dir in self.global_base_dir.iterdir():
+                if not album_dir.is_dir() or album_dir.name in STORAGE_DIRS:
+                    continue
+                album_dir = album_dir.resolve()
+                mtime = album_dir.stat().st_mtime
+                chapter_dirs = [d for d in album_dir.iterdir() if d.is_dir()] or [album_dir]
+                for chapter_dir in chapter_dirs:
+                    self._record_chapter(None, album_dir, chapter_dir, None, mtime)
+                albums += 1
+            self._covers.import_existing()
+            logger.info(f"已建立存储索引，登记 {albums} 个本子目录")
+        except Exception as e:
+            logger.error(f"建立存储索引失败: {e}")
+
+    def _create_downloader(self, manifest: AlbumManifest, chapter_range: Optional[Tuple[int, int]] = None,
+                           packager: Optional[ZipPackager] = None, pdf_pipeline: Optional[PdfPipeline] = None,
+                           progress: Optional[DownloadProgress] = None,
+                           chapter_dirs: Optional[Dict[str, Path]] = None, overrides: Optional[dict] = None):
+        """chapter_dirs 不为空时，记录本次范围内每个章节（包括跳过的已完整章节）的图片目录；
+        overrides 为创建 option 时的命令覆盖项，下载复用与之对应的共享客户端"""
+        plugin = self
+
+        class ManifestDownloader(jmcomic.JmDownloader):
+            def __init__(self, option):
+                super().__init__(option)
+                self.client = AtomicImageClient(self.client, plugin._throttle)
+
+            def create_client(self):
+                # 与搜索、详情等命令共用同一个客户端，连接池与 cookies 在下载之间复用
+                return plugin._options.get_client(overrides)
+
+            def execute_on_condition(self, iter_objs, apply, count_batch, level=None):
+                # 图片线程数只作为并发的起点，实际同时下载的图片数由 DownloadThrottle 调整
+                if level == jmcomic.JmRuntime.LEVEL_IMAGE and plugin._throttle.adaptive:
+                    plugin._throttle.start_at(count_batch)
+                    count_batch = plugin._throttle.max_limit
+                elif level == jmcomic.JmRuntime.LEVEL_PHOTO and progress is not None:
+                    progress.expect_chapters(len(self.do_filter(iter_objs)))
+                return super().execute_on_condition(iter_objs, apply, count_batch, level)
+
             def do_filter(self, detail):
                 if detail.is_album():
-                    album_len = len(detail)
-                    s = max(0, start - 1)
-                    e = min(album_len, end)
-                    if s >= e:
-                        return []
-                    return detail[s:e]
+                    return plugin._select_chapters(detail, chapter_range)
                 return detail
-        return RangeDownloader
+
+            def download_by_photo_detail(self, photo):
+                # 清单中已完整的章节直接跳过，连章节详情请求都省去
+                if manifest.photo_complete(photo.photo_id):
+                    logger.debug(f"章节 {photo.photo_id} 已完整下载，跳过")
+                    if chapter_dirs is not None:
+                        saved = manifest.photo_dir(photo.photo_id)
+                        chapter_dirs[str(photo.photo_id)] = Path(saved or self.option.decide_image_save_dir(photo)).resolve()
+                    if progress is not None:
+                        images = manifest.photo_images(photo.photo_id)
+                        progress.add_chapter(images, done=images)
+                    return
+                return super().download_by_photo_detail(photo)
+
+            def before_photo(self, photo):
+                super().before_photo(photo)
+                if progress is not None:
+                    progress.add_chapter(len(photo))
+
+            def before_image(self, image, img_save_path):
+                # 清单之外的已有文件（如旧版本非原子写入的图片）需校验完整性，损坏则重新下载
+                if image.exists and not manifest.image_recorded(image.from_photo.photo_id, img_save_path) \
+                        and not _image_intact(img_save_path):
+                    logger.warning(f"图片不完整，重新下载: {img_save_path}")
+                    os.remove(img_save_path)
+                    image.exists = False
+                super().before_image(image, img_save_path)
+
+            def after_image(self, image, img_save_path):
+                super().after_image(image, img_save_path)
+                manifest.record_image(image.from_photo.photo_id, img_save_path)
+                if image.exists:
+                    plugin._metrics.inc("images_cached")
+                    if progress is not None:
+                        progress.image_done(cached=True)
+                else:
+                    nbytes = os.path.getsize(img_save_path)
+                    plugin._metrics.inc("images_downloaded")
+                    plugin._metrics.inc("downloaded_bytes", nbytes)
+                    if progress is not None:
+                        progress.image_done(nbytes)
+                if pdf_pipeline is not None and os.path.splitext(img_save_path)[1].lower() in IMAGE_SUFFIXES:
+                    # 图片一落盘就开始转码，与后续图片的下载并行
+                    pdf_pipeline.submit(img_save_path)
+
+            def after_photo(self, photo):
+                super().after_photo(photo)
+                manifest.finish_photo(photo.photo_id, len(photo))
+                photo_dir = Path(self.option.decide_image_save_dir(photo)).resolve()
+                album_dir = plugin._album_dir_for(photo_dir)
+                if chapter_dirs is not None:
+                    chapter_dirs[str(photo.photo_id)] = photo_dir
+                try:
+                    plugin._record_chapter(photo.album_id, album_dir, photo_dir, photo.photo_id)
+                except Exception as e:
+                    logger.warning(f"登记章节失败 {photo_dir}: {e}")
+                if packager is not None:
+                    # 章节一完成就写入 ZIP，打包与后续章节的下载同时进行
+                    packager.add_tree(photo_dir, album_dir.parent)
+        return ManifestDownloader
+
+    @staticmethod
+    def _select_chapters(album, chapter_range: Optional[Tuple[int, int]]) -> list:
+        """按 1 起始、含两端的章节范围截取本子的章节；范围为空时返回全部章节"""
+        if not chapter_range:
+            return album
+        start, end = chapter_range
+        s = max(0, start - 1)
+        e = min(len(album), end)
+        if s >= e:
+            return []
+        return album[s:e]
+
+    def _source_dirs(self, album, chapter_range: Optional[Tuple[int, int]], chapter_dirs: Dict[str, Path]) -> List[Path]:
+        """本次范围内各章节的图片目录，按章节顺序去重；没有章节子文件夹时只有本子目录一项"""
+        dirs = []
+        for photo in self._select_chapters(album, chapter_range):
+            photo_dir = chapter_dirs.get(str(photo.photo_id))
+            if photo_dir is not None and photo_dir not in dirs and photo_dir.exists():
+                dirs.append(photo_dir)
+        return dirs
 
     def _parse_album_command(self, args: List[str], cmd_prefix_len: int) -> Tuple[str, Optional[Tuple[int, int]], Dict[str, Any]]:
         if len(args) <= cmd_prefix_len:
@@ -266,7 +2720,7 @@ class JmComicPlugin(Star):
             yield event.plain_result(f"开始下载 {album_id} 第{start}~{end}章喵")
         else:
             yield event.plain_result(f"开始下载 {album_id}喵")
-        asyncio.create_task(self._download_album_task(event, album_id, pack=False, overrides=overrides, extra=extra))
+        self._spawn(self._download_album_task(event, album_id, pack=False, overrides=overrides, extra=extra))
 
     @filter.command("jmz")
     async def command_jmz(self, event: AstrMessageEvent):
@@ -287,7 +2741,38 @@ class JmComicPlugin(Star):
             yield event.plain_result(f"开始打包 {album_id} 第{start}~{end}章喵")
         else:
             yield event.plain_result(f"开始打包 {album_id}喵")
-        asyncio.create_task(self._download_album_task(event, album_id, pack=True, overrides=overrides, extra=extra))
+        self._spawn(self._download_album_task(event, album_id, pack=True, overrides=overrides, extra=extra))
+
+    @staticmethod
+    def _parse_batch_args(args: List[str]) -> Tuple[List[str], Dict[str, Any]]:
+        """批量命令只接受 --key=value 与 --flag 形式的参数，其余均为位置参数"""
+        positional, extra = [], {}
+        for arg in args:
+            if arg.startswith('--'):
+                key, _, value = arg[2:].partition('=')
+                extra[key] = value if value else True
+            else:
+                positional.append(arg)
+        return positional, extra
+
+    @filter.command("jm batch")
+    async def command_batch(self, event: AstrMessageEvent):
+        positional, extra = self._parse_batch_args(event.message_str.strip().split()[2:])
+        if not positional:
+            yield event.plain_result(
+                "请提供本子ID或来源，例如：\n/jm batch 123 456 789\n/jm batch rank week 1 --top=10\n"
+                "/jm batch search 关键词 --top=5 --zip --merge"
+            )
+            return
+        pack = bool(extra.get('zip'))
+        if not pack and not PDF_AVAILABLE:
+            yield event.plain_result("PDF 库未安装，无法生成 PDF，可加 --zip 改为打包")
+            return
+        if not pack and 'quality' in extra and not str(extra['quality']).isdigit():
+            yield event.plain_result("--quality 需要是 1~100 的整数")
+            return
+        yield event.plain_result("正在获取本子信息喵")
+        self._spawn(self._batch_task(event, positional, pack, extra))
 
     @filter.command("jms")
     async def command_jms(self, event: AstrMessageEvent):
@@ -300,7 +2785,7 @@ class JmComicPlugin(Star):
         if len(args) >= 3 and args[2].isdigit():
             page = int(args[2])
         yield event.plain_result(f"搜索「{keyword}」第{page}页")
-        asyncio.create_task(self._do_search(event, keyword, page))
+        self._spawn(self._do_search(event, keyword, page))
 
     @filter.command("jmr")
     async def command_jmr(self, event: AstrMessageEvent):
@@ -313,7 +2798,7 @@ class JmComicPlugin(Star):
             if len(args) >= 3 and args[2].isdigit():
                 page = int(args[2])
         yield event.plain_result(f"获取{rank_type}榜第{page}页喵")
-        asyncio.create_task(self._do_ranking(event, rank_type, page))
+        self._spawn(self._do_ranking(event, rank_type, page))
 
     @filter.command("jm detail")
     async def command_detail(self, event: AstrMessageEvent):
@@ -325,375 +2810,1181 @@ class JmComicPlugin(Star):
         async for ret in self._do_detail(event, album_id):
             yield ret
 
+    @filter.command("jm resume")
+    async def command_resume(self, event: AstrMessageEvent):
+        args = event.message_str.strip().split()
+        if len(args) < 3:
+            pending = await self._run_sync(self._list_pending_downloads)
+            if not pending:
+                yield event.plain_result("没有未完成的下载喵")
+                return
+            lines = ["未完成的下载："]
+            for album_id, complete, images in pending:
+                lines.append(f"  {album_id}：已完成 {complete} 章、{images} 张图")
+            lines.append("使用 /jm resume <本子号> 继续下载")
+            yield event.plain_result("\n".join(lines))
+            return
+
+        album_id = args[2]
+        manifest = await self._run_sync(self._get_manifest, album_id)
+        request = manifest.pending_request
+        if request is None:
+            yield event.plain_result(f"{album_id} 没有未完成的下载喵")
+            return
+        overrides = {}
+        if request.get('chapter_range'):
+            overrides['chapter_range'] = tuple(request['chapter_range'])
+        complete, images = manifest.progress()
+        yield event.plain_result(f"继续下载 {album_id}（已完成 {complete} 章、{images} 张图）喵")
+        self._spawn(self._download_album_task(
+            event, album_id, pack=request.get('pack', False), overrides=overrides, extra=request.get('extra', {})
+        ))
+
+    def _list_pending_downloads(self) -> List[Tuple[str, int, int]]:
+        manifest_dir = self.global_base_dir / "manifests"
+        if not manifest_dir.exists():
+            return []
+        album_ids = {p.stem for p in manifest_dir.iterdir() if p.suffix in (".json", ".journal")}
+        pending = []
+        for album_id in sorted(album_ids):
+            manifest = self._get_manifest(album_id)
+            if manifest.pending_request is not None:
+                pending.append((album_id, *manifest.progress()))
+        return pending
+
+    @filter.command("jm queue")
+    async def command_queue(self, event: AstrMessageEvent):
+        user_id = event.get_sender_id()
+        # 预取任务在下方单独显示
+        running = [job for job in self._scheduler.running() if job.user != PREFETCH_USER]
+        queued = self._scheduler.queued()
+        lines = [f"下载队列：进行中 {len(running)} 个，排队 {len(queued)} 个"]
+        for job in running:
+            mine = "（你）" if job.user == user_id else ""
+            line = f"  ▶ {job.label}{mine} 已运行 {int(time.monotonic() - job.started_at)} 秒"
+            progress = self._progress.get(job.key)
+            if progress is not None and not progress.finished:
+                snap = progress.snapshot()
+                if snap["total"]:
+                    line += f"，{snap['done']}/{snap['total']} 张"
+            lines.append(line)
+        for pos, job in enumerate(queued, 1):
+            mine = "（你）" if job.user == user_id else ""
+            wait = self._scheduler.estimate_wait(pos)
+            lines.append(f"  {pos}. {job.label}{mine} 预计等待约 {max(1, round(wait / 60))} 分钟")
+        if self._prefetch_album is not None:
+            lines.append(f"空闲预取：{self._prefetch_album}（有新的下载请求时立即暂停）")
+        if not running and not queued:
+            lines.append("当前没有下载任务喵")
+        elif self._throttle.active:
+            throttle = self._throttle.summary()
+            line = f"图片下载：{throttle['active']} 张进行中"
+            if self._throttle.adaptive:
+                line += f"，并发上限 {throttle['limit']}"
+            if throttle["throughput"]:
+                line += f"，约 {_format_bytes(throttle['throughput'])}/s"
+            if self._throttle.rate:
+                line += f"（限速 {_format_bytes(self._throttle.rate)}/s）"
+            lines.append(line)
+        yield event.plain_result("\n".join(lines))
+
+    @filter.command("jm progress")
+    async def command_progress(self, event: AstrMessageEvent):
+        args = event.message_str.strip().split()
+        album_id = args[2] if len(args) >= 3 else None
+        lines = []
+        for job in self._scheduler.running():
+            if album_id is not None and job.label != album_id:
+                continue
+            progress = self._progress.get(job.key)
+            lines.append(progress.describe() if progress is not None else f"{job.label}：准备下载")
+        for pos, job in enumerate(self._scheduler.queued(), 1):
+            if album_id is None or job.label == album_id:
+                lines.append(f"{job.label}：排队中，第 {pos} 位，预计等待约 {max(1, round(self._scheduler.estimate_wait(pos) / 60))} 分钟")
+        if not lines:
+            yield event.plain_result(f"{album_id} 当前没有下载任务喵" if album_id else "当前没有下载任务喵")
+            return
+        yield event.plain_result("\n".join(lines))
+
+    @filter.command("jm storage")
+    async def command_storage(self, event: AstrMessageEvent):
+        usage = await self._run_sync(self._catalog.usage)
+        budgets = dict(self.budgets, covers=self._covers.max_bytes) if self.cleanup_mode == "budget" else {}
+        labels = {"images": "原图", "pdf": "PDF", "zip": "ZIP", "covers": "封面"}
+        total = sum(item["bytes"] for item in usage.values())
+        lines = [f"存储占用：共 {_format_bytes(total)}（清理模式 {self.cleanup_mode}，淘汰策略 {self.eviction_policy}）"]
+        for kind, label in labels.items():
+            item = usage[kind]
+            line = f"  {label}：{item['count']} 个，{_format_bytes(item['bytes'])}"
+            if budgets.get(kind):
+                line += f" / {_format_bytes(budgets[kind])}（{item['bytes'] * 100 // budgets[kind]}%）"
+            if item["hits"]:
+                line += f"，累计命中 {item['hits']} 次"
+            lines.append(line)
+        lines.append("本次运行命中率：")
+        lines.append(f"  产物缓存 {_hit_rate(self._artifact_cache.hits, self._artifact_cache.misses)}")
+        lines.append(f"  封面 {_hit_rate(self._covers.hits, self._covers.misses)}")
+        response_stats = self._response_cache.stats_snapshot()
+        for endpoint, label in (("search", "搜索"), ("ranking", "排行榜"), ("detail", "详情")):
+            stats = response_stats[endpoint]
+            lines.append(f"  {label} {_hit_rate(stats['hit'] + stats['stale'], stats['miss'])}")
+        yield event.plain_result("\n".join(lines))
+
+    @filter.permission_type(filter.PermissionType.ADMIN)
+    @filter.command("jm stats")
+    async def command_stats(self, event: AstrMessageEvent):
+        summary = self._metrics.summary()
+        if not summary:
+            yield event.plain_result("暂无统计数据喵")
+            return
+        lines = ["各阶段耗时（秒，分位数取最近 512 次）："]
+        for stage, item in sorted(summary.items(), key=lambda kv: -kv[1]["avg"] * kv[1]["count"]):
+            lines.append(
+                f"  {stage}: {item['count']} 次，平均 {item['avg']:.2f}，p50 {item['p50']:.2f}，"
+                f"p95 {item['p95']:.2f}，p99 {item['p99']:.2f}，最大 {item['max']:.2f}"
+            )
+        counters = self._metric_counters()
+        lines.append("计数：")
+        for name, value in sorted(counters.items()):
+            shown = _format_bytes(value) if name.endswith("_bytes") else f"{value:g}"
+            lines.append(f"  {name}: {shown}")
+        lines.append("执行器（工作线程/进程、运行、排队、累计提交、提交时已满载、取消）：")
+        for lane in self._lanes:
+            item = lane.summary()
+            lines.append(f"  {lane.name}: {item['workers']}，{item['running']}，{item['queued']}，"
+                         f"{item['submitted']}，{item['saturated']}，{item['cancelled']}")
+        domains = self._domain_health.summary()
+        if domains:
+            lines.append(f"域名（最近 {self._domain_health.window} 次请求/探测）：")
+            for domain in self._domain_health.rank(list(domains)):
+                item = domains[domain]
+                lines.append(f"  {domain}: 平均 {item['latency'] * 1000:.0f}ms，失败率 {item['error_rate']:.0%}，"
+                             f"{item['samples']:g} 次")
+        yield event.plain_result("\n".join(lines))
+
+    def _metric_counters(self) -> Dict[str, float]:
+        """Metrics 自身的计数器加上各缓存已有的命中统计"""
+        counters = dict(self._metrics.counters)
+        counters["artifact_cache_hits"] = self._artifact_cache.hits
+        counters["artifact_cache_misses"] = self._artifact_cache.misses
+        counters["cover_hits"] = self._covers.hits
+        counters["cover_misses"] = self._covers.misses
+        counters["domain_failovers"] = self._domain_health.failovers
+        counters["image_errors"] = self._throttle.errors
+        counters["image_throttled"] = self._throttle.throttled
+        for lane in self._lanes:
+            item = lane.summary()
+            for key in ("submitted", "saturated", "cancelled"):
+                counters[f"executor_{lane.name}_{key}"] = item[key]
+        for endpoint, stats in self._response_cache.stats_snapshot().items():
+            for kind, value in stats.items():
+                counters[f"response_{endpoint}_{kind}"] = value
+        return counters
+
+    def _metric_gauges(self) -> Dict[str, float]:
+        gauges = {}
+        for lane in self._lanes:
+            item = lane.summary()
+            for key in ("workers", "running", "queued"):
+                gauges[f"executor_{lane.name}_{key}"] = item[key]
+        gauges["image_concurrency_limit"] = self._throttle.limit
+        return gauges
+
+    async def _export_metrics(self):
+        """定期把统计写成 Prometheus 文本格式，供 node_exporter 的 textfile collector 采集"""
+        while True:
+            await asyncio.sleep(60)
+            try:
+                text = self._metrics.prometheus(self._metric_counters(), self._metric_gauges())
+                await self._run_sync(self._write_text_atomic, self.metrics_file, text)
+            except Exception as e:
+                logger.warning(f"导出统计失败: {e}")
+
+    @staticmethod
+    def _write_text_atomic(path: Path, text: str):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp, path)
+
     @filter.command("jm help")
     async def command_help(self, event: AstrMessageEvent):
         help_text = """
 【jm下载插件使用说明】
 
-/jm download <本子号> [范围] [--quality=80] [--max-size=1920]
-    下载本子，生成PDF。范围示例：1-10 或 5，压缩参数可选。
-/jmz <本子号> [范围]         下载并打包ZIP
+/jm download <本子号> [范围] [--quality=80] [--max-size=1920] [--split=chapter|50MB]
+    下载本子，生成PDF。范围示例：1-10 或 5，压缩参数可选；不指定质量时 JPEG 原图直接写入。
+    --split 按章节或按大小分卷，每卷生成后立即发送。
+/jmz <本子号> [范围] [--split=chapter|50MB]  下载并打包ZIP
+/jm batch <本子号...> [--zip] [--merge] [--quality=80]
+    批量下载多个本子（最多 batch_max_albums 本），--zip 改为打包，--merge 合并为一个ZIP发送。
+    也可用 rank [week|day] [页码] 或 search <关键词> [页码] 作为来源，--top=N 取前 N 本。
 /jms <关键词> [页码]         搜索
 /jmr [week|day] [页码]       排行榜
 /jm detail <本子号>          查看详情
+/jm resume [本子号]          查看/继续未完成的下载
+/jm queue                    查看下载队列
+/jm progress [本子号]        查看下载进度（已下载张数、速度、预计剩余时间）
+/jm storage                  查看存储占用与缓存命中率
+/jm stats                    查看各阶段耗时统计（管理员）
 /jm help                     本帮助
         """.strip()
         yield event.plain_result(help_text)
 
-    async def _generate_compressed_pdf(self, image_dir: Path, output_pdf: Path, quality: int = None, max_size: int = 0) -> bool:
-        if not PDF_AVAILABLE:
-            logger.error("PDF 库未安装")
-            return False
-
-        if quality is None:
-            quality = self.default_pdf_quality
-        quality = max(1, min(100, quality))
-
-        if not image_dir.exists():
-            logger.error(f"图片目录不存在: {image_dir.resolve()}")
+    @_timed("transcode_pages")
+    async def _transcode_pages(self, image_files: List[Path], pipeline: PdfPipeline) -> Optional[List[List[str]]]:
+        # 下载阶段已提交的页面直接复用其结果，其余页面现在提交；提交时要读取文件头估算解码内存，放到磁盘线程
+        futures = await self._run_sync(pipeline.submit_all, [str(img_path) for img_path in image_files])
+        jobs = [asyncio.wrap_future(future) for future in futures]
+        # gather 按提交顺序返回结果，页序与 image_files 一致
+        results = await asyncio.gather(*jobs, return_exceptions=True)
+        for img_path, ret in zip(image_files, results):
+            if isinstance(ret, BaseException):
+                logger.error(f"处理图片失败 {img_path}: {ret}")
+                return None
+        return list(results)
+
+    def _quality_steps(self, quality: Optional[int], max_size: int) -> List[Tuple[int, int]]:
+        """分卷超出大小上限时依次尝试的 (质量, 最长边)：先逐级降质，最后再缩小尺寸"""
+        start = quality or self.default_pdf_quality
+        qualities = list(range(start - VOLUME_QUALITY_STEP, VOLUME_MIN_QUALITY, -VOLUME_QUALITY_STEP))
+        if start > VOLUME_MIN_QUALITY:
+            qualities.append(VOLUME_MIN_QUALITY)
+        steps = [(q, max_size) for q in qualities]
+        fallback_size = min(max_size, VOLUME_FALLBACK_MAX_SIZE) if max_size else VOLUME_FALLBACK_MAX_SIZE
+        if fallback_size != max_size:
+            steps.append((min(start, VOLUME_MIN_QUALITY), fallback_size))
+        return steps
+
+    @_timed("generate_pdf")
+    async def _generate_compressed_pdf(self, image_files: List[Path], pages: List[List[str]], output_pdf: Path,
+                                       quality: Optional[int] = None, max_size: int = 0) -> bool:
+        """把已处理好的页面写成一个 PDF；超出 max_file_mb 时逐级降低质量重新转码这一卷"""
+        try:
+            await self._run_sync(self._write_pdf, pages, output_pdf)
+        except Exception as e:
+            logger.error(f"写入 PDF 失败: {e}")
             return False
+        if self.max_file_bytes <= 0:
+            return True
+
+        size = output_pdf.stat().st_size
+        for step_quality, step_max_size in self._quality_steps(quality, max_size):
+            if size <= self.max_file_bytes:
+                break
+            logger.info(f"{output_pdf.name} 大小 {size / 1024 / 1024:.1f}MB 超出上限，"
+                        f"以质量 {step_quality}、最长边 {step_max_size or '不限'} 重新生成")
+            pipeline = self._new_pdf_pipeline(step_quality, step_max_size)
+            try:
+                step_pages = await self._transcode_pages(image_files, pipeline)
+                if step_pages is None:
+                    return False
+                await self._run_sync(self._write_pdf, step_pages, output_pdf)
+            except Exception as e:
+                logger.error(f"写入 PDF 失败: {e}")
+                return False
+            finally:
+                await self._run_sync(pipeline.close)
+            size = output_pdf.stat().st_size
+        if size > self.max_file_bytes:
+            logger.warning(f"{output_pdf.name} 降至最低质量后仍有 {size / 1024 / 1024:.1f}MB，超出单文件上限")
+        return True
+
+    async def _build_pdf_volumes(self, album_dir: Path, sources: List[Path], cache_key: str, album_id: str,
+                                 quality: Optional[int], max_size: int, split: Optional[Any],
+                                 pipeline: Optional[PdfPipeline], publish):
+        """sources 为本次范围内的章节目录，只有其中的图片进入 PDF；pipeline 为下载时已在转码的流水线，
+        为空时新建一条，只处理本次扫描到的图片。每卷写好即 publish"""
+        if not PDF_AVAILABLE:
+            raise JmTaskError("PDF 库未安装，无法生成 PDF")
 
         # 防止误用根目录
-        if image_dir == self.global_base_dir:
+        if album_dir == self.global_base_dir:
             logger.error("图片目录被设置为根目录，终止PDF生成")
-            return False
+            raise JmTaskError("PDF 生成失败，请查看日志")
 
         try:
-            image_files = sorted(
-                [f for f in image_dir.rglob("*") if f.is_file() and f.suffix.lower() in ('.jpg', '.jpeg', '.png', '.gif', '.webp')]
-            )
-            logger.info(f"在 {image_dir.resolve()} 找到 {len(image_files)} 个图片文件")
-            if image_files:
-                logger.debug(f"前5个文件: {[f.name for f in image_files[:5]]}")
+            image_files = await self._run_sync(self._scan_sources, sources)
         except Exception as e:
             logger.error(f"扫描图片目录失败: {e}")
-            return False
-
+            raise JmTaskError("PDF 生成失败，请查看日志")
+        logger.info(f"在 {album_dir} 找到 {len(image_files)} 个图片文件")
         if not image_files:
-            logger.warning("没有找到支持的图片")
-            return False
+            raise JmTaskError("没有找到支持的图片")
 
-        tmpdir_obj = tempfile.TemporaryDirectory(prefix="jm_pdf_")
-        tmpdir = tmpdir_obj.name
+        own_pipeline = pipeline is None
+        if own_pipeline:
+            pipeline = self._new_pdf_pipeline(quality, max_size)
         try:
-            tmp_paths = []
-            for i, img_path in enumerate(image_files):
+            pages = await self._transcode_pages(image_files, pipeline)
+            if pages is None:
+                raise JmTaskError("PDF 生成失败，请查看日志")
+            total = sum(len(p) for p in pages)
+            transcoded = sum(len(p) for p in pages if pipeline.is_transcoded(p))
+            tiled = sum(1 for p in pages if len(p) > 1)
+            logger.info(f"共 {total} 页，直通 {total - transcoded} 页，转码 {transcoded} 页，其中 {tiled} 张长图切分成多页")
+            self._metrics.inc("pages_transcoded", transcoded)
+            self._metrics.inc("pages_passthrough", total - transcoded)
+            self._metrics.inc("strips_tiled", tiled)
+
+            sizes = await self._run_sync(self._page_sizes, pages)
+            volumes = self._plan_volumes([str(f) for f in image_files], sizes, split)
+            for n, indexes in enumerate(volumes, 1):
+                volume = n if len(volumes) > 1 else 0
+                output_pdf = self._artifact_cache.path_for(cache_key, album_id, "pdf", volume)
+                if not await self._generate_compressed_pdf(
+                    [image_files[i] for i in indexes], [pages[i] for i in indexes], output_pdf, quality, max_size
+                ):
+                    raise JmTaskError("PDF 生成失败，请查看日志")
+                logger.info(f"PDF 生成成功: {output_pdf}")
+                name = f"{album_id}_vol{n}.pdf" if volume else f"{album_id}.pdf"
+                publish(self._make_part(output_pdf, name, n, len(volumes), album_dir))
+        finally:
+            if own_pipeline:
                 try:
-                    img = PILImage.open(img_path)
-                    if img.mode != 'RGB':
-                        img = img.convert('RGB')
-                    if max_size > 0:
-                        img.thumbnail((max_size, max_size), PILImage.Resampling.LANCZOS)
-                    out_name = f"{img_path.stem}_{i}.jpg"
-                    out_path = Path(tmpdir) / out_name
-                    img.save(out_path, "JPEG", quality=quality, optimize=True)
-                    tmp_paths.append(str(out_path))
+                    await self._run_sync(pipeline.close)
                 except Exception as e:
-                    logger.error(f"处理图片失败 {img_path}: {e}")
-                    return False
-
-            logger.info(f"临时图片已保存至 {tmpdir}，共 {len(tmp_paths)} 个")
-
+                    logger.warning(f"清理临时目录失败: {e}")
+
+    @_timed("build_zip")
+    async def _build_zip_volumes(self, album_dir: Path, sources: List[Path], cache_key: str, album_id: str, split: Any,
+                                 publish):
+        files = await self._run_sync(self._list_sources, sources)
+        sizes = await self._run_sync(self._file_sizes, files)
+        volumes = self._plan_volumes(files, sizes, split)
+        for n, indexes in enumerate(volumes, 1):
+            volume = n if len(volumes) > 1 else 0
+            zip_path = self._artifact_cache.path_for(cache_key, album_id, "zip", volume)
+            packager = ZipPackager(zip_path)
             try:
-                with open(output_pdf, "wb") as f:
-                    f.write(img2pdf.convert(tmp_paths))
-                logger.info(f"PDF 生成成功: {output_pdf.resolve()}")
-                return True
-            except Exception as e:
-                logger.error(f"img2pdf 转换失败: {e}")
-                return False
-        finally:
-            try:
-                tmpdir_obj.cleanup()
-            except Exception as e:
-                logger.warning(f"清理临时目录失败: {e}")
+                await self._run_sync(packager.add_files, [files[i] for i in indexes], album_dir.parent)
+                await self._run_sync(packager.close)
+            except BaseException as e:
+                await self._run_sync(packager.abort)
+                if isinstance(e, Exception):
+                    logger.error(f"压缩失败: {e}")
+                    raise JmTaskError("打包失败") from e
+                raise
+            if 0 < self.max_file_bytes < zip_path.stat().st_size:
+                # ZIP 保存的是原图，无法降质，只能提示
+                logger.warning(f"{zip_path.name} 超出单文件上限，可改用更小的 --split 分卷")
+            name = f"{album_dir.name}_vol{n}.zip" if volume else album_dir.with_suffix(".zip").name
+            publish(self._make_part(zip_path, name, n, len(volumes), album_dir))
 
-    async def _download_album_task(self, event: AstrMessageEvent, album_id: str, pack: bool, overrides: dict, extra: dict):
-        user_id = event.get_sender_id()
-        sent_files = []
-        try:
-            option = await self._get_option(user_id, overrides)
-            if option is None:
-                await event.send(event.plain_result("无法创建下载配置"))
-                return
-
-            chapter_range = overrides.get('chapter_range')
-            downloader_class = None
-            if chapter_range:
-                start, end = chapter_range
-                downloader_class = self._create_range_downloader(start, end)
-
-            result = await self._safe_call(download_album, album_id, option, downloader=downloader_class)
-            if isinstance(result, tuple) and len(result) == 2:
-                album, downloader = result
+    @staticmethod
+    def _plan_volumes(files: List[str], sizes: List[int], split: Optional[Any]) -> List[List[int]]:
+        """按章节目录或累计大小把文件划分为若干卷，返回每卷的文件下标"""
+        if split is None:
+            return [list(range(len(files)))]
+        volumes, current, current_size, last_dir = [], [], 0, None
+        for i, (file, size) in enumerate(zip(files, sizes)):
+            file_dir = os.path.dirname(file)
+            if split == "chapter":
+                new_volume = file_dir != last_dir
             else:
-                album = result
-                downloader = None
+                new_volume = current_size + size > split
+            if current and new_volume:
+                volumes.append(current)
+                current, current_size = [], 0
+            current.append(i)
+            current_size += size
+            last_dir = file_dir
+        if current:
+            volumes.append(current)
+        return volumes
 
-            # 通过第一个章节的图片目录推断本子根目录
-            if len(album) == 0:
-                await event.send(event.plain_result("本子无章节，无法确定图片目录"))
-                return
-
-            first_photo = album[0]
-            first_photo_dir = Path(option.decide_image_save_dir(first_photo)).resolve()
-            logger.info(f"第一个章节图片目录: {first_photo_dir}")
-
-            # 判断是否有章节子文件夹
-            if first_photo_dir.parent == self.global_base_dir:
-                # 图片直接保存在本子目录下（无章节子文件夹）
-                album_dir = first_photo_dir
-            else:
-                # 有章节子文件夹，本子目录为父目录
-                album_dir = first_photo_dir.parent
+    @staticmethod
+    def _file_sizes(paths: List[str]) -> List[int]:
+        return [os.path.getsize(p) for p in paths]
 
-            logger.info(f"最终图片下载目录: {album_dir}")
+    @staticmethod
+    def _page_sizes(pages: List[List[str]]) -> List[int]:
+        """每张原图输出的页面总大小"""
+        return [sum(os.path.getsize(p) for p in group) for group in pages]
 
-            # 安全校验
-            if album_dir == self.global_base_dir:
-                logger.error("仍然无法确定正确的本子目录，终止下载")
-                await event.send(event.plain_result("无法确定本子图片目录，请检查配置"))
-                return
+    @staticmethod
+    def _make_part(path: Path, name: str, volume: int, volumes: int, album_dir: Path) -> Dict[str, Any]:
+        return {'path': str(path), 'name': name, 'volume': volume, 'volumes': volumes, 'album_dir': str(album_dir)}
 
-            if not album_dir.exists():
-                logger.error(f"图片目录不存在: {album_dir}")
-                await event.send(event.plain_result("图片目录未创建，下载可能失败"))
-                return
+    @staticmethod
+    def _scan_images(image_dir: Path) -> List[Path]:
+        return sorted(
+            f for f in image_dir.rglob("*")
+            if f.is_file() and f.suffix.lower() in IMAGE_SUFFIXES and not f.stem.endswith(PART_MARKER)
+        )
 
-            if pack:
-                zip_path = await self._handle_zip_result(event, album_id, album_dir)
-                if zip_path:
-                    sent_files.append(zip_path)
-            else:
-                quality = int(extra.get('quality', self.default_pdf_quality))
-                max_size = int(extra.get('max-size', 0))
-
-                pdf_dir = self.global_base_dir / "pdfs"
-                pdf_dir.mkdir(parents=True, exist_ok=True)
-                pdf_path = pdf_dir / f"{album_id}.pdf"
-
-                success = await self._generate_compressed_pdf(album_dir, pdf_path, quality, max_size)
-                if success:
-                    await event.send(event.chain_result([
-                        Plain(f"本子 {album_id} 下载完成喵，已转换为 PDF（质量={quality}）："),
-                        File(file=str(pdf_path), name=pdf_path.name)
-                    ]))
-                    sent_files.append(pdf_path)
-                else:
-                    await event.send(event.plain_result("PDF 生成失败，请查看日志"))
+    @classmethod
+    def _scan_sources(cls, sources: List[Path]) -> List[Path]:
+        """按章节顺序依次扫描各章节目录"""
+        return [f for source in sources for f in cls._scan_images(source)]
 
-            # 清理逻辑
-            if sent_files and self.cleanup_mode == "after_send":
-                asyncio.create_task(self._delete_after_send(album_dir, sent_files))
-            elif self.cleanup_mode == "count":
-                asyncio.create_task(self._cleanup_old_albums())
+    @staticmethod
+    def _list_sources(sources: List[Path]) -> List[str]:
+        return [f for source in sources for f in ZipPackager.list_tree(source)]
 
+    @staticmethod
+    def _write_pdf(pages: List[List[str]], output_pdf: Path):
+        # 逐页写入文件流，内存中只保留当前一页；先写临时文件再替换，防止发送半成品
+        part_path = output_pdf.with_name(output_pdf.name + ".part")
+        try:
+            with open(part_path, "wb") as f:
+                writer = JpegPdfWriter(f)
+                for group in pages:
+                    for page in group:
+                        writer.add_page(page)
+                writer.close()
+            os.replace(part_path, output_pdf)
+        finally:
+            if part_path.exists():
+                part_path.unlink()
+
+    def _resolve_split(self, value) -> Optional[Any]:
+        """命令中的 --split 与 max_file_mb 合并：设置了单文件上限时，未指定分卷也按上限大小分卷"""
+        split = _parse_split(value)
+        if self.max_file_bytes > 0:
+            if split is None:
+                split = self.max_file_bytes
+            elif split != "chapter":
+                split = min(split, self.max_file_bytes)
+        return split
+
+    @_timed("request")
+    async def _download_album_task(self, event: AstrMessageEvent, album_id: str, pack: bool, overrides: dict, extra: dict):
+        try:
+            await self._deliver_album(event, album_id, pack, overrides, extra, self._send_artifact)
+        except JmTaskError as e:
+            await event.send(event.plain_result(str(e)))
         except Exception as e:
             logger.error(f"下载任务异常: {traceback.format_exc()}")
             await event.send(event.plain_result(f"下载失败: {e}"))
 
-    async def _handle_zip_result(self, event: AstrMessageEvent, item_id: str, folder: Path) -> Optional[Path]:
-        if not folder.exists() or not any(folder.iterdir()):
-            await event.send(event.plain_result("下载完成但文件夹为空"))
-            return None
+    async def _deliver_album(self, event: AstrMessageEvent, album_id: str, pack: bool, overrides: dict, extra: dict,
+                             deliver, quiet: bool = False):
+        """下载并生成一个本子的产物，每卷就绪后调用 deliver(event, album_id, fmt, part, quality)；失败时抛出异常。
+        quiet=True 时不发送排队、合并请求等过程提示（批量下载统一汇报）"""
+        fmt = "zip" if pack else "pdf"
+        chapter_range = overrides.get('chapter_range')
+        quality = int(extra['quality']) if not pack and 'quality' in extra else None
+        max_size = int(extra.get('max-size', 0)) if not pack else 0
+        split = self._resolve_split(extra.get('split'))
+        cache_key = ArtifactCache.make_key(album_id, chapter_range, quality, max_size, fmt, split)
+
+        lease = None
+        job = None
+        reporter = None
+        # 计数在 finally 中归还，获取租约失败或被取消也不会残留
+        self._artifact_waiters[cache_key] = self._artifact_waiters.get(cache_key, 0) + 1
+        try:
+            # 租约覆盖下载、生成到发送完毕的全过程，期间清理不会删除该本子
+            lease = await self._run_sync(self._catalog.acquire, album_id)
+            self._interrupt_prefetch(cache_key)
+            if cache_key in self._inflight and not quiet:
+                await event.send(event.plain_result(f"{album_id} 已有相同任务在进行，完成后一并发送喵"))
+            job = self._get_artifact_job(event, cache_key, album_id, pack, overrides, quality, max_size, split, quiet)
+            if not quiet and self.progress_interval > 0:
+                reporter = asyncio.create_task(self._report_progress(event, cache_key))
+            # 分卷逐个到达，每卷生成后立即交付
+            async for part in job.stream():
+                await deliver(event, album_id, fmt, part, quality)
+        finally:
+            if reporter is not None:
+                reporter.cancel()
+            self._artifact_waiters[cache_key] -= 1
+            last_waiter = self._artifact_waiters[cache_key] == 0
+            if last_waiter:
+                del self._artifact_waiters[cache_key]
+            if lease is not None:
+                await self._run_sync(self._catalog.release, lease)
+            task = job.task if job is not None else None
+            if task is None or not task.done():
+                self._schedule_cleanup(None, [])
+            elif task.cancelled() or task.exception() is not None:
+                if last_waiter and job.parts:
+                    # 构建中途失败，已发出的分卷不会进入缓存
+                    self._spawn(self._run_sync(self._remove_files, [Path(p['path']) for p in job.parts]))
+                self._schedule_cleanup(None, [])
+            elif last_waiter:
+                # 共享同一产物的请求全部发送完毕后才允许 after_send 清理
+                result = task.result()
+                self._schedule_cleanup(Path(result['album_dir']), [Path(p['path']) for p in result['parts']])
+
+    async def _report_progress(self, event: AstrMessageEvent, cache_key: str):
+        """下载期间定时向会话发送进度；没有新进展时不发送，同一会话的进度消息至少间隔 progress_interval 秒"""
+        session = event.get_group_id() or f"private_{event.get_sender_id()}"
+        last_done = -1
+        while True:
+            await asyncio.sleep(self.progress_interval)
+            progress = self._progress.get(cache_key)
+            if progress is None:
+                continue  # 仍在排队，或下载结束后正在生成
+            if progress.finished:
+                return
+            now = time.monotonic()
+            if progress.done == last_done or now - self._progress_sent.get(session, 0) < self.progress_interval:
+                continue
+            last_done = progress.done
+            self._progress_sent[session] = now
+            try:
+                await event.send(event.plain_result(progress.describe()))
+            except Exception as e:
+                logger.warning(f"发送下载进度失败: {e}")
 
-        zip_path = folder.with_suffix(".zip")
+    @contextlib.asynccontextmanager
+    async def _album_lease(self, album_id: str):
+        lease = await self._run_sync(self._catalog.acquire, album_id)
+        try:
+            yield
+        finally:
+            await self._run_sync(self._catalog.release, lease)
+
+    def _get_artifact_job(self, event: Optional[AstrMessageEvent], cache_key: str, album_id: str, pack: bool,
+                          overrides: dict, quality: Optional[int], max_size: int, split: Optional[Any],
+                          quiet: bool = False, prefetch: bool = False) -> ArtifactJob:
+        """同一产物的并发请求共享一次下载与打包，所有等待者收到同样的分卷或同一异常；
+        等待者只读取结果流，单个等待者被取消不影响共享任务和其他等待者。
+        prefetch=True 为空闲预取发起的任务（event 为 None），不记入待继续的下载请求"""
+        job = self._inflight.get(cache_key)
+        if job is None:
+            job = ArtifactJob()
+            job.prefetch = prefetch
+            job.start(self._run_artifact_job(
+                job, event, cache_key, album_id, pack, overrides, quality, max_size, split, quiet
+            ))
+            self._inflight[cache_key] = job
+            job.task.add_done_callback(functools.partial(self._on_job_done, cache_key, job))
+        else:
+            logger.info(f"合并重复请求: {album_id} ({cache_key[:12]})")
+            if job.prefetch and not prefetch:
+                logger.info(f"预取任务 {album_id} 转为普通下载")
+                job.prefetch = False
+        return job
+
+    async def _run_artifact_job(self, job: ArtifactJob, event: Optional[AstrMessageEvent], cache_key: str,
+                                album_id: str, pack: bool, overrides: dict, quality: Optional[int], max_size: int,
+                                split: Optional[Any], quiet: bool = False) -> Dict[str, Any]:
+        # 预取前已确认索引中没有该产物，不再查询，也不计入缓存命中率
+        entry = None if job.prefetch else await self._run_sync(self._artifact_cache.lookup, cache_key)
+        if entry:
+            logger.info(f"命中产物缓存: {entry['parts'][0]['path']}（共 {len(entry['parts'])} 个文件）")
+            for part in entry['parts']:
+                job.publish(dict(part, album_dir=entry['album_dir']))
+            return {'parts': job.parts, 'album_dir': entry['album_dir']}
+
+        user_id = event.get_sender_id() if event is not None else PREFETCH_USER
+        group = (event.get_group_id() or f"private_{user_id}") if event is not None else PREFETCH_USER
+        chapter_range = overrides.get('chapter_range')
+        small = bool(chapter_range) and chapter_range[1] - chapter_range[0] + 1 <= SMALL_JOB_CHAPTERS
+        queued_at = time.perf_counter()
+
+        async def build():
+            self._metrics.observe("queue_wait", time.perf_counter() - queued_at)
+            with self._metrics.span("build"):
+                return await self._build_artifact(
+                    cache_key, album_id, pack, overrides, quality, max_size, split, user_id, job
+                )
+
+        future = self._scheduler.submit(cache_key, album_id, group, user_id, small, build)
+        position = self._scheduler.position(cache_key)
+        if position > 0 and not quiet and event is not None:
+            wait = self._scheduler.estimate_wait(position)
+            await event.send(event.plain_result(
+                f"{album_id} 已加入下载队列，前面还有 {position - 1} 个任务，预计等待约 {max(1, round(wait / 60))} 分钟喵"
+            ))
+        return await future
+
+    def _on_job_done(self, cache_key: str, job: ArtifactJob, task: asyncio.Future):
+        if self._inflight.get(cache_key) is job:
+            del self._inflight[cache_key]
+        if not task.cancelled():
+            # 标记异常已读取，避免所有等待者都已取消时出现未读取异常的告警
+            task.exception()
+
+    async def _build_artifact(self, cache_key: str, album_id: str, pack: bool, overrides: dict,
+                              quality: Optional[int], max_size: int, split: Optional[Any], user_id: str,
+                              job: ArtifactJob) -> Dict[str, Any]:
+        # 所有等待者都已离开时任务仍会继续，因此构建期间单独持有租约
+        async with self._album_lease(album_id):
+            return await self._download_and_build(
+                cache_key, album_id, pack, overrides, quality, max_size, split, user_id, job
+            )
+
+    async def _download_and_build(self, cache_key: str, album_id: str, pack: bool, overrides: dict,
+                                  quality: Optional[int], max_size: int, split: Optional[Any], user_id: str,
+                                  job: ArtifactJob) -> Dict[str, Any]:
+        fmt = "zip" if pack else "pdf"
+        option = await self._get_option(user_id, overrides)
+        if option is None:
+            raise JmTaskError("无法创建下载配置")
+
+        # 构造清单时读取快照并重放日志，放到磁盘线程
+        manifest = await self._run_sync(self._get_manifest, album_id)
+        chapter_range = overrides.get('chapter_range')
+        extra = {}
+        if quality is not None:
+            extra['quality'] = quality
+        if max_size:
+            extra['max-size'] = max_size
+        if split is not None:
+            extra['split'] = split if split == "chapter" else f"{split / 1024 / 1024:g}MB"
+        request = {'pack': pack, 'chapter_range': list(chapter_range) if chapter_range else None, 'extra': extra}
+        # 预取不记入待继续的请求，被取消或失败后不会出现在 /jm resume 中
+        recorded = not job.prefetch
+        if recorded:
+            await self._run_sync(manifest.begin_request, request)
+
+        parts = []
+
+        def emit(part: Dict[str, Any]):
+            parts.append(part)
+            job.publish(part)
+
+        artifact_path = self._artifact_cache.path_for(cache_key, album_id, fmt)
+        # 分卷 ZIP 需等全部章节就绪后再划分，不在下载过程中写入
+        packager = ZipPackager(artifact_path) if pack and split is None else None
+        pdf_pipeline = self._new_pdf_pipeline(quality, max_size) if not pack and self.pipeline_mode else None
+        progress = DownloadProgress(album_id, fmt)
+        chapter_dirs: Dict[str, Path] = {}
+        downloader_class = self._create_downloader(
+            manifest, chapter_range, packager if self.pipeline_mode else None, pdf_pipeline, progress, chapter_dirs,
+            overrides
+        )
+
+        self._progress[cache_key] = progress
         try:
-            await self._run_sync(self._zip_folder, folder, zip_path)
-            if zip_path.exists():
-                await event.send(event.chain_result([
-                    Plain(f"ID {item_id} 下载完成，打包文件："),
-                    File(file=str(zip_path), name=zip_path.name)
-                ]))
-                return zip_path
+            try:
+                result = await self._safe_run(self._download_lane, "download_album", jmcomic.download_album,
+                                              album_id, option, downloader=downloader_class)
+                progress.finish()
+            except Exception as e:
+                complete, images = manifest.progress()
+                raise JmTaskError(
+                    f"下载失败: {e}\n已保存 {complete} 个完整章节、{images} 张图片，可使用 /jm resume {album_id} 继续下载喵"
+                ) from e
+            album = result[0] if isinstance(result, tuple) and len(result) == 2 else result
+
+            album_dir = self._resolve_album_dir(option, album)
+            # 只用本次范围内的章节生成产物，本子目录中其他范围下载的章节不混入
+            sources = self._source_dirs(album, chapter_range, chapter_dirs)
+            if pack:
+                if not sources:
+                    raise JmTaskError("下载完成但文件夹为空")
+                if packager is not None:
+                    if not await self._build_zip(album_dir, sources, packager):
+                        raise JmTaskError("打包失败")
+                    emit(self._make_part(artifact_path, album_dir.with_suffix(".zip").name, 1, 1, album_dir))
+                else:
+                    await self._build_zip_volumes(album_dir, sources, cache_key, album_id, split, emit)
             else:
-                await event.send(event.plain_result("打包失败"))
-                return None
+                await self._build_pdf_volumes(album_dir, sources, cache_key, album_id, quality, max_size, split,
+                                              pdf_pipeline, emit)
+        except BaseException:
+            if packager is not None:
+                await self._run_sync(packager.abort)
+            if not recorded and not job.prefetch:
+                # 预取途中有用户请求合并进来，失败后同样可以 /jm resume 继续
+                await self._run_sync(manifest.begin_request, request)
+            raise
+        finally:
+            if self._progress.get(cache_key) is progress:
+                del self._progress[cache_key]
+            if pdf_pipeline is not None:
+                await self._run_sync(pdf_pipeline.close)
+
+        await self._run_sync(self._artifact_cache.put, cache_key, parts, album_id, album_dir, sources)
+        if not job.prefetch:
+            await self._run_sync(manifest.finish_request)
+        return {'parts': parts, 'album_dir': str(album_dir)}
+
+    def _resolve_album_dir(self, option: 'JmOption', album) -> Path:
+        # 通过第一个章节的图片目录推断本子根目录
+        if len(album) == 0:
+            raise JmTaskError("本子无章节，无法确定图片目录")
+
+        first_photo_dir = Path(option.decide_image_save_dir(album[0])).resolve()
+        logger.info(f"第一个章节图片目录: {first_photo_dir}")
+        album_dir = self._album_dir_for(first_photo_dir)
+        logger.info(f"最终图片下载目录: {album_dir}")
+
+        # 安全校验
+        if album_dir == self.global_base_dir:
+            logger.error("仍然无法确定正确的本子目录，终止下载")
+            raise JmTaskError("无法确定本子图片目录，请检查配置")
+
+        if not album_dir.exists():
+            logger.error(f"图片目录不存在: {album_dir}")
+            raise JmTaskError("图片目录未创建，下载可能失败")
+        return album_dir
+
+    @_timed("send")
+    async def _send_artifact(self, event: AstrMessageEvent, album_id: str, fmt: str, part: Dict[str, Any],
+                             quality: Optional[int]):
+        volume = f"（第 {part['volume']}/{part['volumes']} 卷）" if part['volumes'] > 1 else ""
+        if fmt == "zip":
+            text = f"ID {album_id} 下载完成，打包文件{volume}："
+        else:
+            text = f"本子 {album_id} 下载完成喵，已转换为 PDF（质量={quality or self.default_pdf_quality}）{volume}："
+        await event.send(event.chain_result([
+            Plain(text),
+            File(file=part['path'], name=part['name'])
+        ]))
+
+    def _spawn(self, coro) -> Optional[asyncio.Task]:
+        """启动不需要等待结果的任务并记录，卸载时统一取消并等待；插件卸载中不再启动"""
+        if self._closing:
+            coro.close()
+            return None
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    def _schedule_cleanup(self, album_dir: Optional[Path], sent_files: List[Path]):
+        if sent_files and self.cleanup_mode == "after_send":
+            self._spawn(self._delete_after_send(album_dir, sent_files))
+        elif self.cleanup_mode == "count":
+            self._spawn(self._cleanup_old_albums())
+        elif self.cleanup_mode == "budget":
+            self._schedule_budget_cleanup()
+
+    @_timed("build_zip")
+    async def _build_zip(self, folder: Path, sources: List[Path], packager: ZipPackager) -> bool:
+        """补齐下载过程中尚未写入的范围内文件（如跳过的已完整章节）并完成打包；folder 为本子目录，决定包内路径"""
+        try:
+            await self._run_sync(packager.add_files, self._list_sources(sources), folder.parent)
+            await self._run_sync(packager.close)
+            return packager.zip_path.exists()
         except Exception as e:
             logger.error(f"压缩失败: {e}")
-            await event.send(event.plain_result("打包失败"))
-            return None
-
-    @staticmethod
-    def _zip_folder(folder: Path, zip_path: Path):
-        with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-            for root, _, files in os.walk(folder):
-                for file in files:
-                    file_path = os.path.join(root, file)
-                    arcname = os.path.relpath(file_path, start=folder.parent)
-                    zipf.write(file_path, arcname)
+            return False
 
     async def _delete_after_send(self, album_dir: Path, sent_files: List[Path]):
         try:
+            album_id = await self._run_sync(self._catalog.album_id_of, album_dir)
+            if album_id and await self._run_sync(self._catalog.leased, album_id):
+                logger.info(f"{album_id} 仍有任务在使用，暂不删除")
+                return
             if album_dir.exists():
-                shutil.rmtree(album_dir, ignore_errors=True)
+                # 大目录删除耗时较长，放到磁盘线程执行，不阻塞事件循环
+                await self._run_sync(shutil.rmtree, album_dir, ignore_errors=True)
                 logger.info(f"已删除原图片文件夹: {album_dir}")
-            for f in sent_files:
+            await self._run_sync(self._artifact_cache.discard_album, album_dir)
+            await self._run_sync(self._catalog.remove_album, album_dir)
+            await self._run_sync(self._remove_files, sent_files)
+        except Exception as e:
+            logger.error(f"删除失败: {e}")
+
+    @staticmethod
+    def _remove_files(files: List[Path]):
+        for f in files:
+            try:
                 if f.exists():
                     f.unlink()
                     logger.info(f"已删除已发送文件: {f}")
-        except Exception as e:
-            logger.error(f"删除失败: {e}")
+            except Exception as e:
+                logger.error(f"删除失败 {f}: {e}")
 
     async def _cleanup_old_albums(self):
-        if self.cleanup_mode != "count" or self.max_albums <= 0:
+        if self.cleanup_mode != "count" or (self.max_albums <= 0 and self.max_storage_bytes <= 0):
             return
-        exclude_dirs = {"pdfs", "covers", "logs"}
         try:
-            album_dirs = [d for d in self.global_base_dir.iterdir() if d.is_dir() and d.name not in exclude_dirs]
+            # 索引按最近访问时间排序并跳过持有租约的本子，不再遍历目录
+            victims = await self._run_sync(self._catalog.eviction_candidates, self.max_albums, self.max_storage_bytes)
         except Exception as e:
-            logger.error(f"读取根目录失败: {e}")
-            return
-        if len(album_dirs) <= self.max_albums:
+            logger.error(f"查询存储索引失败: {e}")
             return
-        album_dirs.sort(key=lambda p: p.stat().st_mtime, reverse=True)
-        to_delete = album_dirs[self.max_albums:]
-        await self._run_sync(self._delete_album_folders, to_delete)
+        if victims:
+            await self._run_sync(self._delete_album_folders, [Path(d) for d in victims])
+
+    def _schedule_budget_cleanup(self):
+        # 同一时间只运行一轮，清理期间再次触发直接忽略，下次下载完成时会再检查
+        if self._budget_task is None or self._budget_task.done():
+            self._budget_task = self._spawn(self._enforce_budgets())
+
+    async def _enforce_budgets(self):
+        try:
+            await self._run_sync(self._apply_budgets)
+        except Exception as e:
+            logger.error(f"按容量预算清理失败: {e}")
+
+    def _apply_budgets(self):
+        """budget 模式：原图、PDF、ZIP、封面各自按预算淘汰。只删除原图时保留已生成的 PDF/ZIP，仍可直接发送"""
+        if self.budgets["images"] > 0:
+            for album_dir in self._catalog.image_victims(self.budgets["images"], self.eviction_policy):
+                album_dir = Path(album_dir)
+                album_id = self._catalog.album_id_of(album_dir)
+                if album_id and self._catalog.leased(album_id):
+                    continue
+                shutil.rmtree(album_dir, ignore_errors=True)
+                self._catalog.remove_chapters(album_dir)
+                logger.info(f"原图超出预算，已删除: {album_dir}")
+        for fmt in ("pdf", "zip"):
+            if self.budgets[fmt] > 0:
+                for key in self._catalog.artifact_victims(self.budgets[fmt], fmt, self.eviction_policy):
+                    self._artifact_cache.discard(key)
+        self._covers.evict()
 
     def _delete_album_folders(self, folders: List[Path]):
-        pdf_dir = self.global_base_dir / "pdfs"
         for folder in folders:
-            album_id = folder.name
+            album_id = self._catalog.album_id_of(folder)
+            if album_id and self._catalog.leased(album_id):
+                continue
             if folder.exists():
                 try:
                     shutil.rmtree(folder, ignore_errors=True)
                     logger.info(f"已删除旧本子文件夹: {folder}")
                 except Exception as e:
                     logger.error(f"删除文件夹失败 {folder}: {e}")
-            if pdf_dir.exists():
-                try:
-                    for pf in pdf_dir.glob(f"{album_id}*.pdf"):
-                        pf.unlink()
-                        logger.info(f"已删除旧 PDF 文件: {pf}")
-                except Exception as e:
-                    logger.error(f"删除 PDF 失败: {e}")
-            zip_file = folder.with_suffix(".zip")
-            if zip_file.exists():
-                try:
-                    zip_file.unlink()
-                    logger.info(f"已删除旧 ZIP 文件: {zip_file}")
-                except Exception as e:
-                    logger.error(f"删除 ZIP 失败: {e}")
+            self._artifact_cache.discard_album(folder)
+            self._catalog.remove_album(folder)
+
+    async def _cached_fetch(self, endpoint: str, params: tuple, fetcher):
+        """通过响应缓存获取数据：新鲜直接返回；过期不久先返回旧数据并后台刷新；否则同步拉取"""
+        key = ResponseCache.make_key(endpoint, *params)
+        value, fresh = self._response_cache.get(key)
+        if value is not None:
+            if fresh:
+                self._response_cache.count(endpoint, "hit")
+            else:
+                self._response_cache.count(endpoint, "stale")
+                if key not in self._revalidating and self._spawn(self._revalidate(endpoint, key, fetcher)):
+                    self._revalidating.add(key)
+            return value
+        self._response_cache.count(endpoint, "miss")
+        value = await fetcher()
+        self._store_response(endpoint, key, value)
+        return value
+
+    async def _revalidate(self, endpoint: str, key: str, fetcher):
+        try:
+            self._store_response(endpoint, key, await fetcher())
+        except Exception as e:
+            logger.warning(f"后台刷新缓存失败 {key}: {e}")
+        finally:
+            self._revalidating.discard(key)
+
+    def _store_response(self, endpoint: str, key: str, value):
+        self._response_cache.set(key, value, RESPONSE_CACHE_TTL[endpoint])
+        if self._response_cache.should_save():
+            self._spawn(self._run_sync(self._response_cache.save))
+
+    async def _require_client(self):
+        client = await self._get_client()
+        if client is None:
+            raise JmTaskError("无法创建下载配置")
+        return client
+
+    @staticmethod
+    def _page_items(result) -> List[List[str]]:
+        content = result.content if hasattr(result, 'content') else list(result) if result else []
+        items = []
+        for aid, info in content:
+            title = info.get('name', '未知标题') if isinstance(info, dict) else str(info)
+            items.append([str(aid), title])
+        return items
+
+    async def _fetch_search(self, keyword: str, page: int) -> Dict[str, Any]:
+        client = await self._require_client()
+        search_kwargs = {
+            'search_query': keyword,
+            'page': page,
+            'main_tag': 0,
+            'order_by': jmcomic.JmMagicConstants.ORDER_BY_LATEST,
+            'time': jmcomic.JmMagicConstants.TIME_ALL,
+            'category': jmcomic.JmMagicConstants.CATEGORY_ALL,
+            'sub_category': None
+        }
+        search_page = await self._safe_call_with_timeout(client.search, timeout=60, **search_kwargs)
+        items = self._page_items(search_page)
+        return {
+            'items': items,
+            'page_count': getattr(search_page, 'page_count', 1),
+            'total': getattr(search_page, 'total', len(items)),
+        }
+
+    async def _fetch_ranking(self, rank_type: str, page: int) -> Dict[str, Any]:
+        client = await self._require_client()
+        if rank_type == "month":
+            result = await self._safe_call_with_timeout(client.month_ranking, page=page, timeout=60)
+        elif rank_type == "week":
+            result = await self._safe_call_with_timeout(client.week_ranking, page=page, timeout=60)
+        else:
+            result = await self._safe_call_with_timeout(client.day_ranking, page=page, timeout=60)
+        return {'items': self._page_items(result)}
+
+    async def _fetch_album_info(self, album_id: str) -> Dict[str, Any]:
+        client = await self._require_client()
+        album: 'JmAlbumDetail' = await self._safe_call("album_detail", client.get_album_detail, album_id)
+        return {
+            'title': album.title,
+            'author': album.author,
+            'likes': album.likes,
+            'tags': list(album.tags or []),
+            'photos': [[photo.photo_id, photo.name] for photo in album],
+        }
 
     async def _do_search(self, event: AstrMessageEvent, keyword: str, page: int):
         try:
-            option = await self._get_option(event.get_sender_id())
-            if option is None:
-                await event.send(event.plain_result("无法创建下载配置"))
-                return
-            client = option.build_jm_client()
-            search_kwargs = {
-                'search_query': keyword,
-                'page': page,
-                'main_tag': 0,
-                'order_by': JmMagicConstants.ORDER_BY_LATEST,
-                'time': JmMagicConstants.TIME_ALL,
-                'category': JmMagicConstants.CATEGORY_ALL,
-                'sub_category': None
-            }
-            search_page = await self._safe_call_with_timeout(client.search, timeout=60, **search_kwargs)
-            content = search_page.content if hasattr(search_page, 'content') else list(search_page) if search_page else []
+            data = await self._cached_fetch(
+                "search", (keyword, page), functools.partial(self._fetch_search, keyword, page)
+            )
+            content = data['items']
             if not content:
                 await event.send(event.plain_result("没有找到相关本子喵"))
                 return
-            lines = [f"搜索「{keyword}」结果（第{page}/{getattr(search_page, 'page_count', 1)}页）："]
-            for idx, (aid, info) in enumerate(content[:10], 1):
-                title = info.get('name', '未知标题') if isinstance(info, dict) else str(info)
+            lines = [f"搜索「{keyword}」结果（第{page}/{data['page_count']}页）："]
+            for idx, (aid, title) in enumerate(content[:10], 1):
                 lines.append(f"{idx}. ID: {aid} | {title}")
-            lines.append(f"共{getattr(search_page, 'total', len(content))}条")
+            lines.append(f"共{data['total']}条")
             await event.send(event.plain_result("\n".join(lines)))
         except (asyncio.TimeoutError, TimeoutError):
             await event.send(event.plain_result("搜索超时，请稍后重试喵"))
+        except JmTaskError as e:
+            await event.send(event.plain_result(str(e)))
         except Exception as e:
             logger.error(traceback.format_exc())
             await event.send(event.plain_result(f"搜索失败: {e}"))
 
     async def _do_ranking(self, event: AstrMessageEvent, rank_type: str, page: int):
         try:
-            option = await self._get_option(event.get_sender_id())
-            if option is None:
-                await event.send(event.plain_result("无法创建下载配置"))
-                return
-            client = option.build_jm_client()
-            if rank_type == "month":
-                result = await self._safe_call_with_timeout(client.month_ranking, page=page, timeout=60)
-            elif rank_type == "week":
-                result = await self._safe_call_with_timeout(client.week_ranking, page=page, timeout=60)
-            else:
-                result = await self._safe_call_with_timeout(client.day_ranking, page=page, timeout=60)
-            content = result.content if hasattr(result, 'content') else list(result) if result else []
+            data = await self._cached_fetch(
+                "ranking", (rank_type, page), functools.partial(self._fetch_ranking, rank_type, page)
+            )
+            content = data['items']
             if not content:
                 await event.send(event.plain_result("暂无数据"))
                 return
             lines = [f"{rank_type}榜 第{page}页："]
-            for idx, (aid, info) in enumerate(content[:10], 1):
-                title = info.get('name', '未知标题') if isinstance(info, dict) else str(info)
+            for idx, (aid, title) in enumerate(content[:10], 1):
                 lines.append(f"{idx}. ID: {aid} | {title}")
             lines.append(f"共{len(content)}条")
             await event.send(event.plain_result("\n".join(lines)))
         except (asyncio.TimeoutError, TimeoutError):
             await event.send(event.plain_result("获取排行榜超时，请稍后重试喵"))
+        except JmTaskError as e:
+            await event.send(event.plain_result(str(e)))
         except Exception as e:
             logger.error(traceback.format_exc())
             await event.send(event.plain_result(f"获取排行榜失败: {e}"))
 
+    async def _resolve_batch_ids(self, positional: List[str], extra: Dict[str, Any]) -> Tuple[List[str], str]:
+        """把批量命令的位置参数解析为本子ID列表：rank/search 取排行榜或搜索结果页，否则为直接给出的ID"""
+        source = positional[0].lower()
+        if source in ("rank", "search"):
+            if source == "rank":
+                rank_type = next((a.lower() for a in positional[1:] if a.lower() in ("week", "day", "month")), "month")
+                page = int(next((a for a in positional[1:] if a.isdigit()), "1"))
+                data = await self._cached_fetch(
+                    "ranking", (rank_type, page), functools.partial(self._fetch_ranking, rank_type, page)
+                )
+            else:
+                if len(positional) < 2:
+                    raise JmTaskError("请提供搜索关键词，例如：/jm batch search 关键词 --top=5")
+                keyword = positional[1]
+                page = int(positional[2]) if len(positional) >= 3 and positional[2].isdigit() else 1
+                data = await self._cached_fetch(
+                    "search", (keyword, page), functools.partial(self._fetch_search, keyword, page)
+                )
+            album_ids = [aid for aid, _ in data['items']]
+        else:
+            # 兼容 JM123、逗号分隔等粘贴格式
+            album_ids = [aid for token in positional for aid in re.findall(r'\d+', token)]
+        album_ids = list(dict.fromkeys(album_ids))
+
+        top = str(extra.get('top', ''))
+        limit = min(int(top), self.batch_max_albums) if top.isdigit() and int(top) > 0 else self.batch_max_albums
+        note = ""
+        if len(album_ids) > limit:
+            note = f"共 {len(album_ids)} 本，只下载前 {limit} 本"
+            if limit == self.batch_max_albums:
+                note += f"（单次上限 {limit} 本）"
+            album_ids = album_ids[:limit]
+        return album_ids, note
+
+    async def _fetch_batch_details(self, album_ids: List[str]) -> Dict[str, Any]:
+        """并发获取详情（共用同一个客户端与详情缓存），返回 {ID: 详情或异常}"""
+        semaphore = asyncio.Semaphore(BATCH_DETAIL_CONCURRENCY)
+
+        async def fetch(album_id: str):
+            async with semaphore:
+                return await self._cached_fetch(
+                    "detail", (album_id,), functools.partial(self._fetch_album_info, album_id)
+                )
+
+        results = await asyncio.gather(*(fetch(aid) for aid in album_ids), return_exceptions=True)
+        return dict(zip(album_ids, results))
+
+    @_timed("batch")
+    async def _batch_task(self, event: AstrMessageEvent, positional: List[str], pack: bool, extra: Dict[str, Any]):
+        try:
+            album_ids, note = await self._resolve_batch_ids(positional, extra)
+        except (asyncio.TimeoutError, TimeoutError):
+            await event.send(event.plain_result("获取本子列表超时，请稍后重试喵"))
+            return
+        except JmTaskError as e:
+            await event.send(event.plain_result(str(e)))
+            return
+        except Exception as e:
+            logger.error(traceback.format_exc())
+            await event.send(event.plain_result(f"获取本子列表失败: {e}"))
+            return
+        if not album_ids:
+            await event.send(event.plain_result("没有找到可下载的本子喵"))
+            return
+
+        infos = await self._fetch_batch_details(album_ids)
+        failures: Dict[str, str] = {
+            aid: str(info) for aid, info in infos.items() if isinstance(info, BaseException)
+        }
+        valid = [aid for aid in album_ids if aid not in failures]
+        merge = bool(extra.get('merge'))
+        fmt = "zip" if pack else "pdf"
+        lines = [f"批量下载 {len(valid)} 本，格式 {fmt.upper()}，{'合并为一个 ZIP 发送' if merge else '逐本发送'}喵："]
+        for idx, aid in enumerate(valid, 1):
+            lines.append(f"{idx}. ID: {aid} | {infos[aid]['title']}（{len(infos[aid]['photos'])} 章）")
+        for aid, reason in failures.items():
+            lines.append(f"✗ ID: {aid} 无法获取详情：{reason}")
+        if note:
+            lines.append(note)
+        await event.send(event.plain_result("\n".join(lines)))
+        if not valid:
+            return
+
+        start = time.perf_counter()
+        archive = None
+        deliver = self._send_artifact
+        if merge:
+            batch_key = hashlib.sha1(f"{event.get_sender_id()}:{time.time()}:{valid}".encode("utf-8")).hexdigest()
+            archive = BatchArchive(
+                functools.partial(self._artifact_cache.path_for, batch_key, "batch", "zip"), self.max_file_bytes
+            )
+
+            async def add_to_archive(event: AstrMessageEvent, album_id: str, fmt: str, part: Dict[str, Any],
+                                     quality: Optional[int]):
+                # 各本子的产物一到达就写入合并 ZIP，写满一卷立即发送
+                sealed = await self._run_sync(archive.add, part['path'], f"{album_id}/{part['name']}")
+                if sealed is not None:
+                    await self._send_batch_volume(event, sealed, len(archive.finished), len(valid))
+
+            deliver = add_to_archive
+
+        async def download(album_id: str):
+            try:
+                await self._deliver_album(event, album_id, pack, {}, extra, deliver, quiet=True)
+            except Exception as e:
+                logger.error(f"批量下载 {album_id} 失败: {e}")
+                failures[album_id] = str(e)
+
+        try:
+            # 并发度由下载队列（max_concurrent_downloads / max_downloads_per_user）控制
+            await asyncio.gather(*(download(aid) for aid in valid))
+            if archive is not None:
+                sealed = await self._run_sync(archive.close)
+                if sealed is not None:
+                    volume = len(archive.finished) if archive.volumes > 1 else 0
+                    await self._send_batch_volume(event, sealed, volume, len(valid))
+        except Exception as e:
+            logger.error(f"批量下载异常: {traceback.format_exc()}")
+            await event.send(event.plain_result(f"批量下载失败: {e}"))
+        finally:
+            if archive is not None:
+                await self._run_sync(archive.abort)
+                await self._run_sync(self._remove_files, archive.finished)
+
+        done = [aid for aid in valid if aid not in failures]
+        lines = [f"批量下载完成：成功 {len(done)}/{len(album_ids)} 本，用时 {int(time.perf_counter() - start)} 秒喵"]
+        for aid in valid:
+            if aid in failures:
+                lines.append(f"✗ ID: {aid}：{failures[aid]}")
+        await event.send(event.plain_result("\n".join(lines)))
+
+    async def _send_batch_volume(self, event: AstrMessageEvent, path: Path, volume: int, albums: int):
+        label = f"（第 {volume} 卷）" if volume else ""
+        name = f"batch_{albums}_vol{volume}.zip" if volume else f"batch_{albums}.zip"
+        await event.send(event.chain_result([
+            Plain(f"批量下载合并文件{label}："),
+            File(file=str(path), name=name)
+        ]))
+
     async def _cleanup_expired_covers(self):
-        if self.cover_keep_days <= 0:
+        if self._covers.keep_days <= 0 and self._covers.max_bytes <= 0:
             return
         while True:
             try:
-                if self.cover_dir.exists():
-                    cutoff = datetime.now() - timedelta(days=self.cover_keep_days)
-                    for file in self.cover_dir.glob("*.jpg"):
-                        mtime = datetime.fromtimestamp(file.stat().st_mtime)
-                        if mtime < cutoff:
-                            file.unlink()
-                            logger.debug(f"已删除过期封面: {file}")
+                await self._run_sync(self._covers.evict)
             except Exception as e:
                 logger.error(f"清理封面出错: {e}")
             await asyncio.sleep(86400)
 
+    async def _get_cover(self, album_id: str) -> Optional[Path]:
+        """封面已在本地时直接返回，不访问网络；同一本子的并发请求只下载一次"""
+        cover = await self._run_sync(self._covers.get, album_id)
+        if cover is not None:
+            self._covers.hits += 1
+            return cover
+        self._covers.misses += 1
+        lock = self._cover_locks.setdefault(album_id, asyncio.Lock())
+        try:
+            async with lock:
+                cover = await self._run_sync(self._covers.get, album_id)
+                if cover is not None:
+                    return cover
+                client = await self._require_client()
+                cover_path = self._covers.path(album_id)
+                part_path = Path(_part_path(str(cover_path)))
+                try:
+                    await self._run_net(client.download_album_cover, album_id, str(part_path))
+                    os.replace(part_path, cover_path)
+                finally:
+                    if part_path.exists():
+                        part_path.unlink()
+                cover_path.chmod(0o644)
+                logger.info(f"封面已保存到: {cover_path}")
+                if self._covers.thumb_size > 0:
+                    await self._run_sync(self._covers.make_thumbnail, album_id)
+                await self._run_sync(self._covers.add, album_id)
+                if self._covers.max_bytes > 0:
+                    self._spawn(self._run_sync(self._covers.evict))
+        finally:
+            # 下载失败或被取消时同样移除，锁不会随本子ID累积
+            if self._cover_locks.get(album_id) is lock:
+                del self._cover_locks[album_id]
+        return await self._run_sync(self._covers.get, album_id)
+
     async def _do_detail(self, event: AstrMessageEvent, album_id: str):
-        cover_path = None
         try:
-            option = await self._get_option(event.get_sender_id())
-            if option is None:
-                await event.send(event.plain_result("无法创建下载配置"))
-                return
-            client = option.build_jm_client()
-            album: 'JmAlbumDetail' = await self._safe_call(client.get_album_detail, album_id)
+            info = await self._cached_fetch(
+                "detail", (album_id,), functools.partial(self._fetch_album_info, album_id)
+            )
+            photos = info['photos']
 
             lines = [
-                f"标题：{album.title}",
-                f"作者：{album.author}",
-                f"收藏数：{album.likes}",
-                f"章节数：{len(album)}",
+                f"标题：{info['title']}",
+                f"作者：{info['author']}",
+                f"收藏数：{info['likes']}",
+                f"章节数：{len(photos)}",
             ]
-            if album.tags:
-                lines.append(f"标签：{'、'.join(album.tags)}")
+            if info['tags']:
+                lines.append(f"标签：{'、'.join(info['tags'])}")
             else:
                 lines.append("标签：无")
 
-            if len(album) > 0:
+            if len(photos) > 0:
                 lines.append("章节列表：")
-                for idx, photo in enumerate(album):
+                for idx, (photo_id, name) in enumerate(photos):
                     if idx >= 10:
-                        lines.append(f"  ... 还有 {len(album)-10} 个章节")
+                        lines.append(f"  ... 还有 {len(photos)-10} 个章节")
                         break
-                    lines.append(f"  {idx+1}. ID: {photo.photo_id} | {photo.name}")
+                    lines.append(f"  {idx+1}. ID: {photo_id} | {name}")
             else:
                 lines.append("该本子暂无章节")
 
             node_content = [Plain("\n".join(lines))]
 
             try:
-                cover_filename = f"cover_{album_id}_{int(time.time())}.jpg"
-                cover_path = self.cover_dir / cover_filename
-
-                await self._run_sync(client.download_album_cover, album_id, str(cover_path))
-                cover_path.chmod(0o644)
-                node_content.append(MsgImage.fromFileSystem(str(cover_path)))
-                logger.info(f"封面已保存到: {cover_path}")
+                cover_path = await self._get_cover(album_id)
+                if cover_path is not None:
+                    node_content.append(MsgImage.fromFileSystem(str(cover_path)))
             except Exception as e:
                 logger.warning(f"下载封面失败: {e}")
 
@@ -705,4 +3996,22 @@ class JmComicPlugin(Star):
             await event.send(event.plain_result(f"获取详情失败: {e}"))
 
     async def terminate(self):
+        self._closing = True
+        tasks = [*self._background_tasks, *self._tasks]
+        tasks += [job.task for job in self._inflight.values()]
+        tasks += [job.task for job in self._scheduler.running()]
+        self._scheduler.cancel_all()
+        for task in tasks:
+            task.cancel()
+        # 被取消的任务在 finally 中仍会向执行器提交释放租约、删除临时文件等操作，等其退出后再关闭执行器
+        if tasks:
+            await asyncio.wait(tasks, timeout=SHUTDOWN_TIMEOUT)
+        try:
+            # 在后台刷新等任务结束后保存，包含最后写入的响应
+            await self._run_sync(self._response_cache.save)
+        except Exception as e:
+            logger.warning(f"保存响应缓存失败: {e}")
+        for lane in self._lanes:
+            lane.shutdown()
+        self._catalog.close()
         logger.info("禁漫插件已卸载")
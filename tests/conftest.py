@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+
+"""
+测试共用的夹具：复用 benchmarks/fakes.py 中的替身，未安装 AstrBot 时注册最小化的 astrbot.api，
+插件在 tmp_path 下使用独立的下载目录，所有网络请求由 FakeJmClient 模拟。
+"""
+
+import json
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "benchmarks"))
+
+from fakes import FAKE_DOMAIN, install_astrbot_stub  # noqa: E402
+
+install_astrbot_stub()
+
+OPTION_TEMPLATE = """\
+dir_rule:
+  base_dir: {base_dir}
+  rule: Bd_Aid_Pindex
+download:
+  cache: true
+  image:
+    decode: false
+  threading:
+    image: {image_threads}
+    photo: 1
+"""
+
+
+@pytest.fixture
+def use_client(monkeypatch):
+    """让 JmOption 创建的所有客户端都是给定的替身，并跳过域名预热；测试结束后恢复"""
+    import jmcomic
+
+    def install(client):
+        monkeypatch.setattr(jmcomic.JmOption, "build_jm_client", lambda self, *args, **kwargs: client)
+        monkeypatch.setattr(jmcomic.JmOption, "new_jm_client", lambda self, *args, **kwargs: client)
+        monkeypatch.setattr(jmcomic.JmModuleConfig, "get_html_domain", staticmethod(lambda *args, **kwargs: FAKE_DOMAIN))
+        return client
+
+    return install
+
+
+@pytest.fixture
+def new_plugin(tmp_path):
+    """new_plugin(**config) 在 tmp_path 下创建插件；不清理、不探测域名，PDF 转码只用一个进程"""
+    import main
+
+    def create(image_threads: int = 4, **config):
+        option_file = tmp_path / "option.yml"
+        option_file.write_text(OPTION_TEMPLATE.format(
+            base_dir=json.dumps(str(tmp_path)), image_threads=image_threads,
+        ), encoding="utf-8")
+        plugin_config = {
+            "download_dir": str(tmp_path),
+            "option_file": str(option_file),
+            "cleanup_mode": "count",
+            "max_albums": 0,
+            "pdf_workers": 1,
+            "domain_probe_interval": 0,
+            "progress_interval": 0,
+        }
+        plugin_config.update(config)
+        return main.JmComicPlugin(None, plugin_config)
+
+    return create
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+
+import jmcomic
+import pytest
+
+from fakes import BenchEvent, FakeJmClient, SyntheticAlbum
+
+ALBUM_ID = "410000"
+
+
+def _client():
+    album = SyntheticAlbum(ALBUM_ID, chapters=2, images=3, formats=("jpg",), resolutions=((120, 180),))
+    return FakeJmClient({ALBUM_ID: album}, latency=0.01)
+
+
+def _count_downloads(monkeypatch):
+    """记录 jmcomic.download_album 的调用，返回本子ID列表"""
+    calls = []
+    download_album = jmcomic.download_album
+
+    def counting(*args, **kwargs):
+        calls.append(args[0])
+        return download_album(*args, **kwargs)
+
+    monkeypatch.setattr(jmcomic, "download_album", counting)
+    return calls
+
+
+def test_concurrent_requests_share_one_download(new_plugin, use_client, monkeypatch):
+    use_client(_client())
+    calls = _count_downloads(monkeypatch)
+    plugin = new_plugin()
+
+    async def scenario():
+        events = [BenchEvent(sender=str(10000 + i)) for i in range(5)]
+        await asyncio.gather(*(
+            plugin._download_album_task(event, ALBUM_ID, pack=False, overrides={}, extra={}) for event in events
+        ))
+        await plugin.terminate()
+        return events
+
+    events = asyncio.run(scenario())
+    assert calls == [ALBUM_ID]
+    files = [event.files for event in events]
+    assert all(len(f) == 1 for f in files)
+    assert len({f[0] for f in files}) == 1
+    assert not plugin._inflight
+    assert not plugin._artifact_waiters
+
+
+def test_different_ranges_download_separately(new_plugin, use_client, monkeypatch):
+    use_client(_client())
+    calls = _count_downloads(monkeypatch)
+    plugin = new_plugin()
+
+    async def scenario():
+        await asyncio.gather(
+            plugin._download_album_task(BenchEvent(), ALBUM_ID, pack=False, overrides={'chapter_range': (1, 1)}, extra={}),
+            plugin._download_album_task(BenchEvent(), ALBUM_ID, pack=False, overrides={'chapter_range': (2, 2)}, extra={}),
+        )
+        await plugin.terminate()
+
+    asyncio.run(scenario())
+    assert calls == [ALBUM_ID, ALBUM_ID]
+
+
+def test_waiter_count_released_when_lease_fails(new_plugin, use_client):
+    use_client(_client())
+    plugin = new_plugin()
+
+    def fail(album_id):
+        raise RuntimeError("catalog unavailable")
+
+    plugin._catalog.acquire = fail
+
+    async def scenario():
+        try:
+            await plugin._deliver_album(BenchEvent(), ALBUM_ID, False, {}, {}, plugin._send_artifact)
+        finally:
+            await plugin.terminate()
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(scenario())
+    assert not plugin._artifact_waiters
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+
+import pytest
+
+from fakes import FakeJmClient, SyntheticAlbum
+
+ALBUM_ID = "450000"
+
+
+def _client():
+    return FakeJmClient({ALBUM_ID: SyntheticAlbum(ALBUM_ID, chapters=1, images=1)})
+
+
+def _get_cover(plugin, album_id):
+    async def scenario():
+        try:
+            return await asyncio.gather(*(plugin._get_cover(album_id) for _ in range(3)))
+        finally:
+            await plugin.terminate()
+
+    return asyncio.run(scenario())
+
+
+def test_cover_lock_released_after_download(new_plugin, use_client):
+    use_client(_client())
+    plugin = new_plugin()
+
+    covers = _get_cover(plugin, ALBUM_ID)
+    assert covers[0] is not None and len(set(covers)) == 1
+    assert not plugin._cover_locks
+
+
+def test_cover_lock_released_when_download_fails(new_plugin, use_client):
+    use_client(_client())
+    plugin = new_plugin()
+
+    with pytest.raises(Exception):
+        _get_cover(plugin, "999999")
+    assert not plugin._cover_locks
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+import main
+
+LIVE, DEAD = "live.example", "dead.example"
+
+
+class _StubClient:
+    """按 jmcomic 客户端的接口提供域名列表与重试回调；DEAD 域名的请求总是失败"""
+
+    def __init__(self, domains, retry_times=1):
+        self.domain_list = list(domains)
+        self.retry_times = retry_times
+        self.calls = []
+
+    def of_api_url(self, url, domain):
+        return f"https://{domain}{url}"
+
+    def update_request_with_specify_domain(self, kwargs, domain, is_image):
+        pass
+
+    def raise_if_resp_should_retry(self, resp, is_image):
+        return resp
+
+    def before_retry(self, e, kwargs, retry, url):
+        pass
+
+    def fallback(self, request, url, domain_index, retry_count, is_image, **kwargs):
+        raise RuntimeError(f"all domains failed: {url}")
+
+    def get(self, url, **kwargs):
+        self.calls.append(url.split("/")[2])
+        if DEAD in url:
+            raise ConnectionError("connection refused")
+        return url
+
+
+def test_rank_prefers_healthy_then_unknown_then_failing():
+    health = main.DomainHealth()
+    health.record(DEAD, None)
+    health.record(LIVE, 0.2)
+    health.record("slow.example", 1.5)
+
+    assert health.rank([DEAD, "new.example", "slow.example", LIVE]) == [LIVE, "slow.example", "new.example", DEAD]
+
+
+def test_strategy_call_reorders_client_domains():
+    health = main.DomainHealth()
+    health.record(DEAD, None)
+    client = _StubClient([DEAD, LIVE])
+
+    assert health.request(client) is None
+    assert client.domain_list == [LIVE, DEAD]
+
+
+def test_fails_over_and_then_skips_dead_domain():
+    health = main.DomainHealth()
+    client = _StubClient([DEAD, LIVE])
+
+    assert health.request(client, client.get, url="/album/1") == f"https://{LIVE}/album/1"
+    assert client.calls == [DEAD, LIVE]
+    assert health.failovers == 1
+
+    client.calls.clear()
+    assert health.request(client, client.get, url="/album/2") == f"https://{LIVE}/album/2"
+    # 失败过的域名排到最后，健康的域名一次成功，不再先试失败的域名
+    assert client.calls == [LIVE]
+    assert health.failovers == 1
+    assert health.summary()[DEAD]["error_rate"] == 1
+
+
+def test_all_domains_failing_falls_back_after_every_round():
+    health = main.DomainHealth()
+    client = _StubClient([DEAD, "dead2." + DEAD], retry_times=1)
+
+    with pytest.raises(RuntimeError):
+        health.request(client, client.get, url="/album/1")
+    assert len(client.calls) == (client.retry_times + 1) * 2
+    assert health.failovers == 0
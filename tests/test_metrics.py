@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import concurrent.futures
+
+import pytest
+
+import main
+
+
+@pytest.mark.parametrize("exc", [asyncio.CancelledError, concurrent.futures.CancelledError])
+def test_cancellation_is_not_an_error(exc):
+    metrics = main.Metrics()
+    with pytest.raises(exc):
+        with metrics.span("build"):
+            raise exc()
+
+    assert metrics.counters == {"build_cancelled": 1}
+    assert metrics.summary()["build"]["count"] == 1
+
+
+def test_failure_counts_as_error():
+    metrics = main.Metrics()
+    with pytest.raises(ValueError):
+        with metrics.span("build"):
+            raise ValueError("broken")
+
+    assert metrics.counters == {"build_errors": 1}
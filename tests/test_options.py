@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+
+import jmcomic
+
+from fakes import BenchEvent, FakeJmClient, SyntheticAlbum
+
+ALBUM_ID = "440000"
+
+
+def test_downloads_reuse_the_shared_client(new_plugin, use_client, monkeypatch):
+    album = SyntheticAlbum(ALBUM_ID, chapters=2, images=2, formats=("jpg",), resolutions=((120, 180),))
+    client = use_client(FakeJmClient({ALBUM_ID: album}))
+    created = []
+
+    def new_jm_client(self, *args, **kwargs):
+        created.append(kwargs.get("domain_retry_strategy"))
+        return client
+
+    monkeypatch.setattr(jmcomic.JmOption, "new_jm_client", new_jm_client)
+    plugin = new_plugin()
+
+    async def scenario():
+        await plugin._fetch_album_info(ALBUM_ID)
+        for chapter_range in ((1, 1), (2, 2)):
+            event = BenchEvent()
+            await plugin._download_album_task(event, ALBUM_ID, pack=True, overrides={'chapter_range': chapter_range},
+                                              extra={})
+            assert len(event.files) == 1
+        await plugin.terminate()
+
+    asyncio.run(scenario())
+    assert created == [plugin._domain_health.request]
+
+
+def test_jmcomic_calls_timed_by_stage_name(new_plugin, use_client):
+    album = SyntheticAlbum(ALBUM_ID, chapters=1, images=2, formats=("jpg",), resolutions=((120, 180),))
+    use_client(FakeJmClient({ALBUM_ID: album}))
+    plugin = new_plugin()
+
+    async def scenario():
+        await plugin._fetch_album_info(ALBUM_ID)
+        await plugin._download_album_task(BenchEvent(), ALBUM_ID, pack=True, overrides={}, extra={})
+        await plugin.terminate()
+
+    asyncio.run(scenario())
+    stages = plugin._metrics.summary()
+    assert {"album_detail", "download_album"} <= set(stages)
+    assert "cache_wrapper" not in stages
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import concurrent.futures
+import io
+import re
+import threading
+
+import main
+
+
+def _baseline_jpeg(path, size=(320, 480), mode="RGB"):
+    from PIL import Image
+    img = Image.effect_noise(size, 60).convert(mode)
+    buf = io.BytesIO()
+    img.save(buf, "JPEG", quality=90, progressive=False)
+    path.write_bytes(buf.getvalue())
+    return buf.getvalue()
+
+
+def _image_streams(pdf: bytes):
+    """PDF 中所有图片对象的原始流内容"""
+    streams = []
+    for match in re.finditer(rb"/Subtype\s*/Image.*?/Length\s+(\d+).*?stream\r?\n", pdf, re.S):
+        start = match.end()
+        streams.append(pdf[start:start + int(match.group(1))])
+    return streams
+
+
+def test_passthrough_embeds_jpeg_unchanged(tmp_path):
+    src = tmp_path / "00001.jpg"
+    data = _baseline_jpeg(src)
+
+    pages = main._transcode_page(str(src), str(tmp_path / "out.jpg"), 85, 0, passthrough=True)
+    assert pages == [str(src)]
+
+    output = tmp_path / "album.pdf"
+    main.JmComicPlugin._write_pdf([pages], output)
+    assert _image_streams(output.read_bytes()) == [data]
+
+
+def test_grayscale_jpeg_is_passed_through(tmp_path):
+    src = tmp_path / "00001.jpg"
+    data = _baseline_jpeg(src, mode="L")
+
+    pages = main._transcode_page(str(src), str(tmp_path / "out.jpg"), 85, 0, passthrough=True)
+    output = tmp_path / "album.pdf"
+    main.JmComicPlugin._write_pdf([pages], output)
+    assert _image_streams(output.read_bytes()) == [data]
+
+
+def test_oversized_jpeg_is_transcoded(tmp_path):
+    src = tmp_path / "00001.jpg"
+    data = _baseline_jpeg(src, size=(800, 1200))
+
+    pages = main._transcode_page(str(src), str(tmp_path / "out.jpg"), 85, 400, passthrough=True)
+    assert pages == [str(tmp_path / "out.jpg")]
+
+    output = tmp_path / "album.pdf"
+    main.JmComicPlugin._write_pdf([pages], output)
+    assert _image_streams(output.read_bytes()) != [data]
+
+
+def test_pages_written_in_order(tmp_path):
+    groups = []
+    expected = []
+    for c in range(2):
+        group = []
+        for i in range(3):
+            src = tmp_path / f"{c}_{i}.jpg"
+            expected.append(_baseline_jpeg(src, size=(200 + 10 * i, 300), mode="L" if i == 1 else "RGB"))
+            group.append(str(src))
+        groups.append(group)
+
+    output = tmp_path / "album.pdf"
+    main.JmComicPlugin._write_pdf(groups, output)
+    pdf = output.read_bytes()
+    assert _image_streams(pdf) == expected
+    assert re.search(rb"/Type\s*/Pages\s*/Kids\s*\[[^\]]*\]\s*/Count\s+6", pdf)
+
+
+def test_strip_over_budget_is_draft_decoded(tmp_path):
+    src = tmp_path / "00001.jpg"
+    _baseline_jpeg(src, size=(400, 4000))
+    max_pixels = 400 * 4000 // 3
+
+    assert main._decode_cost(str(src), 0, False, max_pixels) == 200 * 2000
+    pages = main._transcode_page(str(src), str(tmp_path / "out.jpg"), 85, 0, max_pixels=max_pixels)
+    from PIL import Image
+    with Image.open(pages[0]) as page:
+        assert page.width == 200
+
+
+def test_budget_rejects_image_larger_than_cap():
+    budget = main.DecodeBudget(1000)
+    with concurrent.futures.ThreadPoolExecutor(1) as pool:
+        rejected = budget.submit(pool, 2000, pow, 2, 3)
+        admitted = budget.submit(pool, 1000, pow, 2, 3)
+        assert isinstance(rejected.exception(), ValueError)
+        assert admitted.result() == 8
+
+
+def test_page_headers_read_off_the_event_loop(tmp_path, new_plugin, monkeypatch):
+    images = []
+    for i in range(3):
+        src = tmp_path / f"{i:05d}.jpg"
+        _baseline_jpeg(src, size=(200, 300))
+        images.append(src)
+    on_loop = []
+    decode_cost = main._decode_cost
+
+    def recording(*args, **kwargs):
+        on_loop.append(threading.current_thread() is threading.main_thread())
+        return decode_cost(*args, **kwargs)
+
+    monkeypatch.setattr(main, "_decode_cost", recording)
+    plugin = new_plugin()
+
+    async def scenario():
+        pipeline = plugin._new_pdf_pipeline(80, 0)
+        try:
+            return await plugin._transcode_pages(images, pipeline)
+        finally:
+            await plugin._run_sync(pipeline.close)
+            await plugin.terminate()
+
+    pages = asyncio.run(scenario())
+    assert pages is not None and len(pages) == 3
+    assert on_loop == [False] * 3
+
+
+def test_exif_rotated_jpeg_is_transcoded_upright(tmp_path):
+    from PIL import Image
+    src = tmp_path / "00001.jpg"
+    exif = Image.Exif()
+    exif[main.EXIF_ORIENTATION] = 6
+    Image.effect_noise((200, 300), 60).convert("RGB").save(src, "JPEG", quality=90, exif=exif)
+
+    pages = main._transcode_page(str(src), str(tmp_path / "out.jpg"), 85, 0, passthrough=True)
+    assert pages == [str(tmp_path / "out.jpg")]
+    with Image.open(pages[0]) as page:
+        assert page.size == (300, 200)
+        assert main._exif_orientation(page) == 1
+
+    output = tmp_path / "album.pdf"
+    main.JmComicPlugin._write_pdf([pages], output)
+    assert re.search(rb"/Width 300 /Height 200", output.read_bytes())
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import time
+
+import jmcomic
+
+import main
+from fakes import BenchEvent, FakeJmClient, SyntheticAlbum
+
+ALBUM_ID = "440000"
+
+
+def _client():
+    album = SyntheticAlbum(ALBUM_ID, chapters=2, images=4, formats=("jpg",), resolutions=((120, 180),))
+    return FakeJmClient({ALBUM_ID: album}, latency=0.05)
+
+
+def _prefetching(plugin):
+    """跳过排行榜与空闲判断，下一轮预取只处理 ALBUM_ID"""
+    plugin._prefetch_queue = [ALBUM_ID]
+    plugin._prefetch_pulled_at = time.monotonic()
+    plugin._prefetch_idle = lambda: True
+    return plugin
+
+
+async def _started(plugin):
+    while plugin._prefetch_job is None or not plugin._scheduler.running():
+        await asyncio.sleep(0.01)
+
+
+def _manifest(tmp_path):
+    return main.AlbumManifest(tmp_path / "manifests" / f"{ALBUM_ID}.json")
+
+
+def test_interrupted_prefetch_is_not_resumable(tmp_path, new_plugin, use_client):
+    use_client(_client())
+    plugin = _prefetching(new_plugin(image_threads=1))
+
+    async def scenario():
+        prefetch = asyncio.create_task(plugin._prefetch_round())
+        await _started(plugin)
+        await asyncio.sleep(0.1)
+        plugin._interrupt_prefetch()
+        await prefetch
+        # 取消传递到调度器中正在运行的构建任务
+        while plugin._scheduler.running():
+            await asyncio.sleep(0.01)
+        await plugin.terminate()
+
+    asyncio.run(scenario())
+    assert plugin._prefetch_queue == [ALBUM_ID]
+    assert not plugin._inflight
+    assert _manifest(tmp_path).pending_request is None
+    assert plugin._list_pending_downloads() == []
+
+
+def test_request_joins_running_prefetch(tmp_path, new_plugin, use_client, monkeypatch):
+    use_client(_client())
+    calls = []
+    download_album = jmcomic.download_album
+
+    def counting(*args, **kwargs):
+        calls.append(args[0])
+        return download_album(*args, **kwargs)
+
+    monkeypatch.setattr(jmcomic, "download_album", counting)
+    plugin = _prefetching(new_plugin())
+    event = BenchEvent()
+
+    async def scenario():
+        prefetch = asyncio.create_task(plugin._prefetch_round())
+        await _started(plugin)
+        await plugin._download_album_task(event, ALBUM_ID, pack=False, overrides={}, extra={})
+        await prefetch
+        await plugin.terminate()
+
+    asyncio.run(scenario())
+    assert calls == [ALBUM_ID]
+    assert len(event.files) == 1
+    assert plugin._prefetch_queue == []
+    assert _manifest(tmp_path).pending_request is None
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+
+import threading
+
+import main
+
+
+def test_count_from_many_threads():
+    cache = main.ResponseCache(16)
+
+    def worker():
+        for _ in range(5000):
+            cache.count("search", "hit")
+            cache.set("search:[1]", {"items": []}, 60)
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    stats = cache.stats_snapshot()
+    assert stats["search"]["hit"] == 8 * 5000
+    stats["search"]["hit"] = 0
+    assert cache.stats_snapshot()["search"]["hit"] == 8 * 5000
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import random
+import threading
+
+import pytest
+
+import main
+from fakes import BenchEvent, FakeJmClient, SyntheticAlbum
+
+ALBUM_ID = "420000"
+CHAPTERS, IMAGES = 3, 5
+
+
+class InterruptingClient(FakeJmClient):
+    """成功下载 budget 张图片后连接“中断”：之后的图片只写入一半就抛出异常。记录每张成功下载的图片"""
+
+    def __init__(self, albums, budget=None):
+        super().__init__(albums, retries=0)
+        self.budget = budget
+        self.fetched = []
+        self._started = 0
+        self._count_lock = threading.Lock()
+
+    def download_by_image_detail(self, image, img_save_path, decode_image=True):
+        key = (str(image.from_photo.photo_id), image.index)
+        with self._count_lock:
+            interrupted = self.budget is not None and self._started >= self.budget
+            self._started += 1
+        if interrupted:
+            with open(img_save_path, "wb") as f:
+                f.write(b"\xff\xd8partial")
+            raise ConnectionError("connection reset")
+        super().download_by_image_detail(image, img_save_path, decode_image)
+        with self._count_lock:
+            self.fetched.append(key)
+
+
+def _albums():
+    return {ALBUM_ID: SyntheticAlbum(ALBUM_ID, CHAPTERS, IMAGES, formats=("jpg",), resolutions=((120, 180),))}
+
+
+def _download(plugin, event):
+    async def scenario():
+        try:
+            await plugin._deliver_album(event, ALBUM_ID, False, {}, {}, plugin._send_artifact)
+        finally:
+            await plugin.terminate()
+
+    asyncio.run(scenario())
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_resume_fetches_only_missing_images(tmp_path, new_plugin, use_client, seed):
+    total = CHAPTERS * IMAGES
+    budget = random.Random(seed).randrange(1, total)
+    albums = _albums()
+
+    first = use_client(InterruptingClient(albums, budget))
+    with pytest.raises(main.JmTaskError):
+        _download(new_plugin(image_threads=2), BenchEvent())
+    assert len(first.fetched) == budget
+    assert not list(tmp_path.rglob(f"*{main.PART_MARKER}*"))
+    assert main.AlbumManifest(tmp_path / "manifests" / f"{ALBUM_ID}.json").pending_request is not None
+
+    # 重启后继续：新的插件实例，只从清单与磁盘恢复状态
+    second = use_client(InterruptingClient(albums))
+    event = BenchEvent()
+    _download(new_plugin(image_threads=2), event)
+
+    assert not set(first.fetched) & set(second.fetched)
+    assert len(first.fetched) + len(second.fetched) == total
+    assert len(event.files) == 1
+    manifest = main.AlbumManifest(tmp_path / "manifests" / f"{ALBUM_ID}.json")
+    assert manifest.pending_request is None
+    assert manifest.progress() == (CHAPTERS, total)
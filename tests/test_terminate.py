@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import logging
+
+from fakes import BenchEvent, FakeJmClient, SyntheticAlbum
+
+ALBUM_ID = "460000"
+
+
+def _client():
+    album = SyntheticAlbum(ALBUM_ID, chapters=2, images=3, formats=("jpg",), resolutions=((120, 180),))
+    return FakeJmClient({ALBUM_ID: album})
+
+
+def test_terminate_waits_for_cleanup(new_plugin, use_client, caplog):
+    use_client(_client())
+    plugin = new_plugin(cleanup_mode="after_send")
+    event = BenchEvent()
+
+    async def scenario():
+        await plugin._download_album_task(event, ALBUM_ID, pack=False, overrides={}, extra={})
+        # 发送完毕后 after_send 清理在后台进行，立即卸载
+        tasks = set(plugin._tasks)
+        await plugin.terminate()
+        return tasks
+
+    with caplog.at_level(logging.ERROR):
+        tasks = asyncio.run(scenario())
+    assert len(event.files) == 1
+    assert tasks and all(task.done() for task in tasks)
+    assert not plugin._tasks
+    assert not [r for r in caplog.records if r.levelno >= logging.ERROR]
+    # 卸载后不再启动新的清理
+    plugin._schedule_cleanup(None, [])
+    assert not plugin._tasks
+
+
+def test_terminate_waits_for_download_waiters(new_plugin, use_client, caplog):
+    client = use_client(_client())
+    client.latency = 0.05
+    plugin = new_plugin(image_threads=1)
+    released = []
+    release = plugin._catalog.release
+
+    def recording(lease):
+        released.append(lease)
+        return release(lease)
+
+    plugin._catalog.release = recording
+
+    async def scenario():
+        # 与 /jm 命令相同，下载在不等待结果的任务中进行
+        waiter = plugin._spawn(
+            plugin._download_album_task(BenchEvent(), ALBUM_ID, pack=False, overrides={}, extra={})
+        )
+        while not plugin._scheduler.running():
+            await asyncio.sleep(0.01)
+        await plugin.terminate()
+        return waiter
+
+    with caplog.at_level(logging.ERROR):
+        waiter = asyncio.run(scenario())
+    assert waiter.done()
+    assert not plugin._tasks
+    assert not plugin._inflight
+    # 等待者与构建任务各持有一个租约，都在关闭索引前归还
+    assert len(released) == 2
+    assert not [r for r in caplog.records if r.levelno >= logging.ERROR]
+
+
+def test_terminate_cancels_running_download(new_plugin, use_client, caplog):
+    client = use_client(_client())
+    client.latency = 0.05
+    plugin = new_plugin(image_threads=1)
+
+    async def scenario():
+        download = asyncio.create_task(
+            plugin._download_album_task(BenchEvent(), ALBUM_ID, pack=False, overrides={}, extra={})
+        )
+        while not plugin._scheduler.running():
+            await asyncio.sleep(0.01)
+        await plugin.terminate()
+        await asyncio.wait({download}, timeout=5)
+        return download
+
+    with caplog.at_level(logging.ERROR):
+        download = asyncio.run(scenario())
+    assert download.done()
+    assert not plugin._inflight
+    assert not [r for r in caplog.records if "after shutdown" in r.getMessage()]
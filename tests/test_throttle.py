@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import pytest
+
+import main
+from fakes import FakeJmClient, SyntheticAlbum
+from throttle import ThrottledImageServer
+
+ALBUM_ID = "430000"
+
+
+@pytest.fixture
+def image_server():
+    """本地限流图片服务器的工厂：server(max_conn=..., latency=...)，测试结束后关闭"""
+    servers = []
+
+    def start(chapters=1, images=40, max_conn=1000, latency=0.0):
+        album = SyntheticAlbum(ALBUM_ID, chapters, images, formats=("jpg",), resolutions=((200, 300),))
+        client = FakeJmClient({ALBUM_ID: album})
+        client.prerender()
+        server = ThrottledImageServer(client, conn_rate=1 << 30, server_rate=1 << 30, max_conn=max_conn,
+                                      latency=latency)
+        servers.append(server)
+        urls = [f"http://{server.domain}/{ALBUM_ID}/{album.photo_id(c)}/{name}"
+                for c in range(chapters) for name in album.page_names(c)]
+        return server, urls
+
+    yield start
+    for server in servers:
+        server.close()
+
+
+def _fetch_all(throttle: main.DownloadThrottle, urls, threads: int, limits=None):
+    """threads 个线程在 throttle 的控制下取完 urls；429 的图片放回队列重试"""
+    queue = list(urls)
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            with lock:
+                if not queue:
+                    return
+                url = queue.pop()
+            with throttle.slot():
+                if limits is not None:
+                    limits.append(throttle.limit)
+                try:
+                    with urllib.request.urlopen(url, timeout=10) as resp:
+                        data = resp.read()
+                except urllib.error.HTTPError as e:
+                    throttle.on_error(e)
+                    with lock:
+                        queue.append(url)
+                    continue
+                throttle.on_success(len(data))
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+
+
+def test_backs_off_when_server_rejects(image_server, monkeypatch):
+    monkeypatch.setattr(main, "THROTTLE_COOLDOWN", 0.1)
+    server, urls = image_server(images=60, max_conn=3, latency=0.05)
+    throttle = main.DownloadThrottle(16, window=0.2)
+    throttle.start_at(16)
+    limits = []
+
+    _fetch_all(throttle, urls, threads=16, limits=limits)
+
+    assert server.rejected > 0
+    assert throttle.throttled > 0
+    assert throttle.limit <= 4
+    # 退让后窗口不再回到起始的 16
+    assert max(limits[len(limits) // 2:]) < 16
+
+
+def test_grows_when_throughput_improves(image_server):
+    server, urls = image_server(images=80, latency=0.05)
+    throttle = main.DownloadThrottle(8, window=0.2)
+    throttle.start_at(1)
+
+    _fetch_all(throttle, urls, threads=8)
+
+    assert server.rejected == 0
+    assert throttle.limit > 1
+
+
+def test_bandwidth_cap(image_server):
+    server, urls = image_server(images=20)
+    rate = 128 * 1024
+    throttle = main.DownloadThrottle(8, max_bytes_per_s=rate)
+
+    start = time.monotonic()
+    _fetch_all(throttle, urls, threads=8)
+    elapsed = time.monotonic() - start
+
+    # 令牌桶开始时有一秒的额度，之后平均速度不超过上限
+    assert server.bytes > 3 * rate
+    assert elapsed >= (server.bytes - rate) / rate * 0.9
+
+
+class _FailingImageClient:
+    """按 jmcomic 客户端的接口通过 DomainHealth 请求图片，每次请求都失败"""
+
+    retry_times = 2
+
+    def __init__(self, health: main.DomainHealth):
+        self.health = health
+        self.attempts = 0
+
+    def update_request_with_specify_domain(self, kwargs, domain, is_image):
+        pass
+
+    def raise_if_resp_should_retry(self, resp, is_image):
+        return resp
+
+    def before_retry(self, e, kwargs, retry, url):
+        pass
+
+    def fallback(self, request, url, *args, **kwargs):
+        raise RuntimeError(f"all retries failed: {url}")
+
+    def _get(self, url, **kwargs):
+        self.attempts += 1
+        raise ConnectionError("connection reset")
+
+    def download_by_image_detail(self, image, img_save_path, **kwargs):
+        self.health.request(self, self._get, url="http://img.local/00001.jpg", is_image=True)
+
+
+def test_image_failure_reported_once_per_attempt(tmp_path):
+    throttle = main.DownloadThrottle(8)
+    inner = _FailingImageClient(main.DomainHealth(on_image_error=throttle.on_error))
+    client = main.AtomicImageClient(inner, throttle)
+
+    with pytest.raises(RuntimeError):
+        client.download_by_image_detail(None, str(tmp_path / "00001.jpg"))
+
+    assert inner.attempts == inner.retry_times + 1
+    assert throttle.errors == inner.attempts